@@ -1,5 +1,19 @@
 from account.login import login_form
 from account.register import register_form
 from account.reset_password import reset_password_form
+from account.session import (
+    end_login_session,
+    resume_login_session_from_cookie,
+    start_login_session,
+    write_pending_session_cookie,
+)
 
-__all__ = ["login_form", "register_form", "reset_password_form"]
+__all__ = [
+    "login_form",
+    "register_form",
+    "reset_password_form",
+    "end_login_session",
+    "resume_login_session_from_cookie",
+    "start_login_session",
+    "write_pending_session_cookie",
+]
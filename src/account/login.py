@@ -3,11 +3,13 @@ import logging
 import streamlit as st
 from streamlit.runtime.secrets import Secrets
 
+from account.session import start_login_session
 from configuration import settings
 from utils.firebase import (
     authenticate_user_with_google_using_streamlit_oauth,
     authenticate_user_with_password,
     get_user_by_token,
+    sign_in_with_custom_token,
 )
 from utils.utils import display_message
 
@@ -41,6 +43,7 @@ def login_form():
             logger.info("*" * 100)
 
             if user_info := get_user_by_token(user_obj["idToken"]):
+                start_login_session(user_obj, sso=False)
                 st.session_state["logged_in"] = True
                 st.session_state["sso"] = False
                 st.session_state["uid"] = user_info.uid
@@ -77,6 +80,10 @@ def login_form():
     )
 
     if firebase_user:
+        # Get Firebase tokens for the Google user to persist the login session
+        if auth_response := sign_in_with_custom_token(firebase_user.uid):
+            start_login_session(auth_response, sso=True)
+
         st.session_state["logged_in"] = True
         st.session_state["sso"] = True
         st.session_state["uid"] = firebase_user.uid
@@ -1,6 +1,7 @@
 import streamlit as st
 
-from utils.firebase import create_new_user
+from account.session import start_login_session
+from utils.firebase import create_new_user, sign_in_with_custom_token
 from utils.utils import display_message
 
 
@@ -21,6 +22,9 @@ def register_form():
         if password == confirm_password:
             try:
                 user_info = create_new_user(email, password, name)
+                if auth_response := sign_in_with_custom_token(user_info.uid):
+                    start_login_session(auth_response, sso=False)
+
                 st.session_state["logged_in"] = True
                 st.session_state["sso"] = False
                 st.session_state["uid"] = user_info.uid
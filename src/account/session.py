@@ -0,0 +1,94 @@
+import json
+from typing import Dict, Optional, Union
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+from configuration import settings
+from utils.session_store import (
+    create_login_session,
+    resume_login_session,
+    revoke_login_session,
+)
+
+
+def start_login_session(auth_response: Dict[str, Union[str, bool]], sso: bool):
+    """
+    Create a login session for the logged-in user so that the login survives
+    page reloads. The session cookie is written on the next run since the login
+    forms rerun the script right after logging in.
+
+    Args:
+        auth_response (Dict[str, Union[str, bool]]):
+            The response of the Firebase Authentication REST API sign-in
+        sso (bool):
+            Whether the user logged in with a service provider
+    """
+    if session_token := create_login_session(auth_response, sso=sso):
+        st.session_state["session_token"] = session_token
+        st.session_state["pending_session_cookie"] = session_token
+
+
+def resume_login_session_from_cookie():
+    """
+    Log the user back in from the session cookie after a page reload. This is
+    only attempted once per browser session.
+    """
+    if st.session_state.get("session_resume_attempted"):
+        return
+    st.session_state["session_resume_attempted"] = True
+
+    session_token = st.context.cookies.get(settings.SESSION_COOKIE_NAME)
+    if not session_token:
+        return
+
+    if resumed := resume_login_session(session_token):
+        user, sso = resumed
+        st.session_state["logged_in"] = True
+        st.session_state["sso"] = sso
+        st.session_state["uid"] = user.uid
+        st.session_state["name"] = user.display_name
+        st.session_state["email"] = user.email
+        st.session_state["session_token"] = session_token
+
+
+def end_login_session(session_token: Optional[str]):
+    """
+    Revoke the login session and clear the session cookie on the next run.
+    Call this after the session state has been cleared.
+
+    Args:
+        session_token (Optional[str]): The session token of the logged-in user
+    """
+    if session_token:
+        revoke_login_session(session_token)
+
+    st.session_state["pending_session_cookie"] = ""
+    # The cookie read at connection time is still the revoked one
+    st.session_state["session_resume_attempted"] = True
+
+
+def write_pending_session_cookie():
+    """
+    Write (or clear, if empty) the session cookie requested by the previous run.
+    Streamlit cannot set cookies, so the cookie is set by a script in a
+    same-origin component iframe.
+
+    A cookie set by a script cannot be HttpOnly, so a script injected in the
+    page (XSS) could read the session token. This is mitigated by the short
+    `settings.SESSION_MAX_AGE_SECONDS`, the `SameSite=Strict` attribute, and
+    the revocation of the session on logout.
+    """
+    session_token = st.session_state.pop("pending_session_cookie", None)
+    if session_token is None:
+        return
+
+    max_age = settings.SESSION_MAX_AGE_SECONDS if session_token else 0
+    cookie = (
+        f"{settings.SESSION_COOKIE_NAME}={session_token}; Max-Age={max_age}; "
+        f"Path=/; SameSite=Strict{'; Secure' if settings.SESSION_COOKIE_SECURE else ''}"
+    )
+    components.html(
+        f"<script>window.parent.document.cookie = {json.dumps(cookie)};</script>",
+        height=0,
+    )
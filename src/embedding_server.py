@@ -0,0 +1,231 @@
+"""
+Embedding server hosting a single copy of the embedding model for all app
+processes of a node. Set `EMBEDDING_SERVER_URL` in the app to use it. The model
+is configured by the same settings as the app (`EMBEDDING_MODEL_NAME`, ...).
+
+Run from the root of the repository:
+
+    python src/embedding_server.py --port 8765
+    python src/embedding_server.py --socket /tmp/embedding.sock
+"""
+
+import argparse
+import json
+import logging
+import os
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from configuration import settings
+from utils.embedding import (
+    MicroBatchingEmbeddings,
+    create_embedding_model,
+    embed_queries,
+)
+from utils.encode_pool import EncodePool
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serve the embedding model:
+
+    - `POST /embed_documents` with `{"texts": [...]}` returns
+      `{"embeddings": [[...], ...]}`
+    - `POST /embed_query` with `{"text": "..."}` returns `{"embedding": [...]}`
+    - `GET /health` returns the model name, dimension and normalization of the
+      embeddings
+
+    Large batches of documents are embedded by the encode pool, if any.
+    """
+
+    # Keep the connections of the app processes alive
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send_json(404, {"error": f"Not found: {self.path}"})
+            return
+
+        self._send_json(
+            200,
+            {
+                "status": "ok",
+                "model_name": settings.EMBEDDING_MODEL_NAME,
+                "dimension": self.server.dimension,
+                "normalize": settings.EMBEDDING_NORMALIZE,
+            },
+        )
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length))
+        except ValueError as e:
+            self._send_json(400, {"error": f"Invalid request body: {e}"})
+            return
+
+        try:
+            if self.path == "/embed_documents":
+                texts = payload["texts"]
+                encode_pool = self.server.encode_pool
+                if encode_pool is not None and len(texts) > encode_pool.shard_size:
+                    # Bulk ingestion is spread over the processes of the pool
+                    embeddings = encode_pool.embed_documents(texts)
+                else:
+                    with self.server.model_lock:
+                        embeddings = self.server.embedding.embed_documents(texts)
+                self._send_json(200, {"embeddings": embeddings})
+            elif self.path == "/embed_query":
+                text = payload["text"]
+                embedding = self.server.query_batcher.embed_query(text)
+                self._send_json(200, {"embedding": embedding})
+            else:
+                self._send_json(404, {"error": f"Not found: {self.path}"})
+        except KeyError as e:
+            self._send_json(400, {"error": f"Missing field: {e}"})
+        except Exception as e:
+            logger.exception(f"Error embedding on {self.path}")
+            self._send_json(500, {"error": str(e)})
+
+    def address_string(self) -> str:
+        # The client address is empty on a Unix domain socket
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format: str, *args):
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+    def _send_json(self, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _EmbeddingServerMixin:
+    """Hold the embedding model shared by the request handler threads"""
+
+    daemon_threads = True
+
+    def setup_embedding(
+        self,
+        embedding: Embeddings,
+        max_batch_size: int,
+        max_wait_seconds: float,
+        encode_pool: Optional[EncodePool] = None,
+    ):
+        self.embedding = embedding
+        self.encode_pool = encode_pool
+        # One forward pass at a time, since concurrent passes only compete for
+        # the same cores
+        self.model_lock = threading.Lock()
+        self.dimension = len(embedding.embed_query("warm up"))
+
+        def embed_batch(texts: List[str]) -> List[List[float]]:
+            with self.model_lock:
+                return embed_queries(embedding, texts)
+
+        # Concurrent queries of all app processes are embedded together
+        self.query_batcher = MicroBatchingEmbeddings(
+            embedding,
+            max_batch_size=max_batch_size,
+            max_wait_seconds=max_wait_seconds,
+            embed_batch=embed_batch,
+        )
+
+
+class TCPEmbeddingServer(_EmbeddingServerMixin, ThreadingHTTPServer):
+    pass
+
+
+class UnixEmbeddingServer(
+    _EmbeddingServerMixin, socketserver.ThreadingMixIn, socketserver.UnixStreamServer
+):
+    pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the embedding model")
+    parser.add_argument("--host", default="127.0.0.1", help="Host to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    parser.add_argument(
+        "--socket", help="Unix domain socket to listen on instead of a TCP port"
+    )
+    parser.add_argument(
+        "--batch-max-size",
+        type=int,
+        default=32,
+        help="Maximum number of queries embedded per forward pass",
+    )
+    parser.add_argument(
+        "--batch-max-wait-ms",
+        type=float,
+        default=5.0,
+        help="Maximum time a query waits for more queries to batch with",
+    )
+    parser.add_argument(
+        "--encode-workers",
+        type=int,
+        default=0,
+        help="Number of processes embedding large batches of documents",
+    )
+    parser.add_argument(
+        "--encode-threads-per-worker",
+        type=int,
+        default=2,
+        help="Number of threads (and cores) per encode process",
+    )
+    args = parser.parse_args()
+
+    logger.info("*" * 100)
+    logger.info("Loading the embedding model")
+    start = time.perf_counter()
+
+    embedding = create_embedding_model()
+
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+        server = UnixEmbeddingServer(args.socket, EmbeddingRequestHandler)
+        address = f"unix://{args.socket}"
+    else:
+        server = TCPEmbeddingServer((args.host, args.port), EmbeddingRequestHandler)
+        address = f"http://{args.host}:{args.port}"
+
+    server.setup_embedding(
+        embedding,
+        max_batch_size=args.batch_max_size,
+        max_wait_seconds=args.batch_max_wait_ms / 1000,
+        encode_pool=(
+            EncodePool(
+                num_workers=args.encode_workers,
+                threads_per_worker=args.encode_threads_per_worker,
+            )
+            if args.encode_workers > 0
+            else None
+        ),
+    )
+
+    logger.info(f"Embedding model loaded in {time.perf_counter() - start:.1f} seconds")
+    logger.info(f"Serving embeddings on {address}")
+    logger.info("*" * 100)
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,18 @@
-import json
-import os
-
 import streamlit as st
 
-from account import login_form, register_form, reset_password_form
-from utils.firebase import initialize_firebase_app, update_user_info_by_email
-from utils.utils import delete_account, display_message
+from account import (
+    end_login_session,
+    login_form,
+    register_form,
+    reset_password_form,
+    resume_login_session_from_cookie,
+    write_pending_session_cookie,
+)
+from configuration import settings
+from utils.bootstrap import bootstrap
+from utils.firebase import update_user_info_by_email
+from utils.profiling import profile_run
+from utils.utils import account_deletion_status, delete_account, display_message
 
 
 def initialize_session_state():
@@ -24,13 +31,6 @@ def initialize_session_state():
         if key not in st.session_state:
             st.session_state[key] = val
 
-    # Create the Firebase service account file for the environment variable
-    # `GOOGLE_APPLICATION_CREDENTIALS` to point to - for the Google Gemini API
-    with open("firebase-service-account.json", "w") as f:
-        f.write(json.dumps(st.secrets["FIREBASE_SERVICE_ACCOUNT"].to_dict()))
-
-    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "firebase-service-account.json"
-
 
 def authentication():
     """
@@ -40,6 +40,10 @@ def authentication():
 
     st.title("Welcome to the Knowledge-based Chatbot! 🤖👋")
 
+    # Show the progress of the deletion of the account the user just deleted
+    if "deleted_account_uid" in st.session_state:
+        account_deletion_status(st.session_state["deleted_account_uid"])
+
     st.markdown(
         """
         This is a knowledge-based chatbot where you can upload your own documents
@@ -73,9 +77,12 @@ def logout():
         button = st.form_submit_button("Log Out", use_container_width=True)
 
     if button:
+        session_token = st.session_state.get("session_token")
         # Remove the cache since the user has logged out
         for key in st.session_state.keys():
             st.session_state.pop(key, None)
+        # Revoke the login session so that a page reload does not log back in
+        end_login_session(session_token)
         st.rerun()
 
 
@@ -137,6 +144,19 @@ def account_settings():
         delete_account(st.session_state["uid"])
 
 
+def profiling_requested() -> bool:
+    """
+    Returns:
+        bool: Whether an admin requested a profile of this run with the query
+            parameter `?profile=1`
+    """
+    return (
+        st.query_params.get("profile") == "1"
+        and st.session_state["logged_in"]
+        and st.session_state["email"] in settings.PROFILE_ADMIN_EMAILS
+    )
+
+
 def main():
     """
     Main function to set logic and display the pages
@@ -147,10 +167,15 @@ def main():
         page_icon="🤖",
     )
 
+    # Write the credentials and initialize Firebase once per process
+    bootstrap(st.secrets["FIREBASE_SERVICE_ACCOUNT"].to_dict())
+
     initialize_session_state()
 
-    # Initialize Firebase app
-    initialize_firebase_app(st.secrets["FIREBASE_SERVICE_ACCOUNT"].to_dict())
+    # Log the user back in after a page reload and persist new login sessions
+    if not st.session_state["logged_in"]:
+        resume_login_session_from_cookie()
+    write_pending_session_cookie()
 
     authentication_page = st.Page(page=authentication, title="Authentication")
 
@@ -172,7 +197,8 @@ def main():
     else:
         pg = st.navigation([authentication_page])
 
-    pg.run()
+    with profile_run(f"page-{pg.title}", requested=profiling_requested()):
+        pg.run()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,516 @@
+"""
+Load test the RAG chain of the chat page with simulated users replaying
+multi-turn conversations concurrently, to measure how many chat sessions a
+process sustains. The LLMs are fake streaming models with a configurable token
+rate, and the retriever is a fake one embedding the queries with a fake (or the
+configured) embedding model, so that no external service is called.
+
+Run from the `src/` directory:
+
+    python -m scripts.load_test --users 50 --conversations-per-user 2
+    python -m scripts.load_test --users 50 --output baseline.json
+    python -m scripts.load_test --users 50 --baseline baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import resource
+import sys
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+from configuration import settings
+from utils.llm import RateLimitedChatModel
+from utils.rag import setup_rag_chain
+from utils.rate_limit import AdmissionController
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+# Conversation replayed by each user when no conversations file is given: the
+# follow-up questions go through the rewrite LLM, the others skip it
+DEFAULT_CONVERSATION = [
+    "What is the refund policy for annual subscriptions?",
+    "And how long does it take?",
+    "Which documents describe the onboarding process for new employees?",
+    "Can you summarize them?",
+    "What are the security requirements for laptops?",
+]
+
+# Words the fake LLMs draw their answers from
+WORDS = "the a policy document answer process team data time report".split()
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    """Chat model streaming random words at a fixed rate after a fixed delay"""
+
+    # Seconds before the first token
+    first_token_latency_seconds: float = 0.3
+    # Tokens streamed per second after the first one
+    tokens_per_second: float = 50.0
+    # Number of tokens of each answer
+    answer_tokens: int = 60
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming"
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        time.sleep(self._duration_seconds())
+        message = AIMessage(content=self._answer())
+
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        await asyncio.sleep(self._duration_seconds())
+        message = AIMessage(content=self._answer())
+
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_latency_seconds)
+        for i, token in enumerate(self._answer().split(" ")):
+            if i > 0:
+                time.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token + " "))
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.first_token_latency_seconds)
+        for i, token in enumerate(self._answer().split(" ")):
+            if i > 0:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token + " "))
+
+    def _duration_seconds(self) -> float:
+        return (
+            self.first_token_latency_seconds
+            + (self.answer_tokens - 1) / self.tokens_per_second
+        )
+
+    def _answer(self) -> str:
+        return " ".join(random.choices(WORDS, k=self.answer_tokens))
+
+
+class FakeRetriever(BaseRetriever):
+    """Retriever embedding the query and returning synthetic documents after a
+    fixed vector search latency"""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    # The embedding model of the queries
+    embedding: Embeddings
+    # Seconds the vector search takes
+    search_latency_seconds: float = 0.05
+    # Number of documents returned
+    k: int = 4
+    # Number of characters of each document
+    document_chars: int = 800
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        self.embedding.embed_query(query)
+        time.sleep(self.search_latency_seconds)
+
+        return [
+            Document(
+                page_content=" ".join(
+                    random.choices(WORDS, k=self.document_chars // 6)
+                ),
+                metadata={"source": f"documents/{i}.pdf", "page": i},
+            )
+            for i in range(self.k)
+        ]
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """
+    Compute a percentile with the nearest-rank method
+
+    Args:
+        values (List[float]): The values
+        percent (float): The percentile, between 0 and 100
+
+    Returns:
+        float: The percentile, or NaN if there is no value
+    """
+    if not values:
+        return math.nan
+
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+
+    return ordered[rank - 1]
+
+
+def current_rss_bytes() -> int:
+    """
+    Returns:
+        int: The resident set size of the process, or 0 if unknown
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+async def simulate_user(
+    chain,
+    conversations: List[List[str]],
+    think_time_seconds: float,
+    turns: List[Dict[str, Any]],
+):
+    """
+    Replay conversations turn by turn as a user of the chat page would,
+    recording the time to first token and the duration of each turn
+
+    Args:
+        chain (Runnable): The RAG chain picking the answer
+        conversations (List[List[str]]): The questions of each conversation
+        think_time_seconds (float): Mean time between two turns of a user
+        turns (List[Dict[str, Any]]): The list the turns are recorded in
+    """
+    for questions in conversations:
+        history = []
+        for question in questions:
+            start = time.perf_counter()
+            first_token_seconds = None
+            answer = []
+            error = None
+
+            try:
+                async for chunk in chain.astream(
+                    {"input": question, "chat_history": history}
+                ):
+                    if first_token_seconds is None:
+                        first_token_seconds = time.perf_counter() - start
+                    answer.append(chunk)
+            except Exception as e:
+                error = type(e).__name__
+
+            turns.append(
+                {
+                    "time_to_first_token_seconds": first_token_seconds,
+                    "duration_seconds": time.perf_counter() - start,
+                    "chunks": len(answer),
+                    "error": error,
+                }
+            )
+            history.extend([("human", question), ("ai", "".join(answer))])
+
+            # Users read the answer before asking the next question
+            await asyncio.sleep(random.expovariate(1 / think_time_seconds))
+
+
+async def run_load_test(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Run the simulated users concurrently on one event loop, as the chat page
+    runs the turns of all sessions on the shared event loop
+
+    Args:
+        args (argparse.Namespace): The command line arguments
+
+    Returns:
+        Dict[str, Any]: The report of the load test
+    """
+    if args.real_embedding:
+        from utils.rag import setup_embedding
+
+        embedding = setup_embedding()
+        embedding.embed_query("warm up")
+    else:
+        embedding = DeterministicFakeEmbedding(size=args.embedding_dimension)
+
+    admission_controller = AdmissionController(
+        name="load-test",
+        max_concurrency=settings.LLM_MAX_CONCURRENCY,
+        max_queue=settings.LLM_MAX_QUEUE,
+        timeout_seconds=settings.LLM_TIMEOUT_SECONDS,
+        requests_per_minute=settings.LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute=settings.LLM_TOKENS_PER_MINUTE,
+    )
+    llm = RateLimitedChatModel(
+        model=FakeStreamingChatModel(
+            first_token_latency_seconds=args.first_token_latency,
+            tokens_per_second=args.tokens_per_second,
+            answer_tokens=args.answer_tokens,
+        ),
+        admission_controller=admission_controller,
+        tier="answer",
+    )
+    rewrite_llm = RateLimitedChatModel(
+        model=FakeStreamingChatModel(
+            first_token_latency_seconds=args.first_token_latency / 2,
+            tokens_per_second=args.tokens_per_second * 2,
+            answer_tokens=15,
+        ),
+        admission_controller=admission_controller,
+        tier="rewrite",
+    )
+    retriever = FakeRetriever(
+        embedding=embedding, search_latency_seconds=args.search_latency
+    )
+    chain = setup_rag_chain(llm, retriever, rewrite_llm).pick("answer")
+
+    if args.conversations:
+        with open(args.conversations) as f:
+            conversations = json.load(f)
+    else:
+        conversations = [DEFAULT_CONVERSATION]
+    conversations = conversations * args.conversations_per_user
+
+    turns: List[Dict[str, Any]] = []
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    peak_rss = current_rss_bytes()
+
+    async def sample_rss():
+        nonlocal peak_rss
+        while True:
+            peak_rss = max(peak_rss, current_rss_bytes())
+            await asyncio.sleep(0.5)
+
+    sampler = asyncio.create_task(sample_rss())
+    users = []
+    for _ in range(args.users):
+        users.append(
+            asyncio.create_task(
+                simulate_user(chain, conversations, args.think_time, turns)
+            )
+        )
+        # Ramp up the users instead of starting them all at once
+        await asyncio.sleep(args.ramp_up / max(1, args.users))
+    await asyncio.gather(*users)
+    sampler.cancel()
+
+    wall_seconds = time.perf_counter() - wall_start
+    cpu_seconds = time.process_time() - cpu_start
+
+    succeeded = [turn for turn in turns if turn["error"] is None]
+    first_token_seconds = [
+        turn["time_to_first_token_seconds"]
+        for turn in succeeded
+        if turn["time_to_first_token_seconds"] is not None
+    ]
+    durations = [turn["duration_seconds"] for turn in succeeded]
+    errors: Dict[str, int] = {}
+    for turn in turns:
+        if turn["error"] is not None:
+            errors[turn["error"]] = errors.get(turn["error"], 0) + 1
+
+    return {
+        "users": args.users,
+        "turns": len(turns),
+        "errors": errors,
+        "wall_seconds": wall_seconds,
+        "turns_per_second": len(succeeded) / wall_seconds,
+        "chunks_per_second": sum(turn["chunks"] for turn in succeeded) / wall_seconds,
+        "time_to_first_token_seconds": {
+            f"p{p}": percentile(first_token_seconds, p) for p in (50, 95, 99)
+        },
+        "turn_duration_seconds": {
+            f"p{p}": percentile(durations, p) for p in (50, 95, 99)
+        },
+        "cpu_seconds": cpu_seconds,
+        "cpu_cores_used": cpu_seconds / wall_seconds,
+        "peak_rss_mb": max(
+            peak_rss, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        )
+        / 2**20,
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    """
+    Print the report of a load test
+
+    Args:
+        report (Dict[str, Any]): The report
+    """
+    print("*" * 100)
+    print(f"Users: {report['users']}, turns: {report['turns']}")
+    print(f"Errors: {report['errors'] or 'none'}")
+    print(
+        f"Throughput: {report['turns_per_second']:.2f} turns/s, "
+        f"{report['chunks_per_second']:.1f} chunks/s"
+    )
+    for name in ("time_to_first_token_seconds", "turn_duration_seconds"):
+        print(
+            f"{name}: "
+            + ", ".join(
+                f"{p}={value * 1000:.0f}ms" for p, value in report[name].items()
+            )
+        )
+    print(
+        f"CPU: {report['cpu_seconds']:.1f}s ({report['cpu_cores_used']:.2f} cores), "
+        f"peak RSS: {report['peak_rss_mb']:.0f} MB"
+    )
+    print("*" * 100)
+
+
+def compare_to_baseline(
+    report: Dict[str, Any], baseline: Dict[str, Any], max_regression: float
+) -> bool:
+    """
+    Compare the latency percentiles and the throughput to a baseline
+
+    Args:
+        report (Dict[str, Any]): The report of the load test
+        baseline (Dict[str, Any]): The report of the baseline
+        max_regression (float): The tolerated relative regression
+
+    Returns:
+        bool: Whether nothing regressed beyond `max_regression`
+    """
+    passed = True
+    comparisons = [
+        (f"{name} {p}", report[name][p], baseline[name][p], True)
+        for name in ("time_to_first_token_seconds", "turn_duration_seconds")
+        for p in report[name]
+    ]
+    comparisons.append(
+        (
+            "turns_per_second",
+            report["turns_per_second"],
+            baseline["turns_per_second"],
+            False,
+        )
+    )
+
+    for name, value, baseline_value, lower_is_better in comparisons:
+        if not baseline_value:
+            continue
+
+        change = (value - baseline_value) / baseline_value
+        regressed = (
+            change > max_regression if lower_is_better else -change > max_regression
+        )
+        passed = passed and not regressed
+        print(
+            f"{name}: {baseline_value:.3f} -> {value:.3f} ({change:+.1%})"
+            + (" REGRESSION" if regressed else "")
+        )
+
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=20, help="Simulated users")
+    parser.add_argument(
+        "--conversations-per-user",
+        type=int,
+        default=1,
+        help="Times each user replays the conversations",
+    )
+    parser.add_argument(
+        "--conversations",
+        help="JSON file with a list of conversations, each a list of questions",
+    )
+    parser.add_argument(
+        "--think-time", type=float, default=1.0, help="Mean seconds between turns"
+    )
+    parser.add_argument(
+        "--ramp-up", type=float, default=5.0, help="Seconds to start all users"
+    )
+    parser.add_argument(
+        "--first-token-latency",
+        type=float,
+        default=0.3,
+        help="Seconds before the first token of the fake answer LLM",
+    )
+    parser.add_argument(
+        "--tokens-per-second",
+        type=float,
+        default=50.0,
+        help="Token rate of the fake answer LLM",
+    )
+    parser.add_argument(
+        "--answer-tokens", type=int, default=60, help="Tokens per fake answer"
+    )
+    parser.add_argument(
+        "--search-latency",
+        type=float,
+        default=0.05,
+        help="Seconds the fake vector search takes",
+    )
+    parser.add_argument(
+        "--real-embedding",
+        action="store_true",
+        help="Embed the queries with the configured embedding model",
+    )
+    parser.add_argument(
+        "--embedding-dimension",
+        type=int,
+        default=1024,
+        help="Dimension of the fake embeddings",
+    )
+    parser.add_argument("--output", help="JSON file to write the report to")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=0.2,
+        help="Relative regression against the baseline that fails the run",
+    )
+    args = parser.parse_args()
+
+    report = asyncio.run(run_load_test(args))
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if not compare_to_baseline(report, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
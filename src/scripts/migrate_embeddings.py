@@ -0,0 +1,59 @@
+"""
+Embed the namespaces of a Pinecone index again with the embedding model
+configured by the settings (`EMBEDDING_MODEL_NAME`, `EMBEDDING_DIMENSION`, and
+`EMBEDDING_NORMALIZE`) into a new index. Once migrated, set
+`VECTOR_DB_INDEX_NAME` to the new index.
+
+Run from the `src/` directory:
+
+    python -m scripts.migrate_embeddings --target-index new-index --all
+    python -m scripts.migrate_embeddings --target-index new-index --namespace UID
+"""
+
+import argparse
+import logging
+
+from configuration import settings
+from utils.rag import migrate_namespace_embeddings, setup_pinecone_index
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--target-index", required=True, help="Pinecone index to migrate to"
+    )
+    parser.add_argument(
+        "--source-index",
+        default=settings.VECTOR_DB_INDEX_NAME,
+        help="Pinecone index to migrate from. Defaults to VECTOR_DB_INDEX_NAME.",
+    )
+    namespaces_group = parser.add_mutually_exclusive_group(required=True)
+    namespaces_group.add_argument(
+        "--namespace", action="append", help="Namespace to migrate (repeatable)"
+    )
+    namespaces_group.add_argument(
+        "--all", action="store_true", help="Migrate all namespaces"
+    )
+    args = parser.parse_args()
+
+    namespaces = args.namespace
+    if args.all:
+        stats = setup_pinecone_index(args.source_index).describe_index_stats()
+        namespaces = sorted(stats.namespaces)
+
+    for namespace in namespaces:
+        num_migrated = migrate_namespace_embeddings(
+            namespace,
+            target_index_name=args.target_index,
+            source_index_name=args.source_index,
+        )
+        logger.info("*" * 100)
+        logger.info(f"Migrated {num_migrated} vectors of namespace {namespace}")
+        logger.info("*" * 100)
+
+
+if __name__ == "__main__":
+    main()
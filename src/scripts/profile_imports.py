@@ -0,0 +1,103 @@
+"""
+Report the import time of the modules loaded when the app starts, to check that
+heavy dependencies are not imported before they are used.
+
+Run from the `src/` directory:
+
+    python -m scripts.profile_imports [module ...] [--top 20]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+SRC_ROOT = Path(__file__).parent.parent
+
+# Modules imported by the login page
+DEFAULT_MODULES = ["account", "utils.bootstrap", "utils.utils"]
+
+# Dependencies that take seconds to import and must only be imported on use
+HEAVY_MODULES = [
+    "torch",
+    "sentence_transformers",
+    "langchain",
+    "langchain_community",
+    "langchain_google_genai",
+    "langchain_pinecone",
+    "pinecone",
+]
+
+
+def profile_imports(modules: List[str]) -> List[Tuple[str, int, int]]:
+    """
+    Import the modules in a fresh interpreter with `-X importtime`
+
+    Args:
+        modules (List[str]): The modules to import
+
+    Returns:
+        List[Tuple[str, int, int]]:
+            The name, self time, and cumulative time (in microseconds) of each
+            imported module, in import order
+    """
+    env = {**os.environ, "PYTHONPATH": str(SRC_ROOT)}
+    statement = "; ".join(f"import {module}" for module in modules)
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=SRC_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        sys.exit(completed.stderr)
+
+    timings = []
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        timings.append((name.rstrip(), int(self_us), int(cumulative_us)))
+
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "modules", nargs="*", default=DEFAULT_MODULES, help="Modules to import"
+    )
+    parser.add_argument(
+        "--top", type=int, default=20, help="Number of slowest modules to show"
+    )
+    args = parser.parse_args()
+
+    timings = profile_imports(args.modules)
+
+    # Top-level modules are not indented by `-X importtime`
+    total_us = sum(
+        cumulative_us for name, _, cumulative_us in timings if not name.startswith("  ")
+    )
+    print(f"Total import time of {', '.join(args.modules)}: {total_us / 1e6:.2f}s\n")
+
+    print(f"{'cumulative':>12} {'self':>10}  module")
+    slowest = sorted(timings, key=lambda timing: timing[2], reverse=True)
+    for name, self_us, cumulative_us in slowest[: args.top]:
+        print(f"{cumulative_us / 1e3:>10.1f}ms {self_us / 1e3:>8.1f}ms  {name}")
+
+    imported: Dict[str, int] = {name.strip(): us for name, _, us in timings}
+    heavy = [module for module in HEAVY_MODULES if module in imported]
+    print()
+    if heavy:
+        print(f"Heavy modules imported at startup: {', '.join(heavy)}")
+        sys.exit(1)
+    print("No heavy module imported at startup")
+
+
+if __name__ == "__main__":
+    main()
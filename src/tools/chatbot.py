@@ -1,20 +1,97 @@
 import logging
+import time
+from typing import Any, Dict, Iterable, Iterator, List, TypeVar
 
 import streamlit as st
 from langchain_core.runnables import Runnable
 
+from configuration import settings
+from utils.embedding_spec import EmbeddingSpecMismatchError
+from utils.event_loop import AsyncStream
+from utils.metrics import get_gauge, get_histogram
 from utils.rag import setup_rag_chain, setup_rag_tools
+from utils.rate_limit import LLMOverloadedError, LLMTimeoutError
+from utils.tracing import TurnTracer
 
 logging.basicConfig(level=logging.ERROR)
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+chat_turn_duration = get_histogram(
+    "chat_turn_duration_seconds",
+    "Duration of the chat turns per outcome",
+    label_names=("outcome",),
+)
+chat_first_token_duration = get_histogram(
+    "chat_time_to_first_token_seconds",
+    "Time from the question to the first token of the answer",
+)
+chat_turns_in_progress = get_gauge(
+    "chat_turns_in_progress", "Number of chat answers being streamed"
+)
+
+
+def observe_first_token(stream: Iterable[T], start: float) -> Iterator[T]:
+    """
+    Pass through the chunks of a stream, recording the time to the first one
+
+    Args:
+        stream (Iterable[T]): The stream of the answer
+        start (float): The time the question was received
+
+    Returns:
+        Iterator[T]: The chunks of the stream
+    """
+    first = True
+    for chunk in stream:
+        if first:
+            chat_first_token_duration.observe(time.perf_counter() - start)
+            first = False
+        yield chunk
+
+
+def display_trace(spans: List[Dict[str, Any]]):
+    """
+    Display the spans of the trace of a chat turn
+
+    Args:
+        spans (List[Dict[str, Any]]): The spans of the trace
+    """
+    with st.expander("Trace"):
+        st.table(
+            [
+                {
+                    "span": span["name"],
+                    "status": span["status"],
+                    "duration (ms)": round(span["attributes"].get("duration_ms", 0), 1),
+                    "attributes": ", ".join(
+                        f"{key}={value}"
+                        for key, value in span["attributes"].items()
+                        if key != "duration_ms" and value is not None
+                    ),
+                }
+                for span in spans
+            ]
+        )
+
+
 # Set up page configuration
 st.title("Knowledge-based Chatbot")
 
 # Setup LLM and Retriever
-llm, retriever = setup_rag_tools(
-    namespace=st.session_state["uid"], folder_path=st.session_state["uid"]
-)
+try:
+    llm, rewrite_llm, retriever = setup_rag_tools(
+        namespace=st.session_state["uid"], folder_path=st.session_state["uid"]
+    )
+except EmbeddingSpecMismatchError as e:
+    # Vectors of different embedding models cannot be compared
+    logger.error(e)
+    st.error(
+        "Your documents were indexed with another embedding model and must be "
+        "migrated before you can chat with them. Please contact the administrator."
+    )
+    st.stop()
 
 # Initialize chat history
 if "messages" not in st.session_state:
@@ -33,16 +110,49 @@ if prompt := st.chat_input("What is up?"):
 
     # Display assistant response in chat message container
     with st.chat_message("ai"):
-        rag_chain: Runnable = setup_rag_chain(llm, retriever)
+        tracer = TurnTracer() if settings.TRACE_ENABLED else None
+        rag_chain: Runnable = setup_rag_chain(llm, retriever, rewrite_llm, tracer)
         chain = rag_chain.pick("answer")
 
         history = [
             (message["role"], message["content"])
             for message in st.session_state["messages"]
         ]
-        stream = chain.stream({"input": prompt, "chat_history": history})
+        # Stop the generation of a previous turn still running, e.g., if the
+        # user submitted a new message before the answer was complete
+        if previous_stream := st.session_state.pop("chat_stream", None):
+            previous_stream.cancel()
+
+        # Run the chain on the shared event loop, where the turns of all
+        # sessions run concurrently, and stream the answer to this session
+        start = time.perf_counter()
+        outcome = "interrupted"
+        chat_turns_in_progress.inc()
+        stream = AsyncStream(chain.astream({"input": prompt, "chat_history": history}))
+        st.session_state["chat_stream"] = stream
+        try:
+            response = st.write_stream(observe_first_token(stream, start))
+            outcome = "success"
+        except (LLMOverloadedError, LLMTimeoutError) as e:
+            outcome = "overloaded"
+            logger.error(e)
+            st.warning("The assistant is busy at the moment. Please try again.")
+            st.stop()
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            chat_turns_in_progress.dec()
+            chat_turn_duration.observe(time.perf_counter() - start, outcome=outcome)
+            # Also stop the generation if the script is interrupted, e.g., when
+            # the user navigates away
+            stream.cancel()
+            st.session_state.pop("chat_stream", None)
+            if tracer is not None:
+                tracer.finish()
 
-        response = st.write_stream(stream)
+        if tracer is not None and settings.TRACE_DEBUG_PANEL:
+            display_trace(tracer.spans)
 
     # Add user message to chat history
     st.session_state["messages"].append({"role": "human", "content": prompt})
@@ -2,23 +2,38 @@ import logging
 import mimetypes
 from functools import cmp_to_key
 from pathlib import PurePosixPath
-from typing import List
+from typing import List, Set
 
 import streamlit as st
 from google.cloud.storage import Blob
+from streamlit.runtime.uploaded_file_manager import UploadedFile
 
 from utils.firebase import (
     create_folder_in_storage,
     delete_blob_from_storage,
     get_blobs_in_folder_from_storage,
     get_file_from_storage,
-    upload_file_to_storage,
+    resolve_alias,
+    upload_files_to_storage,
+)
+from utils.ingestion_scheduler import IngestionQuotaExceededError
+from utils.metrics import get_histogram
+from utils.rag import (
+    index_files_in_vector_database,
+    move_documents,
+    request_fresh_retriever,
 )
-from utils.rag import setup_fresh_retriever
 
 logging.basicConfig(level=logging.ERROR)
 logger = logging.getLogger(__name__)
 
+document_operation_duration = get_histogram(
+    "document_operation_duration_seconds",
+    "Duration of the document operations of the users (including the "
+    "indexing), per operation",
+    label_names=("operation",),
+)
+
 
 def initialize_session_state():
     """Initialize the session state for the page"""
@@ -113,6 +128,165 @@ def sort_blob_comparator(blob_1: Blob, blob_2: Blob) -> int:
             return 0
 
 
+def sanitize_relative_path(path: str) -> List[str]:
+    """
+    Split a user-provided relative path into its parts, dropping any part that
+    could escape the folder it is relative to
+
+    Args:
+        path (str): The relative path
+
+    Returns:
+        List[str]: The safe parts of the path
+    """
+    return [
+        part
+        for part in PurePosixPath(path.replace("\\", "/")).parts
+        if part not in ("", "/", ".", "..")
+    ]
+
+
+def get_upload_remote_path(uploaded_file: UploadedFile) -> str:
+    """
+    Get the path in Firebase Storage to upload a file to. Files uploaded as part
+    of a folder keep their relative path inside the current folder.
+
+    Args:
+        uploaded_file (UploadedFile): The file uploaded from the Streamlit app
+
+    Returns:
+        str: The path to the location in Firebase Storage to store the file
+    """
+    # Streamlit does not sanitize the relative path of files uploaded from a
+    # folder, so drop any part that could escape the current folder
+    parts = sanitize_relative_path(uploaded_file.name)
+
+    return str(PurePosixPath(st.session_state["current_folder"]).joinpath(*parts))
+
+
+def get_existing_paths(remote_paths: List[str]) -> Set[str]:
+    """
+    Get the paths that already hold a file in Firebase Storage, listing each
+    folder of the paths once
+
+    Args:
+        remote_paths (List[str]): The paths to files in Firebase Storage
+
+    Returns:
+        Set[str]: The paths to the existing files
+    """
+    folders = {str(PurePosixPath(remote_path).parent) for remote_path in remote_paths}
+
+    return {
+        blob.name
+        for folder in folders
+        for blob in get_blobs_in_folder_from_storage(folder, return_folders=False)
+    } & set(remote_paths)
+
+
+def rollback_uploads(uploaded_paths: List[str], existing_paths: Set[str]):
+    """
+    Delete the files uploaded before their indexing failed. The files that
+    overwrote existing files are kept, since the previous versions are gone,
+    and a sync of the namespace is requested in the background to index them
+    and to drop any vector of the deleted files.
+
+    Args:
+        uploaded_paths (List[str]):
+            The paths to the uploaded files
+        existing_paths (Set[str]):
+            The paths to the files that existed before the upload
+    """
+    for remote_path in uploaded_paths:
+        if remote_path not in existing_paths:
+            delete_blob_from_storage(remote_path)
+
+    request_fresh_retriever(st.session_state["uid"], st.session_state["uid"])
+
+
+def upload_documents(uploaded_files: List[UploadedFile]):
+    """
+    Upload files to Firebase Storage concurrently while reporting the progress
+    per file, then index only the newly uploaded files into the vector database
+    in a single incremental run.
+
+    Args:
+        uploaded_files (List[UploadedFile]): The files uploaded from the app
+    """
+    files = [
+        (uploaded_file, get_upload_remote_path(uploaded_file))
+        for uploaded_file in uploaded_files
+    ]
+
+    with st.status(
+        f"Uploading {len(files)} file(s)...", expanded=True
+    ) as status, document_operation_duration.time(operation="upload"):
+        progress_bar = st.progress(0.0)
+        uploaded_paths, promoted_paths = [], []
+        existing_paths = get_existing_paths([remote_path for _, remote_path in files])
+
+        # Upload files to Firebase Storage
+        for num_finished, (remote_path, promoted, error) in enumerate(
+            upload_files_to_storage(files), start=1
+        ):
+            file_name = PurePosixPath(remote_path).name
+            # The files promoted to hold the content of an overwritten file
+            # have no vectors yet
+            promoted_paths.extend(promoted)
+            if error is None:
+                uploaded_paths.append(remote_path)
+                st.write(f":white_check_mark: '{file_name}' uploaded")
+            else:
+                st.write(f":x: '{file_name}' failed to upload: {error}")
+
+            progress_bar.progress(
+                num_finished / len(files),
+                text=f"{num_finished}/{len(files)} file(s) processed",
+            )
+
+        if not uploaded_paths:
+            status.update(label="No file was uploaded", state="error")
+            return
+
+        # Index the new files to make them available to the chatbot
+        status.update(label=f"Indexing {len(uploaded_paths)} file(s)...")
+        try:
+            index_files_in_vector_database(
+                st.session_state["uid"], [*uploaded_paths, *promoted_paths]
+            )
+            logger.info("*" * 100)
+            logger.info(f"Files {uploaded_paths} uploaded to Firebase")
+            logger.info("*" * 100)
+        except IngestionQuotaExceededError as e:
+            logger.info("*" * 100)
+            logger.error(f"Quota exceeded while uploading files: {e}")
+            logger.info("*" * 100)
+
+            rollback_uploads(uploaded_paths, existing_paths)
+
+            status.update(
+                label="You have indexed too many documents in the last hour, "
+                "please try again later",
+                state="error",
+            )
+            return
+        except Exception as e:
+            logger.info("*" * 100)
+            logger.error(f"Error indexing files while uploading files: {e}")
+            logger.info("*" * 100)
+
+            rollback_uploads(uploaded_paths, existing_paths)
+
+            status.update(label="Error indexing the uploaded files", state="error")
+            return
+
+        status.update(
+            label=f"{len(uploaded_paths)}/{len(files)} file(s) uploaded successfully!",
+            state="complete" if len(uploaded_paths) == len(files) else "error",
+            expanded=False,
+        )
+
+
 @st.dialog("⚠ DELETE file or folder ⚠")
 def delete_file_or_folder(file_or_folder_path: str):
     st.write("Are you sure you want to delete this file or folder?")
@@ -134,8 +308,62 @@ def delete_file_or_folder(file_or_folder_path: str):
                 str(PurePosixPath(st.session_state["current_folder"]).parent) + "/"
             )
 
-        delete_blob_from_storage(file_or_folder_path)
-        setup_fresh_retriever(st.session_state["uid"], st.session_state["uid"])
+        with document_operation_duration.time(operation="delete"):
+            delete_blob_from_storage(file_or_folder_path)
+            # Wait for the reindex run so that the deleted documents are no
+            # longer retrieved. Concurrent deletes share a single run.
+            request_fresh_retriever(
+                st.session_state["uid"], st.session_state["uid"]
+            ).result()
+
+        st.rerun()
+
+
+@st.dialog("Move or Rename file or folder")
+def move_file_or_folder(file_or_folder_path: str):
+    st.write("Enter the new path of the file or folder:")
+    # Folders in Firebase Storage end with "/"
+    is_folder = file_or_folder_path.endswith("/")
+    new_path = st.text_input(
+        "New Path",
+        value=str(
+            PurePosixPath(file_or_folder_path).relative_to(st.session_state["uid"])
+        ),
+        key="new_path",
+    )
+
+    _, cancel, move = st.columns([3, 1, 1])
+    cancel_clicked = cancel.button("Cancel", key="cancel", use_container_width=True)
+    move_clicked = move.button("Move", key="move", use_container_width=True)
+
+    if cancel_clicked:
+        st.rerun()
+    elif move_clicked:
+        if not (parts := sanitize_relative_path(new_path)):
+            st.error("Please enter a valid path.")
+            return
+
+        destination_path = str(PurePosixPath(st.session_state["uid"]).joinpath(*parts))
+        if is_folder:
+            destination_path += "/"
+
+        # Vectors follow the files, so nothing is embedded again
+        try:
+            with document_operation_duration.time(operation="move"):
+                move_documents(
+                    st.session_state["uid"], file_or_folder_path, destination_path
+                )
+        except (FileNotFoundError, FileExistsError, ValueError) as e:
+            st.error(str(e))
+            return
+
+        # Follow the current folder if it has been moved
+        if is_folder and st.session_state["current_folder"].startswith(
+            file_or_folder_path
+        ):
+            st.session_state["current_folder"] = destination_path + (
+                st.session_state["current_folder"][len(file_or_folder_path) :]
+            )
 
         st.rerun()
 
@@ -155,7 +383,8 @@ def create_new_folder():
         new_folder_path = str(
             PurePosixPath(st.session_state["current_folder"]).joinpath(new_folder_name)
         )
-        create_folder_in_storage(new_folder_path)
+        with document_operation_duration.time(operation="create_folder"):
+            create_folder_in_storage(new_folder_path)
         st.rerun()
 
 
@@ -186,37 +415,27 @@ CONTAINER_HEIGHT = 50
 # feature to clear the widget after submission
 # https://discuss.streamlit.io/t/clear-the-cache-for-file-uploder-on-streamlit/14304/2
 
+# Let the user pick between uploading multiple files or a whole folder. The
+# choice is made outside of the form since widgets inside a form only update on
+# submission
+upload_mode = st.segmented_control(
+    "Upload mode",
+    options=["Files", "Folder"],
+    default="Files",
+    label_visibility="collapsed",
+)
+
 file_upload_form = st.form("file_upload_form", clear_on_submit=True)
-uploaded_file = file_upload_form.file_uploader("Upload a PDF File", type="pdf")
+uploaded_files = file_upload_form.file_uploader(
+    "Upload PDF Files" if upload_mode != "Folder" else "Upload a Folder of PDF Files",
+    type="pdf",
+    accept_multiple_files="directory" if upload_mode == "Folder" else True,
+)
 submitted = file_upload_form.form_submit_button("Upload :rocket:")
 
-# If the upload button is clicked and a file is selected
-if submitted and uploaded_file:
-    # Upload file to Firebase Storage
-    remote_path = str(
-        PurePosixPath(st.session_state["current_folder"]).joinpath(uploaded_file.name)
-    )
-    upload_file_to_storage(uploaded_file, remote_path)
-    success_banner = st.success(f"File '{uploaded_file.name}' uploaded successfully!")
-
-    # Restart the retriever to include the new file
-    try:
-        setup_fresh_retriever(st.session_state["uid"], st.session_state["uid"])
-        logger.info("*" * 100)
-        logger.info(f"File '{uploaded_file.name}' uploaded to Firebase")
-        logger.info("*" * 100)
-    except Exception as e:
-        logger.info("*" * 100)
-        logger.error(f"Error setting up retriever while uploading file: {e}")
-        logger.info("*" * 100)
-
-        remote_path = str(
-            PurePosixPath(st.session_state["uid"]).joinpath(uploaded_file.name)
-        )
-        delete_blob_from_storage(remote_path)
-
-    # Clear the success message
-    success_banner.empty()
+# If the upload button is clicked and files are selected
+if submitted and uploaded_files:
+    upload_documents(uploaded_files)
 
 ######################################################################
 # Write the current folder path
@@ -269,7 +488,7 @@ logger.info("*" * 100)
 ######################################################################
 # Write headers for listing available files and folders
 ######################################################################
-cols = list_files_container.columns([0.5, 3, 1.5, 1, 1.2])
+cols = list_files_container.columns([0.5, 3, 1.5, 1, 1.2, 0.5])
 
 # Add a button to delete all files and folders in the current folder
 container = cols[0].container(height=CONTAINER_HEIGHT, border=False)
@@ -296,6 +515,9 @@ container.markdown("##### Size")
 container = cols[4].container(height=CONTAINER_HEIGHT, border=False)
 container.markdown("##### Time")
 
+container = cols[5].container(height=CONTAINER_HEIGHT, border=False)
+container.markdown("##### Move")
+
 ######################################################################
 # Add entry for "previous folder" to go back to the parent folder
 ######################################################################
@@ -334,6 +556,15 @@ container.markdown("N/A")
 container = cols[4].container(height=CONTAINER_HEIGHT, border=False)
 container.markdown("N/A")
 
+# Create a disabled button to disallow moving the parent folder
+container = cols[5].container(height=CONTAINER_HEIGHT, border=False)
+container.button(
+    ":heavy_minus_sign:",
+    key="move_parent_folder",
+    disabled=True,
+    type="primary",
+)
+
 ######################################################################
 # Add entries for all files and folders (non recursively)
 # in the current folder
@@ -350,8 +581,10 @@ for file_or_folder_blob in files_and_folders_blobs:
         file_size = "N/A"
         upload_time = "N/A"
     else:
+        # Duplicates of an existing file are stored as aliases of that file
+        content_blob = resolve_alias(file_or_folder_blob)
         content_type, encoding = mimetypes.guess_type(file_or_folder_name)
-        file_size = "{:.2f} KB".format(file_or_folder_blob.size / 1024)
+        file_size = "{:.2f} KB".format(content_blob.size / 1024)
         upload_time = file_or_folder_blob.time_created.strftime("%b %d, %Y")
 
     # Create button to delete the file/folder
@@ -387,7 +620,7 @@ for file_or_folder_blob in files_and_folders_blobs:
             label=f"{truncate_filename(file_or_folder_name)}",
             help=file_or_folder_name,
             icon=":material/picture_as_pdf:",
-            data=file_or_folder_blob.download_as_bytes(),
+            data=content_blob.download_as_bytes(),
             file_name=file_or_folder_name,
             mime=content_type,
             type="primary",
@@ -404,3 +637,11 @@ for file_or_folder_blob in files_and_folders_blobs:
     # Write the upload time
     container = cols[4].container(height=CONTAINER_HEIGHT, border=False)
     container.markdown(upload_time)
+
+    # Create button to move or rename the file/folder
+    container = cols[5].container(height=CONTAINER_HEIGHT, border=False)
+    move_clicked = container.button(
+        ":pencil2:", key=f"move_{file_or_folder_path}", type="primary"
+    )
+    if move_clicked:
+        move_file_or_folder(file_or_folder_path)
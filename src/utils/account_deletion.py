@@ -0,0 +1,467 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import (
+    Column,
+    Engine,
+    Float,
+    Integer,
+    String,
+    Table,
+    delete,
+    insert,
+    select,
+    update,
+)
+
+from configuration import settings
+from utils.database import get_database_engine, metadata
+from utils.firebase import delete_blob_from_storage, delete_user_by_uid
+from utils.metrics import get_counter, get_histogram
+from utils.rag import delete_namespace_in_vector_database
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Each row is an account deletion requested by a user: "queued", "running",
+# "retrying" after a failed attempt, "failed" once out of attempts (until the
+# next process start), or "completed"
+account_deletions_table = Table(
+    "account_deletions",
+    metadata,
+    Column("uid", String, primary_key=True),
+    Column("status", String, nullable=False),
+    Column("requested_at", Float, nullable=False),
+    Column("updated_at", Float, nullable=False),
+    Column("attempts", Integer, nullable=False),
+    Column("error", String, nullable=True),
+)
+
+# Each row is a step of an account deletion that completed, so that a retried
+# or resumed deletion only runs the remaining steps
+account_deletion_steps_table = Table(
+    "account_deletion_steps",
+    metadata,
+    Column("uid", String, primary_key=True),
+    Column("step", String, primary_key=True),
+    Column("completed_at", Float, nullable=False),
+)
+
+UNFINISHED_STATUSES = ("queued", "running", "retrying", "failed")
+
+account_deletions_counter = get_counter(
+    "account_deletions_total",
+    "Account deletion attempts per outcome (completed, retrying, or failed)",
+    label_names=("outcome",),
+)
+account_deletion_step_duration = get_histogram(
+    "account_deletion_step_duration_seconds",
+    "Duration of the steps of the account deletions per step and outcome",
+    label_names=("step", "outcome"),
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0),
+)
+
+
+@dataclass(frozen=True)
+class AccountDeletionStatus:
+    """
+    The progress of the deletion of an account
+
+    Attributes:
+        uid (str): The UID of the deleted user
+        status (str): "queued", "running", "retrying", "failed", or "completed"
+        requested_at (float): The UNIX time the deletion was requested at
+        updated_at (float): The UNIX time the status last changed at
+        attempts (int): The number of failed attempts
+        error (Optional[str]): The error of the last failed attempt
+        completed_steps (Tuple[str, ...]): The steps completed so far
+    """
+
+    uid: str
+    status: str
+    requested_at: float
+    updated_at: float
+    attempts: int
+    error: Optional[str]
+    completed_steps: Tuple[str, ...]
+
+
+class AccountDeletionStore:
+    """
+    Durable store of the account deletions, so that a deletion interrupted by
+    a restart is resumed instead of leaving orphaned data behind
+    """
+
+    def __init__(self, engine: Engine):
+        """
+        Args:
+            engine (Engine): The engine of the database storing the deletions
+        """
+        self._engine = engine
+
+    def request(self, uid: str, now: float):
+        """
+        Record a deletion request. A deletion already requested is queued again
+        if it failed, and left as is otherwise.
+
+        Args:
+            uid (str): The UID of the user to delete
+            now (float): The current UNIX time
+        """
+        table = account_deletions_table
+        with self._engine.begin() as conn:
+            status = conn.execute(
+                select(table.c.status).where(table.c.uid == uid)
+            ).scalar()
+
+            if status is None:
+                conn.execute(
+                    insert(table).values(
+                        uid=uid,
+                        status="queued",
+                        requested_at=now,
+                        updated_at=now,
+                        attempts=0,
+                    )
+                )
+            elif status in ("failed", "completed"):
+                conn.execute(
+                    update(table)
+                    .where(table.c.uid == uid)
+                    .values(status="queued", updated_at=now)
+                )
+
+    def get(self, uid: str) -> Optional[AccountDeletionStatus]:
+        """
+        Get the progress of the deletion of an account
+
+        Args:
+            uid (str): The UID of the deleted user
+
+        Returns:
+            Optional[AccountDeletionStatus]:
+                The progress, or None if no deletion was requested
+        """
+        table = account_deletions_table
+        with self._engine.connect() as conn:
+            row = conn.execute(select(table).where(table.c.uid == uid)).first()
+            if row is None:
+                return None
+
+            steps = conn.execute(
+                select(account_deletion_steps_table.c.step).where(
+                    account_deletion_steps_table.c.uid == uid
+                )
+            ).scalars()
+
+            return AccountDeletionStatus(
+                uid=row.uid,
+                status=row.status,
+                requested_at=row.requested_at,
+                updated_at=row.updated_at,
+                attempts=row.attempts,
+                error=row.error,
+                completed_steps=tuple(sorted(steps)),
+            )
+
+    def get_unfinished(self) -> List[str]:
+        """
+        Returns:
+            List[str]: The UIDs of the deletions that have not completed
+        """
+        table = account_deletions_table
+        with self._engine.connect() as conn:
+            return list(
+                conn.execute(
+                    select(table.c.uid)
+                    .where(table.c.status.in_(UNFINISHED_STATUSES))
+                    .order_by(table.c.requested_at)
+                ).scalars()
+            )
+
+    def set_status(
+        self,
+        uid: str,
+        status: str,
+        now: float,
+        failed: bool = False,
+        error: Optional[str] = None,
+    ):
+        """
+        Update the status of a deletion
+
+        Args:
+            uid (str): The UID of the deleted user
+            status (str): The new status
+            now (float): The current UNIX time
+            failed (bool): Whether an attempt failed. Defaults to False.
+            error (Optional[str]): The error of the failed attempt, if any
+        """
+        table = account_deletions_table
+        values = {"status": status, "updated_at": now}
+        if failed:
+            values.update(attempts=table.c.attempts + 1, error=error)
+
+        with self._engine.begin() as conn:
+            conn.execute(update(table).where(table.c.uid == uid).values(**values))
+
+    def complete_step(self, uid: str, step: str, now: float):
+        """
+        Record that a step of a deletion completed
+
+        Args:
+            uid (str): The UID of the deleted user
+            step (str): The name of the step
+            now (float): The current UNIX time
+        """
+        table = account_deletion_steps_table
+        with self._engine.begin() as conn:
+            conn.execute(
+                delete(table).where((table.c.uid == uid) & (table.c.step == step))
+            )
+            conn.execute(insert(table).values(uid=uid, step=step, completed_at=now))
+
+    def complete(self, uid: str, now: float):
+        """
+        Complete a deletion, forgetting its steps
+
+        Args:
+            uid (str): The UID of the deleted user
+            now (float): The current UNIX time
+        """
+        with self._engine.begin() as conn:
+            conn.execute(
+                delete(account_deletion_steps_table).where(
+                    account_deletion_steps_table.c.uid == uid
+                )
+            )
+            conn.execute(
+                update(account_deletions_table)
+                .where(account_deletions_table.c.uid == uid)
+                .values(status="completed", updated_at=now, error=None)
+            )
+
+
+class AccountDeletionManager:
+    """
+    Run the account deletions in background threads, so that the page returns
+    right away. The steps of a deletion (e.g., deleting the vectors, the files,
+    and the user) run concurrently, and the failed steps are retried with an
+    exponential backoff. The steps must be idempotent: a step may run again if
+    the process stops before it is recorded as completed.
+    """
+
+    def __init__(
+        self,
+        store: AccountDeletionStore,
+        steps: Dict[str, Callable[[str], Any]],
+        max_concurrent_accounts: int = 2,
+        max_attempts: int = 5,
+        retry_backoff_seconds: float = 5.0,
+    ):
+        """
+        Args:
+            store (AccountDeletionStore):
+                The store of the deletions
+            steps (Dict[str, Callable[[str], Any]]):
+                The function of each step, called with the UID of the user
+            max_concurrent_accounts (int):
+                Maximum number of accounts deleted at once. Defaults to `2`.
+            max_attempts (int):
+                Maximum number of attempts of a deletion. Defaults to `5`.
+            retry_backoff_seconds (float):
+                Time to wait after the first failed attempt, doubled after
+                each failed attempt. Defaults to `5.0`.
+        """
+        self.store = store
+        self.steps = steps
+        self.max_attempts = max_attempts
+        self.retry_backoff_seconds = retry_backoff_seconds
+
+        self._accounts_executor = ThreadPoolExecutor(
+            max_workers=max_concurrent_accounts,
+            thread_name_prefix="account-deletion",
+        )
+        # Enough threads for the steps of all the accounts deleted at once
+        self._steps_executor = ThreadPoolExecutor(
+            max_workers=max_concurrent_accounts * len(steps),
+            thread_name_prefix="account-deletion-step",
+        )
+        self._lock = threading.Lock()
+        self._futures: Dict[str, Future] = {}
+
+    def request(self, uid: str) -> Future:
+        """
+        Request the deletion of an account. Requests for an account being
+        deleted join the deletion in progress.
+
+        Args:
+            uid (str): The UID of the user to delete
+
+        Returns:
+            Future: The future of the deletion
+        """
+        self.store.request(uid, time.time())
+        return self._submit(uid)
+
+    def resume(self) -> int:
+        """
+        Resume the deletions that did not complete, e.g., at process start
+
+        Returns:
+            int: The number of resumed deletions
+        """
+        uids = self.store.get_unfinished()
+        for uid in uids:
+            self._submit(uid)
+
+        return len(uids)
+
+    def status(self, uid: str) -> Optional[AccountDeletionStatus]:
+        """
+        Get the progress of the deletion of an account
+
+        Args:
+            uid (str): The UID of the deleted user
+
+        Returns:
+            Optional[AccountDeletionStatus]:
+                The progress, or None if no deletion was requested
+        """
+        return self.store.get(uid)
+
+    def _submit(self, uid: str) -> Future:
+        with self._lock:
+            future = self._futures.get(uid)
+            if future is None or future.done():
+                future = self._accounts_executor.submit(self._run, uid)
+                self._futures[uid] = future
+
+            return future
+
+    def _run(self, uid: str):
+        """
+        Run the remaining steps of a deletion until they all complete or the
+        attempts run out
+
+        Args:
+            uid (str): The UID of the user to delete
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            self.store.set_status(uid, "running", time.time())
+
+            completed_steps = self.store.get(uid).completed_steps
+            futures = {
+                step: self._steps_executor.submit(self._run_step, uid, step)
+                for step in self.steps
+                if step not in completed_steps
+            }
+
+            errors = {}
+            for step, future in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    errors[step] = e
+
+            if not errors:
+                self.store.complete(uid, time.time())
+                account_deletions_counter.inc(outcome="completed")
+                logger.info(f"Account '{uid}' deleted")
+                return
+
+            error = "; ".join(f"{step}: {e}" for step, e in errors.items())
+            logger.error("*" * 100)
+            logger.error(
+                f"Error deleting account '{uid}' "
+                f"(attempt {attempt}/{self.max_attempts}): {error}"
+            )
+            logger.error("*" * 100)
+
+            if attempt == self.max_attempts:
+                self.store.set_status(
+                    uid, "failed", time.time(), failed=True, error=error
+                )
+                account_deletions_counter.inc(outcome="failed")
+                return
+
+            self.store.set_status(
+                uid, "retrying", time.time(), failed=True, error=error
+            )
+            account_deletions_counter.inc(outcome="retrying")
+            time.sleep(self.retry_backoff_seconds * 2 ** (attempt - 1))
+
+    def _run_step(self, uid: str, step: str):
+        start = time.perf_counter()
+        try:
+            self.steps[step](uid)
+        except Exception:
+            account_deletion_step_duration.observe(
+                time.perf_counter() - start, step=step, outcome="error"
+            )
+            raise
+
+        self.store.complete_step(uid, step, time.time())
+        account_deletion_step_duration.observe(
+            time.perf_counter() - start, step=step, outcome="completed"
+        )
+
+
+def delete_folder_in_storage(uid: str):
+    """
+    Delete the folder of a user in Firebase Storage
+
+    Args:
+        uid (str): The UID of the user
+    """
+    delete_blob_from_storage(f"{uid}/")
+
+
+def delete_user_in_auth(uid: str):
+    """
+    Delete a user in Firebase Authentication
+
+    Args:
+        uid (str): The UID of the user
+
+    Raises:
+        RuntimeError: If the user could not be deleted
+    """
+    if delete_user_by_uid(uid) is None:
+        raise RuntimeError(f"Error deleting user '{uid}' in Firebase Authentication")
+
+
+_manager: Optional[AccountDeletionManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_account_deletion_manager() -> AccountDeletionManager:
+    """
+    Get the process-wide manager of the account deletions, which deletes the
+    user's namespace in Pinecone, folder in Firebase Storage, and user in
+    Firebase Authentication concurrently
+
+    Returns:
+        AccountDeletionManager: The account deletion manager
+    """
+    global _manager
+
+    with _manager_lock:
+        if _manager is None:
+            _manager = AccountDeletionManager(
+                AccountDeletionStore(get_database_engine()),
+                steps={
+                    "vectors": delete_namespace_in_vector_database,
+                    "storage": delete_folder_in_storage,
+                    "auth": delete_user_in_auth,
+                },
+                max_concurrent_accounts=settings.ACCOUNT_DELETION_MAX_CONCURRENT,
+                max_attempts=settings.ACCOUNT_DELETION_MAX_ATTEMPTS,
+                retry_backoff_seconds=settings.ACCOUNT_DELETION_RETRY_BACKOFF_SECONDS,
+            )
+
+        return _manager
@@ -0,0 +1,183 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from functools import cache
+from pathlib import Path
+from typing import Dict
+
+from configuration import settings
+from utils.account_deletion import get_account_deletion_manager
+from utils.database import get_database_engine
+from utils.firebase import initialize_firebase_app
+from utils.metrics import get_gauge, render_prometheus, start_metrics_server
+from utils.rag import resolve_pinecone_index_host, start_embedding_warm_up
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_bootstrap_lock = threading.Lock()
+_bootstrapped = threading.Event()
+
+
+def write_file_atomically(path: Path, content: str, mode: int = 0o600):
+    """
+    Write a file so that readers never see it partially written: the content is
+    written to a temporary file in the same directory which then replaces the
+    file.
+
+    Args:
+        path (Path): The path of the file
+        content (str): The content of the file
+        mode (int): The permissions of the file. Defaults to `0o600`.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def resolve_pinecone_index_host_in_background():
+    """
+    Resolve the host of the Pinecone index without blocking the first page
+    render. A failure is logged and retried on first use of the index.
+    """
+
+    def resolve():
+        try:
+            host = resolve_pinecone_index_host()
+            logger.info(f"Pinecone index host resolved: {host}")
+        except Exception as e:
+            logger.error("*" * 100)
+            logger.error(f"Error resolving the Pinecone index host: {e}")
+            logger.error("*" * 100)
+
+    threading.Thread(
+        target=resolve, name="pinecone-index-host-resolver", daemon=True
+    ).start()
+
+
+@cache
+def _warn_active_sessions_unavailable(error: str):
+    """Log once per error that the active sessions cannot be counted"""
+    logger.warning(f"Cannot count the active sessions: {error}")
+
+
+def count_active_sessions() -> int:
+    """
+    Count the browser sessions through the session manager of the Streamlit
+    runtime, which is private, so that a change in Streamlit only zeroes the
+    gauge instead of breaking the rendering of all metrics
+
+    Returns:
+        int: The number of browser sessions connected to the Streamlit server
+    """
+    try:
+        from streamlit.runtime import Runtime
+
+        if not Runtime.exists():
+            return 0
+
+        return Runtime.instance()._session_mgr.num_active_sessions()
+    except Exception as e:
+        _warn_active_sessions_unavailable(repr(e))
+        return 0
+
+
+def start_metrics_file_writer(path: Path, interval_seconds: float):
+    """
+    Rewrite the metrics in the Prometheus text format to a file periodically,
+    in a background thread, for a node exporter to collect
+
+    Args:
+        path (Path): The path of the file
+        interval_seconds (float): The time between two writes
+    """
+
+    def write_periodically():
+        while True:
+            try:
+                write_file_atomically(path, render_prometheus(), mode=0o644)
+            except OSError as e:
+                logger.error(f"Error writing the metrics file: {e}")
+            time.sleep(interval_seconds)
+
+    threading.Thread(
+        target=write_periodically, name="metrics-file-writer", daemon=True
+    ).start()
+
+
+def start_metrics_exposition():
+    """Expose the metrics of the process on a side port and/or in a file"""
+    get_gauge(
+        "streamlit_active_sessions",
+        "Number of browser sessions connected to the Streamlit server",
+    ).set_function(count_active_sessions)
+
+    if settings.METRICS_PORT is not None:
+        try:
+            start_metrics_server(settings.METRICS_PORT)
+            logger.info(f"Serving the metrics on port {settings.METRICS_PORT}")
+        except OSError as e:
+            logger.error(f"Error serving the metrics: {e}")
+
+    if settings.METRICS_FILE is not None:
+        start_metrics_file_writer(
+            Path(settings.METRICS_FILE), settings.METRICS_FILE_INTERVAL_SECONDS
+        )
+
+
+def bootstrap(firebase_service_account: Dict[str, str]):
+    """
+    Set up the process: write the Firebase service account file, point the
+    environment variable `GOOGLE_APPLICATION_CREDENTIALS` to it (for the Google
+    Gemini API), initialize the Firebase app, create the database schema,
+    resume the account deletions, resolve the Pinecone index host, warm up the
+    embedding model, and expose the metrics. This only runs once per process,
+    so Streamlit reruns only touch the session state.
+
+    Args:
+        firebase_service_account (Dict[str, str]):
+            The Firebase service account JSON object in dictionary format
+    """
+    if _bootstrapped.is_set():
+        return
+
+    with _bootstrap_lock:
+        if _bootstrapped.is_set():
+            return
+
+        logger.info("*" * 100)
+        logger.info(f"Bootstrapping the process (PID {os.getpid()})")
+        logger.info("*" * 100)
+
+        credentials_path = Path(settings.FIREBASE_SERVICE_ACCOUNT_FILE).absolute()
+        write_file_atomically(credentials_path, json.dumps(firebase_service_account))
+        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = str(credentials_path)
+
+        initialize_firebase_app(firebase_service_account)
+
+        # Create the pooled database engine and the schema of the app tables
+        get_database_engine()
+
+        # Resume the account deletions interrupted by the previous process
+        if resumed := get_account_deletion_manager().resume():
+            logger.info(f"Resumed {resumed} account deletion(s)")
+
+        resolve_pinecone_index_host_in_background()
+        if settings.EMBEDDING_WARM_UP:
+            start_embedding_warm_up()
+
+        start_metrics_exposition()
+
+        _bootstrapped.set()
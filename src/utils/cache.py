@@ -0,0 +1,486 @@
+import functools
+import gc
+import inspect
+import sys
+import threading
+import time
+import types
+from collections import OrderedDict
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+import streamlit as st
+
+from utils.metrics import get_counter, get_gauge, get_histogram
+
+V = TypeVar("V")
+
+# Sentinel to tell a cached None apart from a missing entry
+_MISSING = object()
+
+cache_requests = get_counter(
+    "cache_requests_total", "Lookups of the caches per cache", label_names=("cache",)
+)
+cache_misses = get_counter(
+    "cache_misses_total",
+    "Lookups of the caches that found no valid entry, per cache",
+    label_names=("cache",),
+)
+resource_cache_entries = get_gauge(
+    "resource_cache_entries", "Entries of the resource caches", label_names=("cache",)
+)
+resource_cache_bytes = get_gauge(
+    "resource_cache_bytes",
+    "Estimated memory of the entries of the resource caches",
+    label_names=("cache",),
+)
+resource_cache_entry_bytes = get_histogram(
+    "resource_cache_entry_bytes",
+    "Estimated memory of each entry added to the resource caches",
+    label_names=("cache",),
+    buckets=(1e4, 1e5, 1e6, 1e7, 1e8, 1e9),
+)
+resource_cache_evictions = get_counter(
+    "resource_cache_evictions_total",
+    "Entries removed from the resource caches, per cache and reason (idle, "
+    "lru, or invalidated)",
+    label_names=("cache", "reason"),
+)
+
+# Objects shared by the whole process, not counted in the size of an entry
+_SHARED_TYPES = (type, types.ModuleType, types.FunctionType, types.CodeType)
+
+
+class TTLCache(Generic[V]):
+    """
+    A thread-safe cache whose entries expire after a time-to-live (TTL) and
+    which evicts the least recently used entry when it is full.
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: float, name: Optional[str] = None):
+        """
+        Args:
+            maxsize (int):
+                Maximum number of entries kept in the cache
+            ttl_seconds (float):
+                Default number of seconds an entry stays valid
+            name (Optional[str]):
+                The name of the cache in the hit ratio metrics. Defaults to
+                None, in which case the lookups are not counted.
+        """
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.name = name
+        self._lock = threading.Lock()
+        # Key -> (value, expiry time), ordered from least to most recently used
+        self._entries: "OrderedDict[Hashable, Tuple[V, float]]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Optional[V]:
+        """
+        Get the value of a valid entry
+
+        Args:
+            key (Hashable): The key of the entry
+            default (Any): The value returned if there is no valid entry
+
+        Returns:
+            Optional[V]: The cached value, or `default`
+        """
+        if self.name is not None:
+            cache_requests.inc(cache=self.name)
+
+        with self._lock:
+            value, expires_at = self._entries.get(key, (_MISSING, 0.0))
+            if value is not _MISSING and expires_at <= time.monotonic():
+                del self._entries[key]
+                value = _MISSING
+
+            if value is not _MISSING:
+                self._entries.move_to_end(key)
+                return value
+
+        if self.name is not None:
+            cache_misses.inc(cache=self.name)
+
+        return default
+
+    def set(self, key: Hashable, value: V, ttl_seconds: Optional[float] = None):
+        """
+        Add or replace an entry
+
+        Args:
+            key (Hashable):
+                The key of the entry
+            value (V):
+                The value to cache
+            ttl_seconds (Optional[float]):
+                Number of seconds the entry stays valid. Defaults to the TTL of
+                the cache.
+        """
+        if ttl_seconds is None:
+            ttl_seconds = self.ttl_seconds
+        if ttl_seconds <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl_seconds)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Optional[V]:
+        """
+        Remove an entry
+
+        Args:
+            key (Hashable): The key of the entry
+            default (Any): The value returned if there is no entry
+
+        Returns:
+            Optional[V]: The removed value, or `default`
+        """
+        with self._lock:
+            value, _ = self._entries.pop(key, (default, 0.0))
+            return value
+
+    def clear(self):
+        """Remove all entries"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+def counted_cache_resource(func: Callable) -> Callable:
+    """
+    Decorator caching the resources returned by a function with
+    `st.cache_resource`, while counting the lookups and misses of the cache
+    under the name of the function for the hit ratio metrics
+
+    Args:
+        func (Callable): The function creating the resource
+
+    Returns:
+        Callable: The cached function, with the `clear()` method of the cache
+    """
+    name = func.__name__
+
+    @functools.wraps(func)
+    def create(*args, **kwargs):
+        # Only runs when the resource is not cached
+        cache_misses.inc(cache=name)
+        return func(*args, **kwargs)
+
+    cached = st.cache_resource()(create)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        cache_requests.inc(cache=name)
+        return cached(*args, **kwargs)
+
+    wrapper.clear = cached.clear
+
+    return wrapper
+
+
+def estimate_size(
+    value: Any, exclude: Iterable[Any] = (), max_objects: int = 100_000
+) -> int:
+    """
+    Estimate the memory of an object and of the objects it references, without
+    the classes, modules, and functions, nor the objects referenced by the
+    excluded objects (e.g., a model shared by the resources of all tenants)
+
+    Args:
+        value (Any):
+            The object
+        exclude (Iterable[Any]):
+            The shared objects not counted. Defaults to none.
+        max_objects (int):
+            Maximum number of objects visited, to bound the time of the
+            estimate. Defaults to `100_000`.
+
+    Returns:
+        int: The estimated number of bytes
+    """
+    seen = {id(obj) for obj in exclude}
+    pending = [value]
+    size = 0
+
+    while pending and len(seen) < max_objects:
+        obj = pending.pop()
+        if id(obj) in seen or isinstance(obj, _SHARED_TYPES):
+            continue
+
+        seen.add(id(obj))
+        size += sys.getsizeof(obj, 0)
+        pending.extend(gc.get_referents(obj))
+
+    return size
+
+
+class _Resource:
+    """An entry of a resource cache"""
+
+    def __init__(self, value: Any, size_bytes: int):
+        self.value = value
+        self.size_bytes = size_bytes
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+
+
+class ResourceCache(Generic[V]):
+    """
+    A thread-safe cache of resources created on demand (e.g., the retriever of
+    each tenant), bounded in number of entries: the entries unused for longer
+    than an idle time-to-live are removed, and the least recently used entry is
+    evicted when the cache is full. Concurrent lookups of a missing entry only
+    create it once. The memory of each entry is estimated for monitoring.
+
+    Evicting an entry only drops the reference of the cache, so the resource
+    must be safe to create again, and to use after its eviction by a session
+    which still holds it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int,
+        idle_ttl_seconds: float,
+        sizer: Optional[Callable[[V, Sequence[Any]], int]] = None,
+    ):
+        """
+        Args:
+            name (str):
+                The name of the cache in the metrics
+            maxsize (int):
+                Maximum number of entries kept in the cache
+            idle_ttl_seconds (float):
+                Number of seconds an entry stays in the cache without being used
+            sizer (Optional[Callable[[V, Sequence[Any]], int]]):
+                Function estimating the memory of a resource in bytes, without
+                the given shared objects. Defaults to `estimate_size`.
+        """
+        self.name = name
+        self.maxsize = maxsize
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.sizer = sizer or estimate_size
+        self._lock = threading.Lock()
+        # Key -> resource, ordered from least to most recently used
+        self._entries: "OrderedDict[Hashable, _Resource]" = OrderedDict()
+        # Key -> lock held while creating the resource
+        self._creation_locks: Dict[Hashable, threading.Lock] = {}
+
+    def get_or_create(
+        self, key: Hashable, create: Callable[[], V], shared: Sequence[Any] = ()
+    ) -> V:
+        """
+        Get the resource of a key, creating it if it is not cached
+
+        Args:
+            key (Hashable):
+                The key of the resource
+            create (Callable[[], V]):
+                The function creating the resource
+            shared (Sequence[Any]):
+                The objects the resource shares with others, not counted in its
+                memory. Defaults to none.
+
+        Returns:
+            V: The resource
+        """
+        cache_requests.inc(cache=self.name)
+
+        with self._lock:
+            self._evict_idle()
+            value = self._use(key)
+            if value is not _MISSING:
+                return value
+
+            creation_lock = self._creation_locks.setdefault(key, threading.Lock())
+
+        with creation_lock:
+            # Another thread may have created it in the meantime
+            with self._lock:
+                value = self._use(key)
+                if value is not _MISSING:
+                    return value
+
+            cache_misses.inc(cache=self.name)
+            try:
+                value = create()
+                resource = _Resource(value, self.sizer(value, shared))
+            finally:
+                with self._lock:
+                    self._creation_locks.pop(key, None)
+
+        resource_cache_entry_bytes.observe(resource.size_bytes, cache=self.name)
+        with self._lock:
+            self._entries[key] = resource
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                resource_cache_evictions.inc(cache=self.name, reason="lru")
+            self._update_gauges()
+
+        return value
+
+    def invalidate(self, key: Hashable) -> bool:
+        """
+        Remove the resource of a key, so that it is created again on next use
+
+        Args:
+            key (Hashable): The key of the resource
+
+        Returns:
+            bool: Whether the resource was cached
+        """
+        with self._lock:
+            removed = self._entries.pop(key, None) is not None
+            if removed:
+                resource_cache_evictions.inc(cache=self.name, reason="invalidated")
+                self._update_gauges()
+
+            return removed
+
+    def clear(self):
+        """Remove all resources"""
+        with self._lock:
+            self._entries.clear()
+            self._update_gauges()
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """
+        Returns:
+            List[Dict[str, Any]]:
+                The key, estimated memory, age, and idle time of each entry,
+                from the least to the most recently used
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "key": key,
+                    "size_bytes": resource.size_bytes,
+                    "age_seconds": now - resource.created_at,
+                    "idle_seconds": now - resource.last_used_at,
+                }
+                for key, resource in self._entries.items()
+            ]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _use(self, key: Hashable) -> Any:
+        """Mark the resource of a key as used and return it. Called with the
+        lock held."""
+        resource = self._entries.get(key)
+        if resource is None:
+            return _MISSING
+
+        resource.last_used_at = time.monotonic()
+        self._entries.move_to_end(key)
+        return resource.value
+
+    def _evict_idle(self):
+        """Remove the resources unused for longer than the idle TTL. Called with
+        the lock held."""
+        idle_before = time.monotonic() - self.idle_ttl_seconds
+        evicted = False
+
+        # The entries are ordered by last use, so the idle ones come first
+        while self._entries:
+            key, resource = next(iter(self._entries.items()))
+            if resource.last_used_at > idle_before:
+                break
+
+            del self._entries[key]
+            resource_cache_evictions.inc(cache=self.name, reason="idle")
+            evicted = True
+
+        if evicted:
+            self._update_gauges()
+
+    def _update_gauges(self):
+        """Called with the lock held"""
+        resource_cache_entries.set(len(self._entries), cache=self.name)
+        resource_cache_bytes.set(
+            sum(resource.size_bytes for resource in self._entries.values()),
+            cache=self.name,
+        )
+
+
+def tenant_cache_resource(
+    maxsize: int, idle_ttl_seconds: float
+) -> Callable[[Callable], Callable]:
+    """
+    Decorator caching the resources returned by a function in a
+    `ResourceCache` named after the function, e.g., for the resources of each
+    tenant which must not be kept for the lifetime of the process. As with
+    `st.cache_resource`, the arguments whose name starts with an underscore are
+    not part of the key; they are shared resources (e.g., the embedding model)
+    which are not counted in the memory of the entries.
+
+    Args:
+        maxsize (int):
+            Maximum number of resources kept in the cache
+        idle_ttl_seconds (float):
+            Number of seconds a resource stays in the cache without being used
+
+    Returns:
+        Callable[[Callable], Callable]:
+            The decorator. The cached function has the `clear()` method of the
+            cache, an `invalidate(**key_arguments)` method to remove the
+            resource of the given key arguments, and the `cache` attribute.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        signature = inspect.signature(func)
+        key_names = [name for name in signature.parameters if not name.startswith("_")]
+        cache: ResourceCache = ResourceCache(
+            name=func.__name__, maxsize=maxsize, idle_ttl_seconds=idle_ttl_seconds
+        )
+
+        def key_of(arguments: inspect.BoundArguments) -> Tuple:
+            return tuple(arguments.arguments[name] for name in key_names)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            arguments = signature.bind(*args, **kwargs)
+            arguments.apply_defaults()
+            shared = [
+                value
+                for name, value in arguments.arguments.items()
+                if name not in key_names
+            ]
+
+            return cache.get_or_create(
+                key_of(arguments), functools.partial(func, *args, **kwargs), shared
+            )
+
+        def invalidate(**key_arguments) -> bool:
+            arguments = signature.bind_partial(**key_arguments)
+            return cache.invalidate(key_of(arguments))
+
+        wrapper.clear = cache.clear
+        wrapper.invalidate = invalidate
+        wrapper.cache = cache
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,293 @@
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import (
+    Column,
+    Engine,
+    String,
+    Table,
+    and_,
+    delete,
+    insert,
+    select,
+    update,
+)
+
+from utils.database import metadata
+
+# Each row maps a file in Firebase Storage to the SHA-256 hash of its content.
+# A file whose content already exists under another path of the same namespace
+# is an alias: it points to the path holding the content (`alias_of`) and is
+# neither stored nor embedded again.
+content_index_table = Table(
+    "content_index",
+    metadata,
+    Column("namespace", String, primary_key=True),
+    Column("remote_path", String, primary_key=True),
+    Column("sha256", String(64), nullable=False, index=True),
+    Column("alias_of", String, nullable=True),
+)
+
+# Maximum number of paths per SQL statement to stay under the limit of bound
+# parameters of the database
+BATCH_SIZE = 500
+
+
+class ContentIndex:
+    """
+    Per-namespace index of the content hash of the files in Firebase Storage,
+    used to detect files uploaded more than once under different names.
+    """
+
+    def __init__(self, engine: Engine):
+        """
+        Args:
+            engine (Engine): The engine of the database storing the index
+        """
+        self._engine = engine
+        # Serialize the read-then-write operations within the process
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, remote_path: str) -> Optional[Tuple[str, str]]:
+        """
+        Get the content hash and alias target of a file
+
+        Args:
+            namespace (str): The namespace of the file
+            remote_path (str): The path to the file in Firebase Storage
+
+        Returns:
+            Optional[Tuple[str, str]]:
+                The SHA-256 hash of the file and the path it is an alias of
+                (None if it holds the content). None if the file is not indexed.
+        """
+        table = content_index_table
+        with self._engine.connect() as conn:
+            row = conn.execute(
+                select(table.c.sha256, table.c.alias_of).where(
+                    and_(
+                        table.c.namespace == namespace,
+                        table.c.remote_path == remote_path,
+                    )
+                )
+            ).first()
+
+        return tuple(row) if row else None
+
+    def register(
+        self,
+        namespace: str,
+        remote_path: str,
+        sha256: str,
+        alias: bool = True,
+        new_content: bool = True,
+    ) -> Optional[str]:
+        """
+        Register the content hash of a file. If another file of the namespace
+        has the same content, the file is registered as an alias of it, unless
+        `alias` is False, in which case nothing is registered. Otherwise, the
+        file is registered as holding the content, unless `new_content` is
+        False (e.g., before its content is stored).
+
+        Args:
+            namespace (str):
+                The namespace of the file
+            remote_path (str):
+                The path to the file in Firebase Storage
+            sha256 (str):
+                The SHA-256 hash of the content of the file
+            alias (bool):
+                If True, register duplicates as aliases. Defaults to `True`.
+            new_content (bool):
+                If True, register files with new content. Defaults to `True`.
+
+        Returns:
+            Optional[str]:
+                The path to the file holding the same content, or None if the
+                content is new to the namespace
+        """
+        table = content_index_table
+        with self._lock, self._engine.begin() as conn:
+            canonical = conn.execute(
+                select(table.c.remote_path).where(
+                    and_(
+                        table.c.namespace == namespace,
+                        table.c.sha256 == sha256,
+                        table.c.alias_of.is_(None),
+                        table.c.remote_path != remote_path,
+                    )
+                )
+            ).scalar()
+
+            if (canonical is not None and not alias) or (
+                canonical is None and not new_content
+            ):
+                return canonical
+
+            conn.execute(
+                delete(table).where(
+                    and_(
+                        table.c.namespace == namespace,
+                        table.c.remote_path == remote_path,
+                    )
+                )
+            )
+            conn.execute(
+                insert(table).values(
+                    namespace=namespace,
+                    remote_path=remote_path,
+                    sha256=sha256,
+                    alias_of=canonical,
+                )
+            )
+
+        return canonical
+
+    def remove(
+        self, namespace: str, remote_paths: Iterable[str]
+    ) -> Dict[str, Tuple[str, List[str]]]:
+        """
+        Remove files from the index. When a removed file holds content that
+        other (not removed) files are aliases of, the first alias is promoted
+        to hold the content and the other aliases are re-pointed to it.
+
+        Args:
+            namespace (str):
+                The namespace of the files
+            remote_paths (Iterable[str]):
+                The paths to the files in Firebase Storage
+
+        Returns:
+            Dict[str, Tuple[str, List[str]]]:
+                For each removed file whose content is still referenced, the
+                promoted path and the paths of the re-pointed aliases
+        """
+        table = content_index_table
+        remote_paths = list(remote_paths)
+        removed = set(remote_paths)
+        promotions = {}
+
+        with self._lock, self._engine.begin() as conn:
+            for i in range(0, len(remote_paths), BATCH_SIZE):
+                batch = remote_paths[i : i + BATCH_SIZE]
+                aliases = conn.execute(
+                    select(table.c.alias_of, table.c.remote_path)
+                    .where(
+                        and_(
+                            table.c.namespace == namespace,
+                            table.c.alias_of.in_(batch),
+                        )
+                    )
+                    .order_by(table.c.remote_path)
+                ).all()
+
+                for canonical, alias_path in aliases:
+                    if alias_path in removed:
+                        continue
+                    if canonical not in promotions:
+                        promotions[canonical] = (alias_path, [])
+                    else:
+                        promotions[canonical][1].append(alias_path)
+
+                conn.execute(
+                    delete(table).where(
+                        and_(
+                            table.c.namespace == namespace,
+                            table.c.remote_path.in_(batch),
+                        )
+                    )
+                )
+
+            for canonical, (promoted, repointed) in promotions.items():
+                conn.execute(
+                    update(table)
+                    .where(
+                        and_(
+                            table.c.namespace == namespace,
+                            table.c.remote_path == promoted,
+                        )
+                    )
+                    .values(alias_of=None)
+                )
+                conn.execute(
+                    update(table)
+                    .where(
+                        and_(
+                            table.c.namespace == namespace,
+                            table.c.alias_of == canonical,
+                        )
+                    )
+                    .values(alias_of=promoted)
+                )
+
+        return promotions
+
+    def move(self, namespace: str, moves: Dict[str, str]) -> Dict[str, str]:
+        """
+        Update the paths of moved or renamed files
+
+        Args:
+            namespace (str):
+                The namespace of the files
+            moves (Dict[str, str]):
+                The old path to the new path of each moved file
+
+        Returns:
+            Dict[str, str]:
+                The new path of each alias whose target has changed, mapped to
+                the new target path
+        """
+        table = content_index_table
+
+        with self._lock, self._engine.begin() as conn:
+            # Move the targets of the aliases along with the files
+            old_paths = list(moves)
+            aliases = []
+            for i in range(0, len(old_paths), BATCH_SIZE):
+                aliases.extend(
+                    conn.execute(
+                        select(table.c.remote_path, table.c.alias_of).where(
+                            and_(
+                                table.c.namespace == namespace,
+                                table.c.alias_of.in_(old_paths[i : i + BATCH_SIZE]),
+                            )
+                        )
+                    ).all()
+                )
+
+            for old_path, new_path in moves.items():
+                # Drop any stale entry of a file that no longer exists at the
+                # new path
+                conn.execute(
+                    delete(table).where(
+                        and_(
+                            table.c.namespace == namespace,
+                            table.c.remote_path == new_path,
+                        )
+                    )
+                )
+                conn.execute(
+                    update(table)
+                    .where(
+                        and_(
+                            table.c.namespace == namespace,
+                            table.c.remote_path == old_path,
+                        )
+                    )
+                    .values(remote_path=new_path)
+                )
+                conn.execute(
+                    update(table)
+                    .where(
+                        and_(
+                            table.c.namespace == namespace,
+                            table.c.alias_of == old_path,
+                        )
+                    )
+                    .values(alias_of=new_path)
+                )
+
+        return {
+            moves.get(alias_path, alias_path): moves[alias_of]
+            for alias_path, alias_of in aliases
+        }
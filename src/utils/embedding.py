@@ -0,0 +1,369 @@
+import http.client
+import json
+import logging
+import queue
+import socket
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from langchain_core.embeddings import Embeddings
+
+from configuration import settings
+from utils.metrics import get_histogram
+from utils.tracing import trace_span
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+batch_size_histogram = get_histogram(
+    "embedding_query_batch_size",
+    "Number of queries embedded per forward pass",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+batch_fill_histogram = get_histogram(
+    "embedding_query_batch_fill_ratio",
+    "Size of the query batches relative to the maximum batch size",
+    buckets=(0.1, 0.25, 0.5, 0.75, 0.9, 1.0),
+)
+batch_wait_histogram = get_histogram(
+    "embedding_query_batch_wait_seconds",
+    "Time a query waits for its batch to be embedded",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+
+def create_embedding_model() -> Embeddings:
+    """Load the Hugging Face BGE Embedding model configured by
+    `settings.EMBEDDING_MODEL_NAME` in this process. The embeddings are
+    truncated to `settings.EMBEDDING_DIMENSION` if set, for Matryoshka models.
+
+    Returns:
+        HuggingFaceBgeEmbeddings: The Hugging Face BGE Embedding model
+    """
+    from langchain_community.embeddings import HuggingFaceBgeEmbeddings
+
+    model_name = settings.EMBEDDING_MODEL_NAME
+    model_kwargs = {"device": "cpu"}
+    if settings.EMBEDDING_DIMENSION:
+        model_kwargs["truncate_dim"] = settings.EMBEDDING_DIMENSION
+    encode_kwargs = {"normalize_embeddings": settings.EMBEDDING_NORMALIZE}
+    hf_embedding = HuggingFaceBgeEmbeddings(
+        model_name=model_name, model_kwargs=model_kwargs, encode_kwargs=encode_kwargs
+    )
+
+    return hf_embedding
+
+
+def embed_queries(embedding: Embeddings, texts: List[str]) -> List[List[float]]:
+    """Embed several queries. The queries are embedded in a single forward
+    pass if the model is a Hugging Face BGE model, whose `embed_query` only
+    takes one query at a time.
+
+    Args:
+        embedding (Embeddings): The embedding model
+        texts (List[str]): The queries to embed
+
+    Returns:
+        List[List[float]]: The embedding of each query, as `embed_query` does
+    """
+    query_instruction = getattr(embedding, "query_instruction", None)
+    client = getattr(embedding, "client", None)
+    if not isinstance(query_instruction, str) or client is None:
+        return [embedding.embed_query(text) for text in texts]
+
+    # Same input as `HuggingFaceBgeEmbeddings.embed_query()` for each query
+    texts = [query_instruction + text.replace("\n", " ") for text in texts]
+    return client.encode(texts, **embedding.encode_kwargs).tolist()
+
+
+class MicroBatchingEmbeddings(Embeddings):
+    """
+    Embeddings whose concurrent queries are embedded together: the queries
+    received within a few milliseconds of each other (up to a maximum batch
+    size) are embedded in a single forward pass by a worker thread, which is
+    much faster than one forward pass per query.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        max_batch_size: int = 32,
+        max_wait_seconds: float = 0.005,
+        embed_batch: Optional[Callable[[List[str]], List[List[float]]]] = None,
+    ):
+        """
+        Args:
+            embedding (Embeddings):
+                The embedding model
+            max_batch_size (int):
+                Maximum number of queries per forward pass. Defaults to `32`.
+            max_wait_seconds (float):
+                Maximum time the first query of a batch waits for more queries.
+                Defaults to `0.005`.
+            embed_batch (Optional[Callable[[List[str]], List[List[float]]]]):
+                The function embedding a batch of queries. Defaults to
+                `embed_queries` with the embedding model.
+        """
+        self.embedding = embedding
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self._embed_batch = embed_batch or (
+            lambda texts: embed_queries(embedding, texts)
+        )
+
+        # Queries waiting to be embedded, with their future and enqueue time
+        self._queue: "queue.Queue[Tuple[str, Future, float]]" = queue.Queue()
+        threading.Thread(
+            target=self._run, name="embedding-micro-batcher", daemon=True
+        ).start()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed documents. Documents already come in batches, so they are
+        embedded directly.
+
+        Args:
+            texts (List[str]): The texts to embed
+
+        Returns:
+            List[List[float]]: The embedding of each text
+        """
+        return self.embedding.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embed a query together with the queries received at the same time
+
+        Args:
+            text (str): The query to embed
+
+        Returns:
+            List[float]: The embedding of the query
+        """
+        with trace_span("query_embedding", batched=True):
+            future: Future = Future()
+            self._queue.put((text, future, time.perf_counter()))
+
+            return future.result()
+
+    def _next_batch(self) -> List[Tuple[str, Future, float]]:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_seconds
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                # Past the deadline, only take the queries already waiting
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+
+            start = time.perf_counter()
+            for _, _, enqueued_at in batch:
+                batch_wait_histogram.observe(start - enqueued_at)
+            batch_size_histogram.observe(len(batch))
+            batch_fill_histogram.observe(len(batch) / self.max_batch_size)
+
+            try:
+                embeddings = self._embed_batch([text for text, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future, _), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
+
+
+class PrecomputedEmbeddings(Embeddings):
+    """
+    Embeddings looked up from the embeddings of texts computed beforehand,
+    e.g., in bulk by the encode pool, falling back to the embedding model for
+    the other texts
+    """
+
+    def __init__(self, embedding: Embeddings, embeddings: Dict[str, List[float]]):
+        """
+        Args:
+            embedding (Embeddings):
+                The embedding model
+            embeddings (Dict[str, List[float]]):
+                The embedding of each text computed beforehand
+        """
+        self.embedding = embedding
+        self._embeddings = embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed documents
+
+        Args:
+            texts (List[str]): The texts to embed
+
+        Returns:
+            List[List[float]]: The embedding of each text
+        """
+        missing_texts = [
+            text for text in dict.fromkeys(texts) if text not in self._embeddings
+        ]
+        if missing_texts:
+            self._embeddings.update(
+                zip(missing_texts, self.embedding.embed_documents(missing_texts))
+            )
+
+        return [self._embeddings[text] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embed a query
+
+        Args:
+            text (str): The query to embed
+
+        Returns:
+            List[float]: The embedding of the query
+        """
+        return self.embedding.embed_query(text)
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a Unix domain socket"""
+
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class RemoteEmbeddings(Embeddings):
+    """
+    Embeddings computed by the embedding server (see `embedding_server.py`),
+    so that all app processes of a node share a single copy of the model. Each
+    thread keeps its own connection alive to the server.
+    """
+
+    def __init__(self, url: str, timeout: float = 60.0, batch_size: int = 1024):
+        """
+        Args:
+            url (str):
+                The URL of the embedding server, either `http://host:port` or
+                `unix:///path/to/socket`
+            timeout (float):
+                Seconds to wait for the server to respond. Defaults to `60.0`.
+            batch_size (int):
+                Maximum number of documents embedded per request. Defaults to
+                `1024`.
+        """
+        parsed_url = urlsplit(url)
+        if parsed_url.scheme == "unix":
+            self._socket_path: Optional[str] = parsed_url.path
+            self._host, self._port = None, None
+        elif parsed_url.scheme == "http":
+            self._socket_path = None
+            self._host, self._port = parsed_url.hostname, parsed_url.port or 80
+        else:
+            raise ValueError(f"Unsupported embedding server URL: {url}")
+
+        self.url = url
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self._local = threading.local()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed documents
+
+        Args:
+            texts (List[str]): The texts to embed
+
+        Returns:
+            List[List[float]]: The embedding of each text
+        """
+        embeddings = []
+        for i in range(0, len(texts), self.batch_size):
+            batch = texts[i : i + self.batch_size]
+            embeddings.extend(
+                self._post("/embed_documents", {"texts": batch})["embeddings"]
+            )
+
+        return embeddings
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embed a query
+
+        Args:
+            text (str): The query to embed
+
+        Returns:
+            List[float]: The embedding of the query
+        """
+        with trace_span("query_embedding", remote=True):
+            return self._post("/embed_query", {"text": text})["embedding"]
+
+    def health(self) -> Dict[str, Any]:
+        """
+        Get the status of the server and the spec of its embedding model
+
+        Returns:
+            Dict[str, Any]: The status, model name, dimension and normalization
+        """
+        return self._request("GET", "/health")
+
+    def _connection(self) -> http.client.HTTPConnection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            if self._socket_path is not None:
+                connection = _UnixHTTPConnection(self._socket_path, self.timeout)
+            else:
+                connection = http.client.HTTPConnection(
+                    self._host, self._port, timeout=self.timeout
+                )
+            self._local.connection = connection
+
+        return connection
+
+    def _post(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return self._request("POST", path, json.dumps(payload).encode())
+
+    def _request(
+        self, method: str, path: str, body: Optional[bytes] = None
+    ) -> Dict[str, Any]:
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+
+        # Retry once since the server may have closed an idle connection
+        for attempt in range(2):
+            connection = self._connection()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (ConnectionError, http.client.HTTPException) as e:
+                connection.close()
+                self._local.connection = None
+                if attempt == 1:
+                    raise e
+                continue
+
+            if response.status != 200:
+                raise RuntimeError(
+                    f"Embedding server error {response.status}: {data.decode()}"
+                )
+
+            return json.loads(data)
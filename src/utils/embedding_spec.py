@@ -0,0 +1,168 @@
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Engine,
+    Integer,
+    String,
+    Table,
+    and_,
+    delete,
+    insert,
+    select,
+)
+
+from utils.database import metadata
+
+# Each row records the embedding model a namespace of a Pinecone index was
+# built with, since vectors of different models cannot be compared
+embedding_specs_table = Table(
+    "embedding_specs",
+    metadata,
+    Column("index_name", String, primary_key=True),
+    Column("namespace", String, primary_key=True),
+    Column("model_name", String, nullable=False),
+    Column("dimension", Integer, nullable=False),
+    Column("normalize", Boolean, nullable=False),
+)
+
+
+@dataclass(frozen=True)
+class EmbeddingSpec:
+    """
+    The embedding model the vectors of a namespace are computed with
+
+    Attributes:
+        model_name (str): The name of the embedding model
+        dimension (int): The dimension of the embeddings
+        normalize (bool): Whether the embeddings are normalized
+    """
+
+    model_name: str
+    dimension: int
+    normalize: bool
+
+
+class EmbeddingSpecMismatchError(ValueError):
+    """
+    Raised when a namespace was built with another embedding model than the
+    configured one
+    """
+
+    def __init__(
+        self,
+        index_name: str,
+        namespace: str,
+        recorded_spec: EmbeddingSpec,
+        configured_spec: EmbeddingSpec,
+    ):
+        self.index_name = index_name
+        self.namespace = namespace
+        self.recorded_spec = recorded_spec
+        self.configured_spec = configured_spec
+        super().__init__(
+            f"Namespace {namespace} of index {index_name} was built with "
+            f"{recorded_spec}, but the embedding model is {configured_spec}. "
+            "Migrate the namespace with `python -m scripts.migrate_embeddings`."
+        )
+
+
+class IndexDimensionMismatchError(EmbeddingSpecMismatchError):
+    """
+    Raised when a Pinecone index has another dimension than the embeddings of
+    the configured model, so that none of its namespaces can be used
+    """
+
+    def __init__(self, index_name: str, index_dimension: int, spec: EmbeddingSpec):
+        self.index_name = index_name
+        self.index_dimension = index_dimension
+        self.configured_spec = spec
+        ValueError.__init__(
+            self,
+            f"Index {index_name} has dimension {index_dimension}, but "
+            f"{spec.model_name} embeddings have dimension {spec.dimension}. "
+            "Set VECTOR_DB_INDEX_NAME to a new index and migrate the namespaces "
+            "with `python -m scripts.migrate_embeddings`.",
+        )
+
+
+class EmbeddingSpecStore:
+    """Store of the embedding model of each namespace of the Pinecone indexes"""
+
+    def __init__(self, engine: Engine):
+        """
+        Args:
+            engine (Engine): The engine of the database storing the specs
+        """
+        self._engine = engine
+
+    def get(self, index_name: str, namespace: str) -> Optional[EmbeddingSpec]:
+        """
+        Get the embedding spec of a namespace
+
+        Args:
+            index_name (str): The name of the Pinecone index
+            namespace (str): The Pinecone namespace
+
+        Returns:
+            Optional[EmbeddingSpec]: The spec, or None if not recorded
+        """
+        table = embedding_specs_table
+        with self._engine.connect() as conn:
+            row = conn.execute(
+                select(table).where(
+                    and_(
+                        table.c.index_name == index_name, table.c.namespace == namespace
+                    )
+                )
+            ).first()
+
+        if row is None:
+            return None
+
+        return EmbeddingSpec(
+            model_name=row.model_name, dimension=row.dimension, normalize=row.normalize
+        )
+
+    def set(self, index_name: str, namespace: str, spec: EmbeddingSpec):
+        """
+        Record the embedding spec of a namespace
+
+        Args:
+            index_name (str): The name of the Pinecone index
+            namespace (str): The Pinecone namespace
+            spec (EmbeddingSpec): The embedding spec of the namespace
+        """
+        with self._engine.begin() as conn:
+            self._delete(conn, index_name, namespace)
+            conn.execute(
+                insert(embedding_specs_table).values(
+                    index_name=index_name,
+                    namespace=namespace,
+                    model_name=spec.model_name,
+                    dimension=spec.dimension,
+                    normalize=spec.normalize,
+                )
+            )
+
+    def delete(self, index_name: str, namespace: str):
+        """
+        Forget the embedding spec of a namespace, e.g., when it is deleted
+
+        Args:
+            index_name (str): The name of the Pinecone index
+            namespace (str): The Pinecone namespace
+        """
+        with self._engine.begin() as conn:
+            self._delete(conn, index_name, namespace)
+
+    @staticmethod
+    def _delete(conn, index_name: str, namespace: str):
+        table = embedding_specs_table
+        conn.execute(
+            delete(table).where(
+                and_(table.c.index_name == index_name, table.c.namespace == namespace)
+            )
+        )
@@ -0,0 +1,187 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from utils.embedding import create_embedding_model
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# The embedding model of the worker process
+_worker_embedding: Optional[Embeddings] = None
+
+
+def _initialize_worker(worker_counter, threads_per_worker: int):
+    """
+    Pin the worker process to its own cores, limit its threads, and load the
+    embedding model
+
+    Args:
+        worker_counter (multiprocessing.Value):
+            Counter shared by the workers to assign them distinct cores
+        threads_per_worker (int):
+            Number of threads (and cores) of the worker
+    """
+    global _worker_embedding
+
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[variable] = str(threads_per_worker)
+    # The worker is already one of many parallel encoders
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+    with worker_counter.get_lock():
+        worker_index = worker_counter.value
+        worker_counter.value += 1
+
+    if hasattr(os, "sched_setaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+        start = worker_index * threads_per_worker % len(cores)
+        os.sched_setaffinity(0, cores[start : start + threads_per_worker] or cores)
+
+    import torch
+
+    torch.set_num_threads(threads_per_worker)
+    torch.set_num_interop_threads(1)
+
+    _worker_embedding = create_embedding_model()
+
+
+def _embed_shard(texts: List[str]) -> List[List[float]]:
+    return _worker_embedding.embed_documents(texts)
+
+
+class EncodePool(Embeddings):
+    """
+    Embeddings computed by a pool of worker processes, each holding a copy of
+    the embedding model and a fixed number of cores, to saturate the cores of
+    a node on bulk ingestion. Documents are split into shards embedded in
+    parallel and reassembled in order. The workers are stopped after being
+    idle for a while to release their memory.
+    """
+
+    def __init__(
+        self,
+        num_workers: int = 0,
+        threads_per_worker: int = 2,
+        shard_size: int = 64,
+        idle_seconds: float = 300.0,
+    ):
+        """
+        Args:
+            num_workers (int):
+                Number of worker processes. Defaults to `0`, which starts one
+                worker per `threads_per_worker` cores.
+            threads_per_worker (int):
+                Number of threads (and cores) per worker. Defaults to `2`.
+            shard_size (int):
+                Number of documents embedded per forward pass of a worker.
+                Defaults to `64`.
+            idle_seconds (float):
+                Seconds after which the idle workers are stopped. Defaults to
+                `300.0`.
+        """
+        cpu_count = (
+            len(os.sched_getaffinity(0))
+            if hasattr(os, "sched_getaffinity")
+            else os.cpu_count()
+        )
+        self.num_workers = num_workers or max(1, cpu_count // threads_per_worker)
+        self.threads_per_worker = threads_per_worker
+        self.shard_size = shard_size
+        self.idle_seconds = idle_seconds
+
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._active_jobs = 0
+        self._idle_timer: Optional[threading.Timer] = None
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed documents in parallel in the worker processes
+
+        Args:
+            texts (List[str]): The texts to embed
+
+        Returns:
+            List[List[float]]: The embedding of each text
+        """
+        if not texts:
+            return []
+
+        shards = [
+            texts[i : i + self.shard_size]
+            for i in range(0, len(texts), self.shard_size)
+        ]
+
+        executor = self._acquire()
+        try:
+            # `map` returns the results in the order of the shards
+            embeddings = executor.map(_embed_shard, shards)
+            return [embedding for shard in embeddings for embedding in shard]
+        finally:
+            self._release()
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embed a query. Queries should be embedded by the model of the app
+        process instead of the pool.
+
+        Args:
+            text (str): The query to embed
+
+        Returns:
+            List[float]: The embedding of the query
+        """
+        return self.embed_documents([text])[0]
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        with self._lock:
+            self._shutdown()
+
+    def _acquire(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._idle_timer is not None:
+                self._idle_timer.cancel()
+                self._idle_timer = None
+
+            if self._executor is None:
+                logger.info("*" * 100)
+                logger.info(
+                    f"Starting {self.num_workers} embedding workers with "
+                    f"{self.threads_per_worker} threads each"
+                )
+                logger.info("*" * 100)
+
+                # Forking a process using torch threads can deadlock
+                context = multiprocessing.get_context("spawn")
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.num_workers,
+                    mp_context=context,
+                    initializer=_initialize_worker,
+                    initargs=(context.Value("i", 0), self.threads_per_worker),
+                )
+
+            self._active_jobs += 1
+            return self._executor
+
+    def _release(self):
+        with self._lock:
+            self._active_jobs -= 1
+            if self._active_jobs == 0 and self._executor is not None:
+                self._idle_timer = threading.Timer(self.idle_seconds, self.shutdown)
+                self._idle_timer.daemon = True
+                self._idle_timer.start()
+
+    def _shutdown(self):
+        if self._active_jobs or self._executor is None:
+            return
+
+        logger.info("Stopping the idle embedding workers")
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
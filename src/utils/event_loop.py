@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Generic, Iterator, Optional, TypeVar
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_event_loop: Optional[asyncio.AbstractEventLoop] = None
+_event_loop_lock = threading.Lock()
+
+# Marker put in the queue of a stream after its last chunk
+_END = object()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Get the process-wide event loop running the asynchronous work of all
+    sessions (e.g., the streaming of the chat answers) in a background thread,
+    starting it on first use
+
+    Returns:
+        asyncio.AbstractEventLoop: The shared event loop
+    """
+    global _event_loop
+
+    with _event_loop_lock:
+        if _event_loop is None:
+            _event_loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_event_loop.run_forever, name="shared-event-loop", daemon=True
+            ).start()
+
+        return _event_loop
+
+
+class AsyncStream(Generic[T]):
+    """
+    Synchronous iterator over an asynchronous iterator consumed on the shared
+    event loop, e.g., to pass `Runnable.astream()` to `st.write_stream()`. The
+    consumption is cancelled when the stream is cancelled or closed before its
+    end, so that an abandoned generation stops.
+    """
+
+    def __init__(self, async_iterator: AsyncIterator[T]):
+        """
+        Args:
+            async_iterator (AsyncIterator[T]): The asynchronous iterator
+        """
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._future: Future = asyncio.run_coroutine_threadsafe(
+            self._consume(async_iterator), get_event_loop()
+        )
+        # Unblock the consumer if cancelled before the consumption started
+        self._future.add_done_callback(
+            lambda future: self._queue.put(_END) if future.cancelled() else None
+        )
+
+    def __iter__(self) -> Iterator[T]:
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _END:
+                    return
+                if isinstance(item, _StreamError):
+                    raise item.error
+                yield item
+        finally:
+            # Stop the generation if the consumer stopped early, e.g., when
+            # Streamlit interrupts the script for a rerun
+            self.cancel()
+
+    def cancel(self):
+        """Cancel the consumption of the asynchronous iterator"""
+        if not self._future.done():
+            self._future.cancel()
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether the stream was cancelled before its end"""
+        return self._future.cancelled()
+
+    async def _consume(self, async_iterator: AsyncIterator[T]):
+        try:
+            async for item in async_iterator:
+                self._queue.put(item)
+        except asyncio.CancelledError:
+            logger.info("Stream cancelled")
+            raise
+        except Exception as e:
+            self._queue.put(_StreamError(e))
+        finally:
+            self._queue.put(_END)
+            if hasattr(async_iterator, "aclose"):
+                await async_iterator.aclose()
+
+
+class _StreamError:
+    """An exception raised by the asynchronous iterator of a stream"""
+
+    def __init__(self, error: Exception):
+        self.error = error
@@ -1,27 +1,58 @@
 import base64
+import hashlib
 import json
 import logging
 import secrets
 import string
-from pathlib import Path
-from typing import Dict, Iterator, Optional, Union
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import cache
+from pathlib import Path, PurePosixPath
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
 import firebase_admin
+import google.auth.credentials
 import requests
-from firebase_admin import auth, credentials, storage
+from firebase_admin import _token_gen, auth, credentials
 from firebase_admin.exceptions import FirebaseError
-from google.cloud.storage import Blob
+from google.api_core.exceptions import NotFound
+from google.auth.transport.requests import AuthorizedSession
+from google.cloud import storage
+from google.cloud.storage import Blob, Bucket
 from google_auth_oauthlib import flow
 from streamlit.runtime.uploaded_file_manager import UploadedFile
 from streamlit_oauth import OAuth2Component
 
 from configuration import settings
+from utils.cache import TTLCache
+from utils.content_index import ContentIndex
+from utils.database import get_database_engine
+from utils.http import get_http_client
+from utils.metrics import get_histogram
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-
-FIREBASE_AUTH_BASE_URL = "https://identitytoolkit.googleapis.com/v1/accounts:"
+# Caches of the verified ID tokens and of the user records so that reruns and
+# page reloads do not verify the same token and fetch the same user again
+_decoded_token_cache: TTLCache[dict] = TTLCache(
+    maxsize=settings.USER_CACHE_MAXSIZE,
+    ttl_seconds=settings.USER_CACHE_TTL_SECONDS,
+    name="decoded_tokens",
+)
+_user_cache: TTLCache[auth.UserRecord] = TTLCache(
+    maxsize=settings.USER_CACHE_MAXSIZE,
+    ttl_seconds=settings.USER_CACHE_TTL_SECONDS,
+    name="users",
+)
+_public_keys_warmer_started = threading.Event()
+
+storage_request_duration = get_histogram(
+    "gcs_request_duration_seconds",
+    "Latency of the Cloud Storage requests per method and status",
+    label_names=("method", "status"),
+)
 
 
 def initialize_firebase_app(firebase_service_account: Dict[str, str]):
@@ -43,6 +74,108 @@ def initialize_firebase_app(firebase_service_account: Dict[str, str]):
         logging.info(firebase_admin._apps)
         logging.info("*" * 100)
 
+        start_public_keys_warmer()
+
+
+@cache
+def _get_storage_client() -> storage.Client:
+    """
+    Create the Cloud Storage client of the Firebase app. All its requests
+    (including uploads and downloads) go through an HTTP session given to the
+    client, which records their latency.
+
+    Returns:
+        storage.Client: The Cloud Storage client
+    """
+    app = firebase_admin.get_app()
+    google_credentials = google.auth.credentials.with_scopes_if_required(
+        app.credential.get_credential(), storage.Client.SCOPE
+    )
+
+    session = AuthorizedSession(google_credentials)
+    session.hooks["response"].append(_observe_storage_response)
+
+    return storage.Client(
+        project=app.project_id, credentials=google_credentials, _http=session
+    )
+
+
+def get_bucket() -> Bucket:
+    """
+    Get the Firebase Storage bucket of the app
+
+    Returns:
+        Bucket: The bucket `settings.FIREBASE_STORAGE_BUCKET_NAME`
+    """
+    return _get_storage_client().bucket(settings.FIREBASE_STORAGE_BUCKET_NAME)
+
+
+def _observe_storage_response(response: requests.Response, *args, **kwargs):
+    # `elapsed` is the time until the response headers were received
+    storage_request_duration.observe(
+        response.elapsed.total_seconds(),
+        method=response.request.method,
+        status=response.status_code,
+    )
+
+
+def warm_up_public_keys() -> bool:
+    """
+    Fetch the Google public keys used to verify the ID tokens into the HTTP
+    cache of the Firebase Admin SDK, so that verifying a token never waits for
+    them. The keys are cached for as long as Google allows (several hours).
+
+    The Firebase Admin SDK has no public API for this, so its internals are
+    used (as of the pinned firebase-admin version). If they are missing, the
+    keys are not warmed up and verifying a token fetches them as usual.
+
+    Returns:
+        bool: Whether the keys can be warmed up with this SDK version
+    """
+    # The token verifier of the Firebase Admin SDK caches the keys with respect
+    # to the cache-control headers of the response
+    get_client = getattr(auth, "_get_client", None)
+    cert_uri = getattr(_token_gen, "ID_TOKEN_CERT_URI", None)
+    try:
+        token_verifier = getattr(
+            get_client(firebase_admin.get_app()) if get_client else None,
+            "_token_verifier",
+            None,
+        )
+        request = getattr(token_verifier, "request", None)
+        if request is None or cert_uri is None:
+            logger.warning("*" * 100)
+            logger.warning(
+                "The Google public keys cannot be warmed up with this version of "
+                "firebase-admin: they are fetched when verifying a token"
+            )
+            logger.warning("*" * 100)
+            return False
+
+        request(url=cert_uri, method="GET")
+    except Exception as e:
+        logger.error("*" * 100)
+        logger.error(f"Error warming up the Google public keys: {e}")
+        logger.error("*" * 100)
+
+    return True
+
+
+def start_public_keys_warmer():
+    """
+    Start a background thread keeping the Google public keys warm, once per
+    process
+    """
+    if _public_keys_warmer_started.is_set():
+        return
+    _public_keys_warmer_started.set()
+
+    def keep_warm():
+        while warm_up_public_keys():
+            time.sleep(settings.PUBLIC_KEYS_REFRESH_SECONDS)
+
+    threading.Thread(target=keep_warm, name="public-keys-warmer", daemon=True).start()
+
 
 def create_new_user(email: str, password: str, name: str):
     """
@@ -106,13 +239,25 @@ def authenticate_user_with_password(
                 registered (bool):
                     Whether the email is for an existing account.
     """
-    url = f"{FIREBASE_AUTH_BASE_URL}signInWithPassword?key={settings.FIREBASE_API_KEY}"
+    url = (
+        f"{settings.FIREBASE_AUTH_BASE_URL}signInWithPassword"
+        f"?key={settings.FIREBASE_API_KEY}"
+    )
     body = {
         "email": email,
         "password": password,
         "returnSecureToken": True,
     }
-    response = requests.post(url=url, json=body)
+    try:
+        response = get_http_client().post(
+            url=url, endpoint="signInWithPassword", json=body
+        )
+    except requests.RequestException as e:
+        logger.error("*" * 100)
+        logger.error(f"Error authenticating user with password: {e}")
+        logger.error("*" * 100)
+        return None
+
     if response.status_code != 200:
         logger.error("*" * 100)
         logger.error(f"Error authenticating user with password: {response.json()}")
@@ -122,6 +267,105 @@ def authenticate_user_with_password(
     return response.json()
 
 
+def sign_in_with_custom_token(uid: str) -> Optional[Dict[str, Union[str, bool]]]:
+    """
+    Sign a user in with a custom token minted by the Firebase Admin SDK, to get
+    Firebase Auth ID and refresh tokens for users who did not log in with a
+    password (e.g., with Google or right after registering)
+    https://firebase.google.com/docs/reference/rest/auth#section-verify-custom-token
+
+    Args:
+        uid (str):
+            The UID of the user to sign in
+
+    Returns:
+        Optional[Dict[str, Union[str, bool]]]:
+            If there is an error, return None. Otherwise, return the JSON
+            response containing `idToken`, `refreshToken`, and `expiresIn`,
+            along with the `localId` of the user.
+    """
+    url = (
+        f"{settings.FIREBASE_AUTH_BASE_URL}signInWithCustomToken"
+        f"?key={settings.FIREBASE_API_KEY}"
+    )
+    body = {
+        "token": auth.create_custom_token(uid).decode(),
+        "returnSecureToken": True,
+    }
+    try:
+        response = get_http_client().post(
+            url=url, endpoint="signInWithCustomToken", json=body
+        )
+    except requests.RequestException as e:
+        logger.error("*" * 100)
+        logger.error(f"Error signing in with custom token: {e}")
+        logger.error("*" * 100)
+        return None
+
+    if response.status_code != 200:
+        logger.error("*" * 100)
+        logger.error(f"Error signing in with custom token: {response.json()}")
+        logger.error("*" * 100)
+        return None
+
+    return {"localId": uid, **response.json()}
+
+
+def refresh_id_token(refresh_token: str) -> Optional[Dict[str, str]]:
+    """
+    Exchange a refresh token for a new ID token using Firebase Authentication
+    REST API
+    https://firebase.google.com/docs/reference/rest/auth#section-refresh-token
+
+    Args:
+        refresh_token (str):
+            A Firebase Auth refresh token
+
+    Returns:
+        Optional[Dict[str, str]]:
+            If the refresh token is rejected (e.g., it expired, or the user is
+            disabled or deleted), return None. Otherwise, return the JSON
+            response containing the following:
+                id_token (str):
+                    A new Firebase Auth ID token.
+                refresh_token (str):
+                    The Firebase Auth refresh token to use next time.
+                expires_in (str):
+                    The number of seconds in which the ID token expires.
+                user_id (str):
+                    The uid of the user.
+
+    Raises:
+        requests.RequestException:
+            If the token service cannot be reached or fails (e.g., a timeout
+            or a 5xx response), in which case the refresh token may still be
+            valid
+    """
+    url = f"{settings.FIREBASE_SECURE_TOKEN_URL}?key={settings.FIREBASE_API_KEY}"
+    body = {
+        "grant_type": "refresh_token",
+        "refresh_token": refresh_token,
+    }
+    try:
+        response = get_http_client().post(url=url, endpoint="token", data=body)
+        # Only a client error is a rejection of the refresh token
+        if response.status_code == 429 or response.status_code >= 500:
+            response.raise_for_status()
+    except requests.RequestException as e:
+        logger.error("*" * 100)
+        logger.error(f"Error refreshing ID token: {e}")
+        logger.error("*" * 100)
+        raise e
+
+    if response.status_code != 200:
+        logger.error("*" * 100)
+        logger.error(f"Refresh token rejected: {response.json()}")
+        logger.error("*" * 100)
+        return None
+
+    return response.json()
+
+
 def authenticate_user_with_google_oidc(
     auth_code: str,
     google_oidc_client_secret: Dict[str, str],
@@ -158,10 +402,15 @@ def authenticate_user_with_google_oidc(
 
     # Obtain Google user info
     credentials = google_flow.credentials
-    google_user = requests.get(
-        "https://openidconnect.googleapis.com/v1/userinfo",
-        headers={"Authorization": f"Bearer {credentials.token}"},
-    ).json()
+    google_user = (
+        get_http_client()
+        .get(
+            settings.GOOGLE_OIDC_USERINFO_URL,
+            endpoint="userinfo",
+            headers={"Authorization": f"Bearer {credentials.token}"},
+        )
+        .json()
+    )
 
     # Firebase Authentication: Create a custom token
     firebase_token = auth.create_custom_token(google_user["sub"])
@@ -277,6 +526,10 @@ def get_user_by_token(id_token: str) -> Optional[auth.UserRecord]:
     Get the user information:
     https://firebase.google.com/docs/reference/admin/python/firebase_admin.auth#:~:text=the%20SAML%20provider.-,get_user,-(uid)
 
+    The verified tokens and the user information are cached for a short time
+    (`settings.USER_CACHE_TTL_SECONDS`) to avoid repeating the round trips on
+    every rerun.
+
     Args:
         id_token (str): The JWT token presenting the user
 
@@ -286,8 +539,20 @@ def get_user_by_token(id_token: str) -> Optional[auth.UserRecord]:
             https://firebase.google.com/docs/reference/admin/python/firebase_admin.auth#firebase_admin.auth.UserRecord:~:text=class%20firebase_admin.auth.UserRecord(data)
     """
     try:
-        decoded_token = auth.verify_id_token(id_token=id_token, clock_skew_seconds=5)
-        user = auth.get_user(decoded_token["uid"])
+        decoded_token = _decoded_token_cache.get(id_token)
+        if decoded_token is None:
+            decoded_token = auth.verify_id_token(
+                id_token=id_token, clock_skew_seconds=5
+            )
+            # A verified token stays valid until it expires
+            _decoded_token_cache.set(
+                id_token, decoded_token, ttl_seconds=decoded_token["exp"] - time.time()
+            )
+
+        user = _user_cache.get(decoded_token["uid"])
+        if user is None:
+            user = auth.get_user(decoded_token["uid"])
+            _user_cache.set(user.uid, user)
     except Exception as e:
         logger.error("*" * 100)
         logger.error(f"Error getting user from token: {e}")
@@ -340,6 +605,7 @@ def update_user_info_by_email(email: str, **kwargs) -> auth.UserRecord:
         user = get_user_by_email(email)
         if user:
             updated_user = auth.update_user(user.uid, **kwargs)
+            _user_cache.pop(user.uid)
         else:
             logger.error("*" * 100)
             logger.error(f"User with email {email} does not exist.")
@@ -364,12 +630,20 @@ def reset_password(email: str):
         email (str):
             The email address to send the password reset email to
     """
-    url = f"{FIREBASE_AUTH_BASE_URL}sendOobCode?key={settings.FIREBASE_API_KEY}"
+    url = (
+        f"{settings.FIREBASE_AUTH_BASE_URL}sendOobCode"
+        f"?key={settings.FIREBASE_API_KEY}"
+    )
     body = {
         "requestType": "PASSWORD_RESET",
         "email": email,
     }
-    response = requests.post(url=url, json=body)
+    try:
+        response = get_http_client().post(url=url, endpoint="sendOobCode", json=body)
+    except requests.RequestException as e:
+        logger.error(f"Error sending password reset email: {e}")
+        return
+
     if response.status_code != 200:
         logger.error(f"Error sending password reset email: {response.json()}")
 
@@ -378,7 +652,8 @@ def reset_password(email: str):
 
 def delete_user_by_uid(uid: str):
     """
-    Function to delete a user from Firebase Authentication using the user's UID
+    Function to delete a user from Firebase Authentication using the user's UID.
+    A user that does not exist (e.g., already deleted) counts as deleted.
 
     Args:
         uid (str):
@@ -390,6 +665,9 @@ def delete_user_by_uid(uid: str):
     """
     try:
         auth.delete_user(uid)
+        _user_cache.pop(uid)
+    except auth.UserNotFoundError:
+        _user_cache.pop(uid)
     except Exception as e:
         logger.error("*" * 100)
         logger.error(f"Error deleting user: {e}")
@@ -413,7 +691,7 @@ def get_file_from_storage(remote_path: str) -> Blob:
             If the file exists in the given remote_path, return the download URL
             of the file. Otherwise, return None.
     """
-    bucket = storage.bucket()
+    bucket = get_bucket()
     blob = bucket.blob(remote_path)
 
     return blob if blob.exists() else None
@@ -446,7 +724,7 @@ def get_blobs_in_folder_from_storage(
             Return an iterator of blobs (files and/or folders) in the given
             folder_path
     """
-    bucket = storage.bucket()
+    bucket = get_bucket()
     # If folder_path is empty, list all files in the root directory
     if folder_path == "":
         prefix = ""
@@ -485,40 +763,388 @@ def create_folder_in_storage(folder_path: str):
     Args:
         folder_path (str): Path to the folder in Firebase Storage
     """
-    bucket = storage.bucket()
+    bucket = get_bucket()
     blob = bucket.blob(folder_path.rstrip("/") + "/")
     blob.upload_from_string("")
 
 
-def upload_file_to_storage(uploaded_file: UploadedFile | Path, remote_path: str):
+class DuplicateFileError(ValueError):
+    """Raised when uploading a file whose content already exists in storage"""
+
+    def __init__(self, remote_path: str, existing_path: str):
+        self.remote_path = remote_path
+        self.existing_path = existing_path
+        super().__init__(
+            f"'{remote_path}' has the same content as the existing file "
+            f"'{existing_path}'"
+        )
+
+
+@cache
+def get_content_index() -> ContentIndex:
+    """
+    Get the process-wide index of the content hash of the files in storage
+
+    Returns:
+        ContentIndex: The content index
+    """
+    return ContentIndex(get_database_engine())
+
+
+def get_namespace_of_path(remote_path: str) -> str:
+    """
+    Get the namespace (i.e., the user's root folder) a path in storage belongs
+    to
+
+    Args:
+        remote_path (str): Path to a file or folder in Firebase Storage
+
+    Returns:
+        str: The namespace of the path
+    """
+    return PurePosixPath(remote_path).parts[0]
+
+
+def compute_file_sha256(uploaded_file: UploadedFile | Path) -> str:
+    """
+    Function to compute the SHA-256 hash of the content of a file
+
+    Args:
+        uploaded_file (UploadedFile | Path):
+            File uploaded from Streamlit app or path to a local file
+
+    Returns:
+        str: The hexadecimal SHA-256 hash of the file content
+    """
+    if isinstance(uploaded_file, UploadedFile):
+        return hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+
+    sha256 = hashlib.sha256()
+    with open(uploaded_file, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(chunk)
+
+    return sha256.hexdigest()
+
+
+def _release_from_content_index(remote_paths: List[str]) -> List[str]:
+    """
+    Remove files from the content index before they are deleted or
+    overwritten. If a file holds content that other files are aliases of, the
+    content is copied (server-side) to the first alias, which then holds the
+    content, and the other aliases are re-pointed to it.
+
+    Args:
+        remote_paths (List[str]):
+            Paths to the files in Firebase Storage, all in the same namespace
+
+    Returns:
+        List[str]:
+            The paths to the promoted aliases, which have no vectors of their
+            own until they are indexed
+    """
+    if not remote_paths:
+        return []
+
+    bucket = get_bucket()
+    namespace = get_namespace_of_path(remote_paths[0])
+    promotions = get_content_index().remove(namespace, remote_paths)
+
+    for canonical, (promoted, repointed) in promotions.items():
+        # The copy carries the metadata of the file holding the content, which
+        # does not have the `alias_of` key
+        bucket.copy_blob(bucket.blob(canonical), bucket, promoted)
+
+        for alias_path in repointed:
+            alias_blob = bucket.blob(alias_path)
+            alias_blob.metadata = {"alias_of": promoted}
+            alias_blob.patch()
+
+        logger.info("*" * 100)
+        logger.info(f"Promoted '{promoted}' to hold the content of '{canonical}'")
+        logger.info("*" * 100)
+
+    return [promoted for promoted, _ in promotions.values()]
+
+
+def resolve_alias(blob: Blob) -> Blob:
+    """
+    Function to get the file holding the content of a file in storage. Files
+    uploaded with the same content as an existing file are stored as aliases
+    pointing to it.
+
+    Args:
+        blob (Blob): The file in Firebase Storage
+
+    Returns:
+        Blob:
+            The file holding the content: the file itself if it is not an
+            alias, otherwise the file it is an alias of
+    """
+    alias_of = (blob.metadata or {}).get("alias_of")
+    if not alias_of:
+        return blob
+
+    return get_file_from_storage(alias_of) or blob
+
+
+def upload_file_to_storage(
+    uploaded_file: UploadedFile | Path, remote_path: str
+) -> Tuple[Blob, List[str]]:
     """
-    Function to upload file to Firebase Storage
+    Function to upload file to Firebase Storage. The SHA-256 hash of the
+    content is computed at upload time and recorded in the content index of
+    the namespace. If the same content already exists under another path, the
+    file is either rejected or stored as an empty alias pointing to the
+    existing file (depending on `settings.DUPLICATE_UPLOAD_POLICY`), so that
+    the content is never stored or embedded twice.
+
+    The content is registered in the content index only once it is stored, so
+    that an alias never points to a file whose upload failed or is still in
+    progress.
 
     Args:
         uploaded_file (UploadedFile):
             File to be uploaded from Streamlit app
         remote_path (str):
             Path to the location in Firebase Storage to store the file
+
+    Returns:
+        Tuple[Blob, List[str]]:
+            The uploaded file (or the alias if the content already exists),
+            and the paths to the aliases of the overwritten file promoted to
+            hold its previous content, which must be indexed with the file
+
+    Raises:
+        DuplicateFileError:
+            If the content already exists and duplicates are rejected
     """
-    bucket = storage.bucket()
+    bucket = get_bucket()
     blob = bucket.blob(remote_path)
-    if isinstance(uploaded_file, UploadedFile):
-        blob.upload_from_file(uploaded_file, content_type=uploaded_file.type)
+
+    sha256 = compute_file_sha256(uploaded_file)
+    namespace = get_namespace_of_path(remote_path)
+    content_index = get_content_index()
+    alias = settings.DUPLICATE_UPLOAD_POLICY == "alias"
+
+    # Overwriting a file with different content must not break its aliases. If
+    # the upload then fails, the promoted aliases are indexed by the next sync.
+    promoted_paths = []
+    if (entry := content_index.get(namespace, remote_path)) and entry[0] != sha256:
+        promoted_paths = _release_from_content_index([remote_path])
+
+    # The content of a known duplicate is not uploaded at all
+    existing_path = content_index.register(
+        namespace, remote_path, sha256, alias=alias, new_content=False
+    )
+    if existing_path is not None and not alias:
+        raise DuplicateFileError(remote_path, existing_path)
+
+    if existing_path is None:
+        blob.metadata = {"sha256": sha256}
+        if isinstance(uploaded_file, UploadedFile):
+            uploaded_file.seek(0)
+            blob.upload_from_file(uploaded_file, content_type=uploaded_file.type)
+        else:
+            blob.upload_from_filename(uploaded_file)
+
+        existing_path = content_index.register(
+            namespace, remote_path, sha256, alias=alias
+        )
+        if existing_path is None:
+            return blob, promoted_paths
+
+        # Another upload of the same content registered it first
+        if not alias:
+            blob.delete()
+            raise DuplicateFileError(remote_path, existing_path)
+
+    blob.metadata = {"sha256": sha256, "alias_of": existing_path}
+    blob.upload_from_string(b"", content_type="application/pdf")
+
+    logger.info("*" * 100)
+    logger.info(f"Stored '{remote_path}' as an alias of '{existing_path}'")
+    logger.info("*" * 100)
+
+    return blob, promoted_paths
+
+
+def upload_files_to_storage(
+    files: List[Tuple[UploadedFile | Path, str]],
+    max_workers: Optional[int] = None,
+) -> Iterator[Tuple[str, List[str], Optional[Exception]]]:
+    """
+    Function to upload multiple files to Firebase Storage concurrently. The
+    results are yielded as soon as each upload finishes so that the caller can
+    report progress per file.
+
+    Args:
+        files (List[Tuple[UploadedFile | Path, str]]):
+            Pairs of the file to be uploaded and the path to the location in
+            Firebase Storage to store the file
+        max_workers (Optional[int]):
+            Maximum number of concurrent uploads. Defaults to
+            `settings.UPLOAD_MAX_WORKERS`.
+
+    Returns:
+        Iterator[Tuple[str, List[str], Optional[Exception]]]:
+            Return an iterator of the remote path of each file, the paths to
+            the files promoted to hold the content it overwrote (see
+            `upload_file_to_storage`), and the error raised while uploading it
+            (None if the upload succeeded), in the order the uploads finish
+    """
+    if not files:
+        return
+
+    max_workers = max_workers or settings.UPLOAD_MAX_WORKERS
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(files))) as executor:
+        futures = {
+            executor.submit(upload_file_to_storage, uploaded_file, remote_path): (
+                remote_path
+            )
+            for uploaded_file, remote_path in files
+        }
+
+        for future in as_completed(futures):
+            remote_path = futures[future]
+            try:
+                _, promoted_paths = future.result()
+            except Exception as e:
+                logger.error("*" * 100)
+                logger.error(f"Error uploading file '{remote_path}': {e}")
+                logger.error("*" * 100)
+                yield remote_path, [], e
+            else:
+                yield remote_path, promoted_paths, None
+
+
+def move_blob_in_storage(source_path: str, destination_path: str) -> Dict[str, str]:
+    """
+    Function to move or rename a file or folder (recursively) in Firebase
+    Storage. The files are copied server-side, so no content goes through the
+    app, and the originals are deleted once every copy succeeded. The content
+    index is updated along with the files.
+    https://cloud.google.com/python/docs/reference/storage/latest/google.cloud.storage.bucket.Bucket#google_cloud_storage_bucket_Bucket_copy_blob
+
+    Args:
+        source_path (str):
+            Path to the file or folder in Firebase Storage. Folders end with "/"
+        destination_path (str):
+            The new path of the file or folder
+
+    Returns:
+        Dict[str, str]:
+            The old path to the new path of each moved file (folders excluded)
+
+    Raises:
+        FileNotFoundError: If there is nothing to move at `source_path`
+        FileExistsError: If a file already exists at one of the new paths
+        ValueError: If a folder is moved into itself
+    """
+    bucket = get_bucket()
+
+    if source_path.endswith("/"):
+        destination_prefix = destination_path.rstrip("/") + "/"
+        if destination_prefix.startswith(source_path):
+            raise ValueError(f"Cannot move '{source_path}' into itself")
+
+        moves = {
+            blob.name: destination_prefix + blob.name[len(source_path) :]
+            for blob in bucket.list_blobs(prefix=source_path)
+        }
+        existing_paths = {
+            blob.name for blob in bucket.list_blobs(prefix=destination_prefix)
+        }
     else:
-        blob.upload_from_filename(uploaded_file)
+        moves = (
+            {source_path: destination_path} if bucket.blob(source_path).exists() else {}
+        )
+        existing_paths = (
+            {destination_path} if get_file_from_storage(destination_path) else set()
+        )
+
+    if not moves:
+        raise FileNotFoundError(f"'{source_path}' does not exist")
+
+    # Moving a folder into an existing folder merges them, but files are never
+    # overwritten
+    if conflicts := [
+        path
+        for path in moves.values()
+        if path in existing_paths and not path.endswith("/")
+    ]:
+        raise FileExistsError(f"Files already exist: {conflicts}")
+
+    with ThreadPoolExecutor(
+        max_workers=min(settings.UPLOAD_MAX_WORKERS, len(moves))
+    ) as executor:
+        # Copy everything first to leave the originals intact if a copy fails
+        list(
+            executor.map(
+                lambda move: bucket.copy_blob(bucket.blob(move[0]), bucket, move[1]),
+                moves.items(),
+            )
+        )
+
+        file_moves = {
+            old_path: new_path
+            for old_path, new_path in moves.items()
+            if not old_path.endswith("/")
+        }
+        if file_moves:
+            namespace = get_namespace_of_path(source_path)
+            repointed = get_content_index().move(namespace, file_moves)
+
+            # The copies of the aliases still point to the old paths
+            for alias_path, alias_of in repointed.items():
+                alias_blob = bucket.blob(alias_path)
+                alias_blob.metadata = {"alias_of": alias_of}
+                alias_blob.patch()
+
+        list(executor.map(lambda old_path: bucket.blob(old_path).delete(), moves))
+
+    logger.info("*" * 100)
+    logger.info(f"Moved '{source_path}' to '{destination_path}'")
+    logger.info("*" * 100)
+
+    return file_moves
 
 
 def delete_blob_from_storage(remote_path: str):
     """
-    Function to delete a file or folder from Firebase Storage
+    Function to delete a file or folder from Firebase Storage. The files are
+    deleted concurrently, and files already deleted (e.g., by an interrupted
+    call being retried) are skipped.
     https://cloud.google.com/python/docs/reference/storage/latest/google.cloud.storage.blob.Blob#google_cloud_storage_blob_Blob_delete
 
     Args:
         remote_path (str):
-            Path to the file or folder in Firebase Storage
+            Path to the file or folder in Firebase Storage. Folders end with "/"
     """
-    bucket = storage.bucket()
-    blobs: Iterator[Blob] = bucket.list_blobs(prefix=remote_path)
+    bucket = get_bucket()
+    if remote_path.endswith("/"):
+        blobs: List[Blob] = list(bucket.list_blobs(prefix=remote_path))
+    else:
+        # Only the file itself, not the files whose name starts with its name
+        # (e.g., "a.pdf.bak")
+        blobs = [bucket.blob(remote_path)]
+    if not blobs:
+        return
+
+    # Keep the content of the deleted files that other files are aliases of. The
+    # promoted files are indexed by the full sync that follows the deletion.
+    _release_from_content_index(
+        [blob.name for blob in blobs if not blob.name.endswith("/")]
+    )
+
+    def delete_blob(blob: Blob):
+        try:
+            blob.delete()
+        except NotFound:
+            pass
 
-    for blob in blobs:
-        blob.delete()
+    with ThreadPoolExecutor(
+        max_workers=min(settings.UPLOAD_MAX_WORKERS, len(blobs))
+    ) as executor:
+        list(executor.map(delete_blob, blobs))
@@ -0,0 +1,202 @@
+import logging
+import random
+import threading
+import time
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from configuration import settings
+from utils.metrics import get_histogram
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Status codes for which the request is retried since the server did not
+# process it (rate limited or temporarily unavailable)
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+# Methods that are safe to retry after a read timeout, when it is unknown
+# whether the server processed the request
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+request_duration = get_histogram(
+    "http_client_request_duration_seconds",
+    "Latency of the outgoing HTTP requests per endpoint and status",
+    label_names=("endpoint", "status"),
+)
+
+
+class HttpClient:
+    """
+    HTTP client keeping connections alive in a pool shared by all threads, with
+    timeouts, bounded retries with jittered exponential backoff, and latency
+    metrics per endpoint.
+    """
+
+    def __init__(
+        self,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 10.0,
+        max_retries: int = 2,
+        backoff_seconds: float = 0.25,
+        max_backoff_seconds: float = 4.0,
+        pool_maxsize: int = 20,
+    ):
+        """
+        Args:
+            connect_timeout (float):
+                Seconds to wait for the connection to be established. Defaults
+                to `3.05`.
+            read_timeout (float):
+                Seconds to wait for the server to send a response. Defaults to
+                `10.0`.
+            max_retries (int):
+                Maximum number of retries after the first attempt. Defaults to
+                `2`.
+            backoff_seconds (float):
+                Base of the exponential backoff between retries. Defaults to
+                `0.25`.
+            max_backoff_seconds (float):
+                Maximum backoff between retries. Defaults to `4.0`.
+            pool_maxsize (int):
+                Maximum number of connections kept alive per host. Defaults to
+                `20`.
+        """
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+
+        self._session = requests.Session()
+        # Retries are handled by the client to add jitter and metrics
+        adapter = HTTPAdapter(pool_maxsize=pool_maxsize, max_retries=0)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+    def request(
+        self, method: str, url: str, endpoint: Optional[str] = None, **kwargs
+    ) -> requests.Response:
+        """
+        Send a request, retrying on connection errors and retryable status
+        codes
+
+        Args:
+            method (str):
+                The HTTP method
+            url (str):
+                The URL to send the request to
+            endpoint (Optional[str]):
+                The name of the endpoint in the metrics. Defaults to the URL
+                without its query string.
+            **kwargs:
+                Any other argument of `requests.Session.request`
+
+        Returns:
+            requests.Response:
+                The response of the last attempt
+
+        Raises:
+            requests.RequestException:
+                If the last attempt failed without a response
+        """
+        method = method.upper()
+        endpoint = endpoint or url.split("?")[0]
+        kwargs.setdefault("timeout", self.timeout)
+
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                response = self._session.request(method, url, **kwargs)
+            except requests.RequestException as e:
+                request_duration.observe(
+                    time.perf_counter() - start, endpoint=endpoint, status="error"
+                )
+                # A read timeout may happen after the server processed the
+                # request, so only retry if doing it twice is harmless
+                retryable = isinstance(e, requests.ConnectionError) or (
+                    isinstance(e, requests.Timeout) and method in IDEMPOTENT_METHODS
+                )
+                if not retryable or attempt == self.max_retries:
+                    raise e
+
+                logger.warning(f"Retrying {method} {endpoint} after error: {e}")
+            else:
+                request_duration.observe(
+                    time.perf_counter() - start,
+                    endpoint=endpoint,
+                    status=str(response.status_code),
+                )
+                if (
+                    response.status_code not in RETRYABLE_STATUS_CODES
+                    or attempt == self.max_retries
+                ):
+                    return response
+
+                logger.warning(
+                    f"Retrying {method} {endpoint} after status "
+                    f"{response.status_code}"
+                )
+
+            # Full jitter to avoid synchronized retries across clients
+            time.sleep(
+                random.uniform(
+                    0,
+                    min(self.max_backoff_seconds, self.backoff_seconds * 2**attempt),
+                )
+            )
+
+    def get(self, url: str, endpoint: Optional[str] = None, **kwargs):
+        """Send a GET request. See `HttpClient.request`."""
+        return self.request("GET", url, endpoint=endpoint, **kwargs)
+
+    def post(self, url: str, endpoint: Optional[str] = None, **kwargs):
+        """Send a POST request. See `HttpClient.request`."""
+        return self.request("POST", url, endpoint=endpoint, **kwargs)
+
+    def close(self):
+        """Close the pooled connections"""
+        self._session.close()
+
+
+_http_client: Optional[HttpClient] = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    """
+    Get the process-wide HTTP client, creating it from the settings on first use
+
+    Returns:
+        HttpClient: The shared HTTP client
+    """
+    global _http_client
+
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = HttpClient(
+                connect_timeout=settings.HTTP_CONNECT_TIMEOUT_SECONDS,
+                read_timeout=settings.HTTP_READ_TIMEOUT_SECONDS,
+                max_retries=settings.HTTP_MAX_RETRIES,
+                backoff_seconds=settings.HTTP_BACKOFF_SECONDS,
+                pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+            )
+
+        return _http_client
+
+
+def set_http_client(http_client: HttpClient):
+    """
+    Replace the process-wide HTTP client, e.g., with one whose settings point
+    to a local stub server in tests
+
+    Args:
+        http_client (HttpClient): The HTTP client to use from now on
+    """
+    global _http_client
+
+    with _http_client_lock:
+        previous_client, _http_client = _http_client, http_client
+
+    if previous_client is not None and previous_client is not http_client:
+        previous_client.close()
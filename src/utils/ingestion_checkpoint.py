@@ -0,0 +1,198 @@
+from typing import Dict, List, Tuple
+
+from sqlalchemy import (
+    Column,
+    Engine,
+    Float,
+    String,
+    Table,
+    and_,
+    delete,
+    insert,
+    select,
+)
+
+from utils.database import metadata
+
+# Each row is a full ingestion job of a record manager namespace that has not
+# completed yet. The start time is the time of the record manager: the records
+# not updated since then are deleted by the cleanup once every file is indexed.
+ingestion_jobs_table = Table(
+    "ingestion_jobs",
+    metadata,
+    Column("namespace", String, primary_key=True),
+    Column("started_at", Float, nullable=False),
+)
+
+# Each row is a file indexed into a record manager namespace: the version of
+# the blob that was indexed, and the start time of the job that indexed it (or
+# found it unchanged)
+ingestion_files_table = Table(
+    "ingestion_files",
+    metadata,
+    Column("namespace", String, primary_key=True),
+    Column("remote_path", String, primary_key=True),
+    Column("version", String, nullable=False),
+    Column("job_started_at", Float, nullable=False),
+)
+
+# Maximum number of paths per SQL statement to stay under the limit of bound
+# parameters of the database
+BATCH_SIZE = 500
+
+
+class IngestionCheckpointStore:
+    """
+    Durable checkpoints of the full ingestion jobs, so that a job interrupted
+    by a restart resumes with the files it has not indexed yet, and the full
+    cleanup of the namespace only runs after a complete pass over its files.
+    """
+
+    def __init__(self, engine: Engine):
+        """
+        Args:
+            engine (Engine): The engine of the database storing the checkpoints
+        """
+        self._engine = engine
+
+    def start(self, namespace: str, now: float) -> float:
+        """
+        Start a full ingestion job, or resume the job that did not complete
+
+        Args:
+            namespace (str): The record manager namespace
+            now (float): The current time of the record manager
+
+        Returns:
+            float: The start time of the job
+        """
+        table = ingestion_jobs_table
+        with self._engine.begin() as conn:
+            started_at = conn.execute(
+                select(table.c.started_at).where(table.c.namespace == namespace)
+            ).scalar()
+            if started_at is not None:
+                return started_at
+
+            conn.execute(insert(table).values(namespace=namespace, started_at=now))
+
+        return now
+
+    def get_files(self, namespace: str) -> Dict[str, Tuple[str, float]]:
+        """
+        Get the files indexed into a namespace
+
+        Args:
+            namespace (str): The record manager namespace
+
+        Returns:
+            Dict[str, Tuple[str, float]]:
+                The version of each file and the start time of the job that
+                indexed it
+        """
+        table = ingestion_files_table
+        with self._engine.connect() as conn:
+            rows = conn.execute(
+                select(
+                    table.c.remote_path, table.c.version, table.c.job_started_at
+                ).where(table.c.namespace == namespace)
+            ).all()
+
+        return {path: (version, started_at) for path, version, started_at in rows}
+
+    def mark_indexed(
+        self, namespace: str, versions: Dict[str, str], job_started_at: float
+    ):
+        """
+        Record that files are indexed by a job, in a single transaction
+
+        Args:
+            namespace (str):
+                The record manager namespace
+            versions (Dict[str, str]):
+                The indexed version of each file
+            job_started_at (float):
+                The start time of the job
+        """
+        table = ingestion_files_table
+        paths = list(versions)
+
+        with self._engine.begin() as conn:
+            for i in range(0, len(paths), BATCH_SIZE):
+                batch = paths[i : i + BATCH_SIZE]
+                conn.execute(
+                    delete(table).where(
+                        and_(
+                            table.c.namespace == namespace,
+                            table.c.remote_path.in_(batch),
+                        )
+                    )
+                )
+                conn.execute(
+                    insert(table),
+                    [
+                        {
+                            "namespace": namespace,
+                            "remote_path": path,
+                            "version": versions[path],
+                            "job_started_at": job_started_at,
+                        }
+                        for path in batch
+                    ],
+                )
+
+    def forget_files(self, namespace: str, remote_paths: List[str]):
+        """
+        Forget that files are indexed, so that the job (even once resumed)
+        indexes them again
+
+        Args:
+            namespace (str): The record manager namespace
+            remote_paths (List[str]): The paths to the files
+        """
+        table = ingestion_files_table
+        with self._engine.begin() as conn:
+            for i in range(0, len(remote_paths), BATCH_SIZE):
+                conn.execute(
+                    delete(table).where(
+                        and_(
+                            table.c.namespace == namespace,
+                            table.c.remote_path.in_(remote_paths[i : i + BATCH_SIZE]),
+                        )
+                    )
+                )
+
+    def finish(self, namespace: str, job_started_at: float):
+        """
+        Complete a full ingestion job after its cleanup, forgetting the files
+        it did not find
+
+        Args:
+            namespace (str): The record manager namespace
+            job_started_at (float): The start time of the job
+        """
+        with self._engine.begin() as conn:
+            conn.execute(
+                delete(ingestion_files_table).where(
+                    and_(
+                        ingestion_files_table.c.namespace == namespace,
+                        ingestion_files_table.c.job_started_at != job_started_at,
+                    )
+                )
+            )
+            conn.execute(
+                delete(ingestion_jobs_table).where(
+                    ingestion_jobs_table.c.namespace == namespace
+                )
+            )
+
+    def delete(self, namespace: str):
+        """
+        Forget the job and files of a namespace, e.g., when it is deleted
+
+        Args:
+            namespace (str): The record manager namespace
+        """
+        with self._engine.begin() as conn:
+            for table in (ingestion_files_table, ingestion_jobs_table):
+                conn.execute(delete(table).where(table.c.namespace == namespace))
@@ -0,0 +1,312 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, Literal, Optional
+
+from utils.metrics import get_counter, get_gauge, get_histogram
+from utils.rate_limit import TokenBucket
+
+# Interactive jobs (uploads a user waits for) are dispatched before bulk jobs
+# (full syncs and backfills)
+Priority = Literal["interactive", "bulk"]
+PRIORITIES = ("interactive", "bulk")
+
+wait_histogram = get_histogram(
+    "ingestion_wait_seconds",
+    "Time the ingestion jobs wait for a slot, per priority",
+    label_names=("priority",),
+)
+tenant_wait_counter = get_counter(
+    "ingestion_tenant_wait_seconds_total",
+    "Total time the ingestion jobs of each tenant waited for a slot",
+    label_names=("namespace",),
+)
+tenant_jobs_counter = get_counter(
+    "ingestion_tenant_jobs_total",
+    "Ingestion jobs dispatched per tenant and priority",
+    label_names=("namespace", "priority"),
+)
+tenant_queue_gauge = get_gauge(
+    "ingestion_tenant_queue_depth",
+    "Ingestion jobs of each tenant waiting for a slot",
+    label_names=("namespace",),
+)
+queued_gauge = get_gauge(
+    "ingestion_jobs_queued",
+    "Ingestion jobs waiting for a slot, per priority",
+    label_names=("priority",),
+)
+running_gauge = get_gauge("ingestion_jobs_running", "Ingestion jobs in progress")
+quota_counter = get_counter(
+    "ingestion_quota_exceeded_total",
+    "Ingestion work rejected since a tenant exceeded a quota, per quota",
+    label_names=("namespace", "quota"),
+)
+
+
+class IngestionQuotaExceededError(RuntimeError):
+    """Raised when a tenant has indexed too many pages or chunks in the last
+    hour to index more within the time the job can wait"""
+
+
+class _Ticket:
+    """An ingestion job waiting for a slot"""
+
+    def __init__(self, namespace: str, priority: Priority):
+        self.namespace = namespace
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.event = threading.Event()
+
+
+class IngestionScheduler:
+    """
+    Scheduler of the ingestion jobs of the process, sharing the embedding CPU
+    and the Pinecone write capacity fairly between the tenants (namespaces).
+
+    A bounded number of jobs run at once, and at most a few per tenant. The
+    waiting jobs are queued per priority and tenant: interactive jobs are
+    dispatched before bulk jobs (with one bulk job every few interactive ones
+    so that bulk jobs are not starved), and the tenants of a priority take
+    turns (round-robin), so a tenant with many jobs does not delay the others.
+    The pages and chunks indexed per tenant are also limited per hour.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_jobs: int,
+        max_jobs_per_tenant: int = 1,
+        interactive_weight: int = 4,
+        pages_per_hour: Optional[float] = None,
+        chunks_per_hour: Optional[float] = None,
+        quota_max_wait_seconds: Optional[Dict[Priority, float]] = None,
+    ):
+        """
+        Args:
+            max_concurrent_jobs (int):
+                Maximum number of jobs in progress
+            max_jobs_per_tenant (int):
+                Maximum number of jobs in progress per tenant. Defaults to `1`.
+            interactive_weight (int):
+                Number of interactive jobs dispatched before a bulk job when
+                both are waiting. Defaults to `4`.
+            pages_per_hour (Optional[float]):
+                Maximum number of pages a tenant indexes per hour. Defaults to
+                unlimited.
+            chunks_per_hour (Optional[float]):
+                Maximum number of chunks a tenant indexes per hour. Defaults to
+                unlimited.
+            quota_max_wait_seconds (Optional[Dict[Priority, float]]):
+                Time the jobs of each priority wait for the quotas before
+                failing. Defaults to no wait.
+        """
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.max_jobs_per_tenant = max_jobs_per_tenant
+        self.interactive_weight = interactive_weight
+        self.pages_per_hour = pages_per_hour
+        self.chunks_per_hour = chunks_per_hour
+        self.quota_max_wait_seconds = quota_max_wait_seconds or {}
+
+        self._lock = threading.Lock()
+        # Priority -> tenant -> waiting jobs, with the tenants in turn order
+        self._queues: Dict[str, "OrderedDict[str, Deque[_Ticket]]"] = {
+            priority: OrderedDict() for priority in PRIORITIES
+        }
+        self._running = 0
+        self._running_per_tenant: Dict[str, int] = {}
+        # Interactive jobs dispatched in a row while bulk jobs were waiting
+        self._interactive_streak = 0
+        # Tenant -> quota -> bucket
+        self._buckets: Dict[str, Dict[str, TokenBucket]] = {}
+        # Jobs of the current thread, so that nested jobs share their slot
+        self._local = threading.local()
+
+    @contextmanager
+    def slot(self, namespace: str, priority: Priority = "bulk") -> Iterator[None]:
+        """
+        Context manager running an ingestion job of a tenant once it is
+        dispatched. A job nested in another job of the same tenant in the
+        current thread (e.g., a full sync requested by a reindex run) runs in
+        the slot of the outer job.
+
+        Args:
+            namespace (str): The namespace the job indexes into
+            priority (Priority): The priority of the job. Defaults to "bulk".
+        """
+        jobs = self._jobs()
+        if namespace in jobs:
+            yield
+            return
+
+        self._acquire(namespace, priority)
+        jobs[namespace] = priority
+        tenant_jobs_counter.inc(namespace=namespace, priority=priority)
+        try:
+            yield
+        finally:
+            del jobs[namespace]
+            self._release(namespace)
+
+    def charge(self, namespace: str, pages: int = 0, chunks: int = 0):
+        """
+        Charge pages and chunks to the hourly quotas of a tenant, from its job
+        in progress in the current thread. When the quotas are used up, the job
+        waits for them for up to the maximum wait of its priority (short for
+        interactive jobs, so that a user is told right away).
+
+        Args:
+            namespace (str): The namespace the job indexes into
+            pages (int): The number of pages indexed. Defaults to `0`.
+            chunks (int): The number of chunks indexed. Defaults to `0`.
+
+        Raises:
+            IngestionQuotaExceededError:
+                If the quotas cannot be charged within the maximum wait
+        """
+        priority = self._jobs().get(namespace, "bulk")
+        max_wait_seconds = self.quota_max_wait_seconds.get(priority, 0.0)
+        wait_seconds = 0.0
+        reserved = []
+
+        for quota, amount, per_hour in (
+            ("pages", pages, self.pages_per_hour),
+            ("chunks", chunks, self.chunks_per_hour),
+        ):
+            if not per_hour or amount <= 0:
+                continue
+
+            bucket = self._bucket(namespace, quota, per_hour)
+            quota_wait = bucket.reserve(amount, max_wait_seconds)
+            if quota_wait is None:
+                for reserved_bucket, reserved_amount in reserved:
+                    reserved_bucket.refund(reserved_amount)
+                quota_counter.inc(namespace=namespace, quota=quota)
+                raise IngestionQuotaExceededError(
+                    f"Namespace {namespace} exceeded its quota of {per_hour:g} "
+                    f"{quota} per hour"
+                )
+
+            reserved.append((bucket, amount))
+            wait_seconds = max(wait_seconds, quota_wait)
+
+        # The job keeps its slot while it waits, since it may hold the lock of
+        # its namespace, but the tenant cannot take more slots than its limit
+        time.sleep(wait_seconds)
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of jobs waiting for a slot, across all priorities"""
+        with self._lock:
+            return sum(
+                len(tickets)
+                for queue in self._queues.values()
+                for tickets in queue.values()
+            )
+
+    def _jobs(self) -> Dict[str, Priority]:
+        """The namespace and priority of the jobs of the current thread"""
+        if not hasattr(self._local, "jobs"):
+            self._local.jobs = {}
+
+        return self._local.jobs
+
+    def _bucket(self, namespace: str, quota: str, per_hour: float) -> TokenBucket:
+        with self._lock:
+            buckets = self._buckets.setdefault(namespace, {})
+            if quota not in buckets:
+                buckets[quota] = TokenBucket(per_hour / 60, capacity=per_hour)
+
+            return buckets[quota]
+
+    def _acquire(self, namespace: str, priority: Priority):
+        """Wait for a slot"""
+        ticket = _Ticket(namespace, priority)
+        with self._lock:
+            self._queues[priority].setdefault(namespace, deque()).append(ticket)
+            self._dispatch()
+            self._update_gauges(namespace)
+
+        ticket.event.wait()
+
+        wait_seconds = time.monotonic() - ticket.enqueued_at
+        wait_histogram.observe(wait_seconds, priority=priority)
+        tenant_wait_counter.inc(wait_seconds, namespace=namespace)
+
+    def _release(self, namespace: str):
+        """Give back a slot and dispatch the next jobs"""
+        with self._lock:
+            self._running -= 1
+            self._running_per_tenant[namespace] -= 1
+            if not self._running_per_tenant[namespace]:
+                del self._running_per_tenant[namespace]
+            self._dispatch()
+            self._update_gauges(namespace)
+
+    def _dispatch(self):
+        """Dispatch waiting jobs while there are free slots. Called with the
+        lock held."""
+        while self._running < self.max_concurrent_jobs:
+            ticket = self._next_ticket()
+            if ticket is None:
+                return
+
+            self._running += 1
+            self._running_per_tenant[ticket.namespace] = (
+                self._running_per_tenant.get(ticket.namespace, 0) + 1
+            )
+            self._update_gauges(ticket.namespace)
+            ticket.event.set()
+
+    def _next_ticket(self) -> Optional[_Ticket]:
+        """Take the next job to dispatch: the priority is chosen by weight,
+        then the first tenant in turn order below its concurrency limit"""
+        candidates = {
+            priority: self._first_eligible_tenant(priority) for priority in PRIORITIES
+        }
+        if candidates["interactive"] is not None and (
+            candidates["bulk"] is None
+            or self._interactive_streak < self.interactive_weight
+        ):
+            priority = "interactive"
+            self._interactive_streak += candidates["bulk"] is not None
+        elif candidates["bulk"] is not None:
+            priority = "bulk"
+            self._interactive_streak = 0
+        else:
+            return None
+
+        queue = self._queues[priority]
+        namespace = candidates[priority]
+        ticket = queue[namespace].popleft()
+        # The tenant goes to the end of the turn order
+        if queue[namespace]:
+            queue.move_to_end(namespace)
+        else:
+            del queue[namespace]
+
+        return ticket
+
+    def _first_eligible_tenant(self, priority: str) -> Optional[str]:
+        for namespace in self._queues[priority]:
+            if self._running_per_tenant.get(namespace, 0) < self.max_jobs_per_tenant:
+                return namespace
+
+        return None
+
+    def _update_gauges(self, namespace: str):
+        """Called with the lock held"""
+        for priority in PRIORITIES:
+            queued_gauge.set(
+                sum(len(tickets) for tickets in self._queues[priority].values()),
+                priority=priority,
+            )
+        running_gauge.set(self._running)
+
+        tenant_queued = sum(
+            len(queue.get(namespace, ())) for queue in self._queues.values()
+        )
+        if tenant_queued:
+            tenant_queue_gauge.set(tenant_queued, namespace=namespace)
+        else:
+            tenant_queue_gauge.remove(namespace=namespace)
@@ -0,0 +1,198 @@
+import asyncio
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models import BaseChatModel, LangSmithParams
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from pydantic import ConfigDict, model_validator
+
+from utils.metrics import get_histogram
+from utils.rate_limit import Admission, AdmissionController, LLMTimeoutError
+
+# Approximate number of characters per token to estimate the prompt size
+CHARS_PER_TOKEN = 4
+
+call_histogram = get_histogram(
+    "llm_call_seconds",
+    "Duration of the LLM calls including the admission, per tier and model",
+    label_names=("tier", "model"),
+)
+first_token_histogram = get_histogram(
+    "llm_time_to_first_token_seconds",
+    "Time to the first chunk of the streamed LLM calls, per tier and model",
+    label_names=("tier", "model"),
+)
+
+
+class RateLimitedChatModel(BaseChatModel):
+    """
+    Chat model whose calls to the wrapped model go through an admission
+    controller: the calls wait for a concurrency slot and the rate limits, are
+    rejected when the queue is too deep, and fail when their deadline passes.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    # The wrapped chat model
+    model: BaseChatModel
+    # The admission controller shared by the calls to the API of the model
+    admission_controller: AdmissionController
+    # Number of output tokens reserved per call before the usage is known
+    estimated_output_tokens: int = 512
+    # The step of the RAG chain the model is used for (e.g., "rewrite" or
+    # "answer"), to report the latency per tier
+    tier: str = "answer"
+
+    @model_validator(mode="after")
+    def _set_tier_metadata(self) -> "RateLimitedChatModel":
+        # Tell the callbacks (e.g., the tracer of the turn) the tier of the runs
+        self.metadata = {**(self.metadata or {}), "tier": self.tier}
+        return self
+
+    @property
+    def _llm_type(self) -> str:
+        return f"rate-limited-{self.model._llm_type}"
+
+    def _get_ls_params(
+        self, stop: Optional[List[str]] = None, **kwargs: Any
+    ) -> LangSmithParams:
+        return self.model._get_ls_params(stop=stop, **kwargs)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        with call_histogram.time(**self._labels()):
+            with self.admission_controller.admit(
+                self._estimate_tokens(messages)
+            ) as admission:
+                result = self.model._generate(
+                    messages, stop=stop, run_manager=run_manager, **kwargs
+                )
+                admission.check_deadline()
+
+                usage = result.generations[0].message.usage_metadata
+                self._refund_unused_tokens(admission, usage)
+
+                return result
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        with call_histogram.time(**self._labels()):
+            async with self.admission_controller.aadmit(
+                self._estimate_tokens(messages)
+            ) as admission:
+                try:
+                    result = await asyncio.wait_for(
+                        self.model._agenerate(
+                            messages, stop=stop, run_manager=run_manager, **kwargs
+                        ),
+                        admission.remaining_seconds(),
+                    )
+                except asyncio.TimeoutError:
+                    raise LLMTimeoutError(
+                        "The LLM call did not complete before its deadline"
+                    )
+
+                usage = result.generations[0].message.usage_metadata
+                self._refund_unused_tokens(admission, usage)
+
+                return result
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        start = time.perf_counter()
+        with call_histogram.time(**self._labels()):
+            with self.admission_controller.admit(
+                self._estimate_tokens(messages)
+            ) as admission:
+                usage = None
+                first = True
+                for chunk in self.model._stream(
+                    messages, stop=stop, run_manager=run_manager, **kwargs
+                ):
+                    if first:
+                        first_token_histogram.observe(
+                            time.perf_counter() - start, **self._labels()
+                        )
+                        first = False
+                    # A blocking call cannot be interrupted, so the deadline is
+                    # checked between the chunks
+                    admission.check_deadline()
+                    usage = getattr(chunk.message, "usage_metadata", None) or usage
+                    yield chunk
+
+                self._refund_unused_tokens(admission, usage)
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        start = time.perf_counter()
+        with call_histogram.time(**self._labels()):
+            async with self.admission_controller.aadmit(
+                self._estimate_tokens(messages)
+            ) as admission:
+                usage = None
+                chunks = self.model._astream(
+                    messages, stop=stop, run_manager=run_manager, **kwargs
+                )
+                first = True
+                try:
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(
+                                chunks.__anext__(), admission.remaining_seconds()
+                            )
+                        except StopAsyncIteration:
+                            break
+                        except asyncio.TimeoutError:
+                            raise LLMTimeoutError(
+                                "The LLM call did not complete before its deadline"
+                            )
+
+                        if first:
+                            first_token_histogram.observe(
+                                time.perf_counter() - start, **self._labels()
+                            )
+                            first = False
+                        usage = getattr(chunk.message, "usage_metadata", None) or usage
+                        yield chunk
+                finally:
+                    await chunks.aclose()
+
+                self._refund_unused_tokens(admission, usage)
+
+    def _labels(self) -> Dict[str, str]:
+        return {"tier": self.tier, "model": self.admission_controller.name}
+
+    def _estimate_tokens(self, messages: List[BaseMessage]) -> int:
+        prompt_chars = sum(len(str(message.content)) for message in messages)
+        return prompt_chars // CHARS_PER_TOKEN + self.estimated_output_tokens
+
+    def _refund_unused_tokens(self, admission: Admission, usage: Optional[dict]):
+        if usage and usage.get("total_tokens"):
+            self.admission_controller.refund_tokens(
+                admission.estimated_tokens - usage["total_tokens"]
+            )
@@ -0,0 +1,474 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import (
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
+
+# Content type of the Prometheus text exposition format
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Default buckets (in seconds) for latency histograms
+DEFAULT_LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+class _HistogramValues:
+    """The observations of a histogram for one combination of label values"""
+
+    def __init__(self, num_buckets: int):
+        self.bucket_counts: List[int] = [0] * (num_buckets + 1)
+        self.count = 0
+        self.sum = 0.0
+
+
+class Histogram:
+    """
+    A thread-safe histogram with fixed buckets, optionally split by labels.
+    Observations are counted in the first bucket whose upper bound is greater
+    than or equal to the value, the last bucket being `+Inf`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        description: str = "",
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+    ):
+        """
+        Args:
+            name (str):
+                The name of the metric
+            description (str):
+                The description of the metric. Defaults to `""`.
+            label_names (Sequence[str]):
+                The names of the labels to split the observations by. Defaults
+                to `()`.
+            buckets (Sequence[float]):
+                The sorted upper bounds of the buckets. Defaults to
+                `DEFAULT_LATENCY_BUCKETS`.
+        """
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], _HistogramValues] = {}
+
+    def observe(self, value: float, **labels: str):
+        """
+        Record an observation
+
+        Args:
+            value (float): The observed value
+            **labels (str): The value of each label of the histogram
+        """
+        key = tuple(str(labels[name]) for name in self.label_names)
+        index = bisect_left(self.buckets, value)
+
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = _HistogramValues(len(self.buckets))
+
+            values.bucket_counts[index] += 1
+            values.count += 1
+            values.sum += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """
+        Context manager recording the time spent in the block, in seconds
+
+        Args:
+            **labels (str): The value of each label of the histogram
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def collect(self) -> Dict[Tuple[str, ...], Dict[str, object]]:
+        """
+        Get a snapshot of the observations
+
+        Returns:
+            Dict[Tuple[str, ...], Dict[str, object]]:
+                For each combination of label values, the count and sum of the
+                observations and the non-cumulative count of each bucket
+        """
+        with self._lock:
+            return {
+                key: {
+                    "count": values.count,
+                    "sum": values.sum,
+                    "bucket_counts": list(values.bucket_counts),
+                }
+                for key, values in self._values.items()
+            }
+
+
+class Counter:
+    """A thread-safe counter that only goes up, optionally split by labels"""
+
+    def __init__(
+        self, name: str, description: str = "", label_names: Sequence[str] = ()
+    ):
+        """
+        Args:
+            name (str):
+                The name of the metric, ending with `_total` by convention
+            description (str):
+                The description of the metric. Defaults to `""`.
+            label_names (Sequence[str]):
+                The names of the labels to split the counts by. Defaults to
+                `()`.
+        """
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        """
+        Increment the counter
+
+        Args:
+            amount (float): The non-negative increment. Defaults to `1.0`.
+            **labels (str): The value of each label of the counter
+        """
+        key = tuple(str(labels[name]) for name in self.label_names)
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def collect(self) -> Dict[Tuple[str, ...], float]:
+        """
+        Get a snapshot of the counts
+
+        Returns:
+            Dict[Tuple[str, ...], float]:
+                The count of each combination of label values
+        """
+        with self._lock:
+            return dict(self._values)
+
+
+class Gauge:
+    """
+    A thread-safe value that goes up and down, optionally split by labels. An
+    unlabelled gauge can instead be computed by a function when collected,
+    e.g., the depth of a queue.
+    """
+
+    def __init__(
+        self, name: str, description: str = "", label_names: Sequence[str] = ()
+    ):
+        """
+        Args:
+            name (str):
+                The name of the metric
+            description (str):
+                The description of the metric. Defaults to `""`.
+            label_names (Sequence[str]):
+                The names of the labels to split the values by. Defaults to
+                `()`.
+        """
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels: str):
+        """
+        Set the value of the gauge
+
+        Args:
+            value (float): The value
+            **labels (str): The value of each label of the gauge
+        """
+        key = tuple(str(labels[name]) for name in self.label_names)
+
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        """
+        Increment the value of the gauge
+
+        Args:
+            amount (float): The increment. Defaults to `1.0`.
+            **labels (str): The value of each label of the gauge
+        """
+        key = tuple(str(labels[name]) for name in self.label_names)
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str):
+        """
+        Decrement the value of the gauge
+
+        Args:
+            amount (float): The decrement. Defaults to `1.0`.
+            **labels (str): The value of each label of the gauge
+        """
+        self.inc(-amount, **labels)
+
+    def remove(self, **labels: str):
+        """
+        Remove the value of a combination of labels, e.g., of a tenant that no
+        longer has anything queued, so that it is no longer exported
+
+        Args:
+            **labels (str): The value of each label of the gauge
+        """
+        key = tuple(str(labels[name]) for name in self.label_names)
+
+        with self._lock:
+            self._values.pop(key, None)
+
+    def set_function(self, function: Callable[[], float]):
+        """
+        Compute the value of an unlabelled gauge when it is collected
+
+        Args:
+            function (Callable[[], float]): The function returning the value
+        """
+        self._function = function
+
+    def collect(self) -> Dict[Tuple[str, ...], float]:
+        """
+        Get a snapshot of the values
+
+        Returns:
+            Dict[Tuple[str, ...], float]:
+                The value of each combination of label values
+        """
+        if self._function is not None:
+            try:
+                return {(): float(self._function())}
+            except Exception:
+                return {}
+
+        with self._lock:
+            return dict(self._values)
+
+
+Metric = Union[Histogram, Counter, Gauge]
+
+_registry_lock = threading.Lock()
+_registry: Dict[str, Metric] = {}
+
+
+def _get_metric(metric_class: Type[Metric], name: str, *args) -> Metric:
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = metric_class(name, *args)
+
+        metric = _registry[name]
+        if not isinstance(metric, metric_class):
+            raise ValueError(f"Metric {name} is already registered as a {type(metric)}")
+
+        return metric
+
+
+def get_histogram(
+    name: str,
+    description: str = "",
+    label_names: Sequence[str] = (),
+    buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+) -> Histogram:
+    """
+    Get the histogram registered with the given name, creating it on first use
+
+    Args:
+        name (str):
+            The name of the metric
+        description (str):
+            The description of the metric. Defaults to `""`.
+        label_names (Sequence[str]):
+            The names of the labels to split the observations by. Defaults to
+            `()`.
+        buckets (Sequence[float]):
+            The sorted upper bounds of the buckets. Defaults to
+            `DEFAULT_LATENCY_BUCKETS`.
+
+    Returns:
+        Histogram: The registered histogram
+    """
+    return _get_metric(Histogram, name, description, label_names, buckets)
+
+
+def get_counter(
+    name: str, description: str = "", label_names: Sequence[str] = ()
+) -> Counter:
+    """
+    Get the counter registered with the given name, creating it on first use
+
+    Args:
+        name (str):
+            The name of the metric
+        description (str):
+            The description of the metric. Defaults to `""`.
+        label_names (Sequence[str]):
+            The names of the labels to split the counts by. Defaults to `()`.
+
+    Returns:
+        Counter: The registered counter
+    """
+    return _get_metric(Counter, name, description, label_names)
+
+
+def get_gauge(
+    name: str, description: str = "", label_names: Sequence[str] = ()
+) -> Gauge:
+    """
+    Get the gauge registered with the given name, creating it on first use
+
+    Args:
+        name (str):
+            The name of the metric
+        description (str):
+            The description of the metric. Defaults to `""`.
+        label_names (Sequence[str]):
+            The names of the labels to split the values by. Defaults to `()`.
+
+    Returns:
+        Gauge: The registered gauge
+    """
+    return _get_metric(Gauge, name, description, label_names)
+
+
+def _format_labels(label_names: Sequence[str], label_values: Sequence[str]) -> str:
+    if not label_names:
+        return ""
+
+    pairs = ",".join(
+        f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)
+    )
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def render_prometheus() -> str:
+    """
+    Render the registered metrics in the Prometheus text exposition format
+
+    Returns:
+        str: The metrics, one sample per line
+    """
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda metric: metric.name)
+
+    lines = []
+    for metric in metrics:
+        metric_type = {Histogram: "histogram", Counter: "counter", Gauge: "gauge"}[
+            type(metric)
+        ]
+        lines.append(f"# HELP {metric.name} {_escape(metric.description)}")
+        lines.append(f"# TYPE {metric.name} {metric_type}")
+
+        for label_values, value in sorted(metric.collect().items()):
+            if not isinstance(metric, Histogram):
+                labels = _format_labels(metric.label_names, label_values)
+                lines.append(f"{metric.name}{labels} {_format_value(value)}")
+                continue
+
+            # The buckets of the exposition format are cumulative
+            cumulative_count = 0
+            for upper_bound, count in zip(
+                (*metric.buckets, float("inf")), value["bucket_counts"]
+            ):
+                cumulative_count += count
+                labels = _format_labels(
+                    (*metric.label_names, "le"),
+                    (*label_values, _format_value(upper_bound)),
+                )
+                lines.append(f"{metric.name}_bucket{labels} {cumulative_count}")
+
+            labels = _format_labels(metric.label_names, label_values)
+            lines.append(f"{metric.name}_sum{labels} {_format_value(value['sum'])}")
+            lines.append(f"{metric.name}_count{labels} {value['count']}")
+
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Serve the registered metrics at `/metrics`"""
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are too frequent to be logged
+        pass
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """
+    Serve the registered metrics for Prometheus to scrape on a side port, in a
+    background thread
+
+    Args:
+        port (int): The port to listen on
+        host (str): The address to listen on. Defaults to `"0.0.0.0"`.
+
+    Returns:
+        ThreadingHTTPServer: The metrics server
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(
+        target=server.serve_forever, name="metrics-server", daemon=True
+    ).start()
+
+    return server
@@ -0,0 +1,365 @@
+import hashlib
+import re
+from collections import defaultdict
+from typing import TYPE_CHECKING, Dict, Iterable, List, Set, Tuple
+
+from sqlalchemy import Column, Engine, String, Table, and_, delete, insert, or_, select
+
+from utils.database import metadata
+
+if TYPE_CHECKING:
+    import numpy as np
+    from langchain_core.documents import Document
+
+# Each row links two files of a namespace that share a chunk embedded once for
+# both: the vector belongs to (the record manager group of) one of them and
+# lists both in its `sources` metadata. Linked files are indexed together, so
+# that indexing or deleting one of them never drops a chunk of the other. The
+# links are stored in both directions.
+chunk_links_table = Table(
+    "chunk_links",
+    metadata,
+    Column("namespace", String, primary_key=True),
+    Column("source", String, primary_key=True),
+    Column("linked_source", String, primary_key=True),
+)
+
+# Maximum number of paths per SQL statement to stay under the limit of bound
+# parameters of the database
+BATCH_SIZE = 500
+
+# Words per shingle: chunks are compared as sets of overlapping word 5-grams
+SHINGLE_SIZE = 5
+# MinHash signature length, split into LSH bands of rows. Two chunks are
+# compared when their signatures agree on all rows of a band, which is likely
+# from a Jaccard similarity of about (1 / bands) ** (1 / rows) = 0.7.
+NUM_PERMUTATIONS = 128
+NUM_BANDS = 16
+ROWS_PER_BAND = NUM_PERMUTATIONS // NUM_BANDS
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_SEED = 1
+
+
+def _shingle_hashes(text: str) -> List[int]:
+    """The 32-bit hashes of the word shingles of a text, ignoring case,
+    punctuation, and whitespace"""
+    words = re.findall(r"\w+", text.lower())
+    shingles = {
+        " ".join(words[i : i + SHINGLE_SIZE])
+        for i in range(max(1, len(words) - SHINGLE_SIZE + 1))
+    }
+
+    # A stable hash (unlike `hash()`), so signatures agree across processes
+    return [
+        int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(), "little")
+        for s in shingles
+    ]
+
+
+def minhash_signatures(texts: List[str]) -> "np.ndarray":
+    """
+    Compute the MinHash signatures of texts: for each of `NUM_PERMUTATIONS`
+    random hash functions, the minimum hash of the shingles of the text. The
+    fraction of equal values of two signatures estimates the Jaccard
+    similarity of the shingles of the texts.
+
+    Args:
+        texts (List[str]): The texts
+
+    Returns:
+        np.ndarray: The signatures, one row per text
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(_SEED)
+    # a * x + b stays below 2 ** 64 for 32-bit values
+    a = rng.integers(1, _MAX_HASH, size=NUM_PERMUTATIONS, dtype=np.uint64)
+    b = rng.integers(0, _MAX_HASH, size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+    signatures = np.empty((len(texts), NUM_PERMUTATIONS), dtype=np.uint64)
+    for i, text in enumerate(texts):
+        hashes = np.array(_shingle_hashes(text), dtype=np.uint64)
+        permuted = (np.outer(hashes, a) + b) % _MERSENNE_PRIME & _MAX_HASH
+        signatures[i] = permuted.min(axis=0)
+
+    return signatures
+
+
+def collapse_near_duplicates(
+    documents: List["Document"], threshold: float
+) -> Tuple[List["Document"], Set[Tuple[str, str]]]:
+    """
+    Collapse the near-duplicate chunks (e.g., the boilerplate shared by
+    contracts) into the first of them, so that they are embedded and
+    retrieved once. Candidate pairs are found by locality-sensitive hashing of
+    the MinHash signatures, and a chunk is collapsed into a kept chunk whose
+    estimated Jaccard similarity is at least the threshold. A kept chunk that
+    stands for chunks of other files lists all of them in its `sources`
+    metadata.
+
+    Args:
+        documents (List[Document]):
+            The chunks, with their file in the `source` metadata
+        threshold (float):
+            The minimum estimated similarity of near-duplicates, in [0, 1]
+
+    Returns:
+        Tuple[List[Document], Set[Tuple[str, str]]]:
+            The kept chunks, and the pairs of distinct files that share a
+            kept chunk
+    """
+    if not documents:
+        return [], set()
+
+    signatures = minhash_signatures([doc.page_content for doc in documents])
+
+    # LSH band -> indices of the kept chunks with that band
+    buckets: Dict[Tuple[int, bytes], List[int]] = defaultdict(list)
+    # Index of each kept chunk -> sources of the chunks it stands for
+    kept: Dict[int, List[str]] = {}
+
+    for i, doc in enumerate(documents):
+        bands = [
+            (band, signatures[i, band * ROWS_PER_BAND : (band + 1) * ROWS_PER_BAND])
+            for band in range(NUM_BANDS)
+        ]
+        bands = [(band, rows.tobytes()) for band, rows in bands]
+
+        candidates = {j for band in bands for j in buckets.get(band, ())}
+        best, best_similarity = None, threshold
+        for j in sorted(candidates):
+            similarity = float((signatures[i] == signatures[j]).mean())
+            if similarity >= best_similarity:
+                best, best_similarity = j, similarity
+
+        source = doc.metadata.get("source")
+        if best is not None:
+            if source not in kept[best]:
+                kept[best].append(source)
+            continue
+
+        kept[i] = [source]
+        for band in bands:
+            buckets[band].append(i)
+
+    collapsed, links = [], set()
+    for i, sources in kept.items():
+        doc = documents[i]
+        if len(sources) > 1:
+            doc = doc.model_copy(
+                update={"metadata": {**doc.metadata, "sources": sorted(sources)}}
+            )
+            links.update(
+                (source, linked_source)
+                for source in sources
+                for linked_source in sources
+                if source != linked_source
+            )
+        collapsed.append(doc)
+
+    return collapsed, links
+
+
+class ChunkLinkStore:
+    """
+    Durable store of the links between the files whose near-duplicate chunks
+    are embedded once
+    """
+
+    def __init__(self, engine: Engine):
+        """
+        Args:
+            engine (Engine): The engine of the database storing the links
+        """
+        self._engine = engine
+
+    def get_linked(self, namespace: str, sources: Iterable[str]) -> Set[str]:
+        """
+        Get the files linked to the given files, directly or through other
+        files
+
+        Args:
+            namespace (str): The Pinecone namespace
+            sources (Iterable[str]): The paths to the files
+
+        Returns:
+            Set[str]: The paths to the linked files, excluding the given files
+        """
+        table = chunk_links_table
+        sources = set(sources)
+        found, frontier = set(sources), list(sources)
+
+        with self._engine.connect() as conn:
+            while frontier:
+                batch, frontier = frontier[:BATCH_SIZE], frontier[BATCH_SIZE:]
+                linked = conn.execute(
+                    select(table.c.linked_source).where(
+                        and_(table.c.namespace == namespace, table.c.source.in_(batch))
+                    )
+                ).scalars()
+
+                for linked_source in linked:
+                    if linked_source not in found:
+                        found.add(linked_source)
+                        frontier.append(linked_source)
+
+        return found - sources
+
+    def add(self, namespace: str, links: Set[Tuple[str, str]]):
+        """
+        Record links between files, keeping the existing links, e.g., before
+        the vectors sharing chunks are written
+
+        Args:
+            namespace (str): The Pinecone namespace
+            links (Set[Tuple[str, str]]): The pairs of linked files
+        """
+        table = chunk_links_table
+        sources = sorted({source for source, _ in links})
+
+        with self._engine.begin() as conn:
+            existing = set()
+            for i in range(0, len(sources), BATCH_SIZE):
+                existing.update(
+                    conn.execute(
+                        select(table.c.source, table.c.linked_source).where(
+                            and_(
+                                table.c.namespace == namespace,
+                                table.c.source.in_(sources[i : i + BATCH_SIZE]),
+                            )
+                        )
+                    ).all()
+                )
+
+            if new_links := links - existing:
+                conn.execute(
+                    insert(table),
+                    [
+                        {
+                            "namespace": namespace,
+                            "source": source,
+                            "linked_source": linked_source,
+                        }
+                        for source, linked_source in new_links
+                    ],
+                )
+
+    def replace(
+        self, namespace: str, sources: Iterable[str], links: Set[Tuple[str, str]]
+    ):
+        """
+        Replace the links of files indexed again, in a single transaction
+
+        Args:
+            namespace (str):
+                The Pinecone namespace
+            sources (Iterable[str]):
+                The paths to the files indexed again
+            links (Set[Tuple[str, str]]):
+                The pairs of files that now share a chunk, in both directions
+        """
+        table = chunk_links_table
+        sources = list(sources)
+
+        with self._engine.begin() as conn:
+            self._delete(conn, namespace, sources)
+            if links:
+                conn.execute(
+                    insert(table),
+                    [
+                        {
+                            "namespace": namespace,
+                            "source": source,
+                            "linked_source": linked_source,
+                        }
+                        for source, linked_source in links
+                    ],
+                )
+
+    def move(self, namespace: str, moves: Dict[str, str]):
+        """
+        Update the links of moved or renamed files
+
+        Args:
+            namespace (str): The Pinecone namespace
+            moves (Dict[str, str]): The old path to the new path of each file
+        """
+        table = chunk_links_table
+        sources = list(moves)
+
+        with self._engine.begin() as conn:
+            links = set()
+            for i in range(0, len(sources), BATCH_SIZE):
+                batch = sources[i : i + BATCH_SIZE]
+                links.update(
+                    conn.execute(
+                        select(table.c.source, table.c.linked_source).where(
+                            and_(
+                                table.c.namespace == namespace,
+                                or_(
+                                    table.c.source.in_(batch),
+                                    table.c.linked_source.in_(batch),
+                                ),
+                            )
+                        )
+                    ).all()
+                )
+            if not links:
+                return
+
+            self._delete(conn, namespace, sources)
+            conn.execute(
+                insert(table),
+                [
+                    {
+                        "namespace": namespace,
+                        "source": moves.get(source, source),
+                        "linked_source": moves.get(linked_source, linked_source),
+                    }
+                    for source, linked_source in links
+                ],
+            )
+
+    def delete(self, namespace: str, sources: Iterable[str]):
+        """
+        Forget the links of files, e.g., when they are deleted
+
+        Args:
+            namespace (str): The Pinecone namespace
+            sources (Iterable[str]): The paths to the files
+        """
+        with self._engine.begin() as conn:
+            self._delete(conn, namespace, list(sources))
+
+    def delete_namespace(self, namespace: str):
+        """
+        Forget the links of all files of a namespace
+
+        Args:
+            namespace (str): The Pinecone namespace
+        """
+        with self._engine.begin() as conn:
+            conn.execute(
+                delete(chunk_links_table).where(
+                    chunk_links_table.c.namespace == namespace
+                )
+            )
+
+    @staticmethod
+    def _delete(conn, namespace: str, sources: List[str]):
+        table = chunk_links_table
+        for i in range(0, len(sources), BATCH_SIZE):
+            batch = sources[i : i + BATCH_SIZE]
+            conn.execute(
+                delete(table).where(
+                    and_(
+                        table.c.namespace == namespace,
+                        or_(
+                            table.c.source.in_(batch),
+                            table.c.linked_source.in_(batch),
+                        ),
+                    )
+                )
+            )
@@ -0,0 +1,186 @@
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from configuration import settings
+from utils.metrics import get_counter
+from utils.rate_limit import TokenBucket
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+profiles_counter = get_counter(
+    "profiles_total",
+    "Profiling requests per outcome (written, rate_limited, or busy)",
+    label_names=("outcome",),
+)
+
+# Whether a profile is already recorded in the current thread, so that nested
+# runs (e.g., an ingestion job during a page run) are part of the outer profile
+_profiling = threading.local()
+
+_profile_budget: Optional[TokenBucket] = None
+# Profiles recorded concurrently, to bound the overhead of the sampling
+_profile_slots: Optional[threading.BoundedSemaphore] = None
+_profile_budget_lock = threading.Lock()
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler sampling the call stack of a thread at a fixed
+    interval from a background thread, so that the profiled code runs
+    unmodified. The samples are aggregated into folded stacks (one line per
+    distinct stack, with frames from the root to the leaf separated by
+    semicolons, followed by the number of samples), the input format of
+    flamegraph tools such as `flamegraph.pl` and speedscope.
+    """
+
+    def __init__(self, thread_id: int, interval_seconds: float = 0.01):
+        """
+        Args:
+            thread_id (int):
+                The identifier of the thread to sample
+            interval_seconds (float):
+                Time between two samples. Defaults to `0.01`.
+        """
+        self.thread_id = thread_id
+        self.interval_seconds = interval_seconds
+        self.stacks: Counter = Counter()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start sampling in a background thread"""
+        self._thread = threading.Thread(
+            target=self._sample_periodically, name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling and wait for the background thread"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def folded_stacks(self) -> str:
+        """
+        Returns:
+            str: The samples as folded stacks, most frequent first
+        """
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.stacks.most_common()
+        )
+
+    def _sample_periodically(self):
+        while not self._stopped.wait(self.interval_seconds):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(
+                    f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            # The frames are from the leaf to the root
+            self.stacks[";".join(reversed(frames))] += 1
+
+
+def _acquire_profile_budget() -> Optional[str]:
+    """
+    Take a profile from the budget of the process, and a profiling slot
+
+    Returns:
+        Optional[str]: The outcome if the profile is refused, None otherwise
+    """
+    global _profile_budget, _profile_slots
+
+    with _profile_budget_lock:
+        if _profile_budget is None:
+            _profile_budget = TokenBucket(
+                settings.PROFILE_MAX_PER_HOUR / 60,
+                capacity=max(1, settings.PROFILE_MAX_PER_HOUR // 6),
+            )
+            _profile_slots = threading.BoundedSemaphore(settings.PROFILE_MAX_CONCURRENT)
+
+    # No profile is allowed at all
+    if settings.PROFILE_MAX_PER_HOUR <= 0:
+        return "rate_limited"
+
+    if not _profile_slots.acquire(blocking=False):
+        return "busy"
+
+    if _profile_budget.reserve(1, max_wait_seconds=0) is None:
+        _profile_slots.release()
+        return "rate_limited"
+
+    return None
+
+
+@contextmanager
+def profile_run(name: str, requested: bool = False) -> Iterator[Optional[Path]]:
+    """
+    Context manager recording a profile of the code run in its block, if
+    profiling is enabled for a sample of the runs (`PROFILE_ENABLED`) or
+    requested for this run (e.g., by an admin), within the budget of profiles
+    per hour of the process. The profile is written to `PROFILE_DIR` as folded
+    stacks when the block exits, even on errors and Streamlit reruns.
+
+    Args:
+        name (str):
+            The name of the run, the prefix of the profile file
+        requested (bool):
+            Whether profiling is requested for this run. Defaults to False.
+
+    Returns:
+        Iterator[Optional[Path]]:
+            The path the profile will be written to, or None if the run is not
+            profiled
+    """
+    sampled = (
+        settings.PROFILE_ENABLED and random.random() < settings.PROFILE_SAMPLE_RATE
+    )
+    if not (sampled or requested) or getattr(_profiling, "active", False):
+        yield None
+        return
+
+    refusal = _acquire_profile_budget()
+    if refusal is not None:
+        profiles_counter.inc(outcome=refusal)
+        yield None
+        return
+
+    safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in name)
+    path = Path(settings.PROFILE_DIR) / (
+        f"{safe_name}-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+        f"-{threading.get_ident()}.folded"
+    )
+    profiler = SamplingProfiler(
+        threading.get_ident(), settings.PROFILE_SAMPLE_INTERVAL_MS / 1000
+    )
+
+    _profiling.active = True
+    profiler.start()
+    try:
+        yield path
+    finally:
+        profiler.stop()
+        _profiling.active = False
+        _profile_slots.release()
+
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(profiler.folded_stacks())
+            profiles_counter.inc(outcome="written")
+            logger.info(f"Profile of {name} written to {path}")
+        except OSError as e:
+            logger.error(f"Error writing the profile of {name}: {e}")
@@ -0,0 +1,95 @@
+import re
+from typing import Optional, Sequence
+
+# Words referring to something mentioned in an earlier turn of the conversation
+REFERENCE_WORDS = frozenset(
+    {
+        "he",
+        "him",
+        "his",
+        "she",
+        "her",
+        "hers",
+        "it",
+        "its",
+        "itself",
+        "they",
+        "them",
+        "their",
+        "theirs",
+        "themselves",
+        "this",
+        "that",
+        "these",
+        "those",
+        "there",
+        "such",
+        "former",
+        "latter",
+        "above",
+        "aforementioned",
+        "previous",
+        "previously",
+        "earlier",
+        "same",
+        "another",
+        "other",
+        "else",
+        "again",
+        "more",
+        "further",
+        "said",
+        "mentioned",
+    }
+)
+
+# Openings of questions continuing an earlier turn, e.g., "And for 2023?"
+FOLLOW_UP_PREFIXES = (
+    "and ",
+    "but ",
+    "or ",
+    "also ",
+    "so ",
+    "then ",
+    "what about ",
+    "how about ",
+)
+
+# Questions of a few words (e.g., "Why?", "Any examples?") usually only make
+# sense with the earlier turns
+MAX_FOLLOW_UP_WORDS = 3
+
+_WORD_PATTERN = re.compile(r"[a-z]+")
+
+
+def needs_contextualization(
+    question: str, chat_history: Optional[Sequence] = None
+) -> bool:
+    """
+    Tell whether a question must be rewritten with the chat history into a
+    standalone question before retrieving documents. The rules are
+    conservative: a question is only considered standalone if it has no
+    pronouns or references to the earlier turns.
+
+    Args:
+        question (str):
+            The latest question of the user
+        chat_history (Optional[Sequence]):
+            The earlier messages of the conversation. Defaults to None.
+
+    Returns:
+        bool: Whether the question must be rewritten
+    """
+    if not chat_history:
+        return False
+
+    normalized_question = question.strip().lower()
+    words = _WORD_PATTERN.findall(normalized_question)
+
+    if len(words) <= MAX_FOLLOW_UP_WORDS:
+        return True
+
+    if normalized_question.startswith(FOLLOW_UP_PREFIXES):
+        return True
+
+    return any(word in REFERENCE_WORDS for word in words)
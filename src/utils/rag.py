@@ -1,147 +1,540 @@
 import logging
 import os
 import tempfile
+import threading
 import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from functools import partial
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Tuple
 
-import streamlit as st
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains.history_aware_retriever import create_history_aware_retriever
-from langchain.chains.retrieval import create_retrieval_chain
-from langchain.indexes import SQLRecordManager, index
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_community.embeddings import HuggingFaceBgeEmbeddings
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.vectorstores import VectorStoreRetriever
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_pinecone import PineconeVectorStore
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from pinecone import Index, Pinecone, ServerlessSpec
-from pinecone.core.openapi.shared.exceptions import NotFoundException
-from streamlit.runtime.caching import CacheResourceAPI
+from google.cloud.storage import Blob
 
 from configuration import settings
-from utils.firebase import get_blobs_in_folder_from_storage
+from utils.cache import counted_cache_resource, tenant_cache_resource
+from utils.database import get_database_engine
+from utils.embedding_spec import (
+    EmbeddingSpec,
+    EmbeddingSpecMismatchError,
+    EmbeddingSpecStore,
+    IndexDimensionMismatchError,
+)
+from utils.firebase import (
+    get_blobs_in_folder_from_storage,
+    get_file_from_storage,
+    move_blob_in_storage,
+)
+from utils.ingestion_checkpoint import IngestionCheckpointStore
+from utils.ingestion_scheduler import IngestionQuotaExceededError, IngestionScheduler
+from utils.metrics import get_counter, get_gauge, get_histogram
+from utils.profiling import profile_run
+from utils.question_rewrite import needs_contextualization
+from utils.rate_limit import AdmissionController
+from utils.refresh import RefreshCoordinator
+
+# LangChain, the Pinecone SDK, and the embedding model take seconds to import,
+# so they are imported on first use to keep the login page fast to render
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+    from langchain_core.embeddings import Embeddings
+    from langchain_core.indexing import IndexingResult
+    from langchain_core.vectorstores import VectorStoreRetriever
+    from langchain_pinecone import PineconeVectorStore
+    from pinecone import Index
+
+    from utils.encode_pool import EncodePool
+    from utils.near_duplicates import ChunkLinkStore
+    from utils.record_manager import BatchedSQLRecordManager
 
 logging.basicConfig(level=logging.ERROR)
 logger = logging.getLogger(__name__)
 
+# Maximum number of vectors fetched from Pinecone per request
+PINECONE_FETCH_BATCH_SIZE = 100
+# Number of documents embedded at once when migrating a namespace
+MIGRATION_BATCH_SIZE = 1000
+# Number of unchanged files refreshed, and of vectors of deleted files cleaned
+# up, at once by a full ingestion job
+SYNC_BATCH_SIZE = 1000
+
+# Embedding spec of the namespaces indexed before the specs were recorded
+LEGACY_EMBEDDING_SPEC = EmbeddingSpec(
+    model_name="BAAI/bge-large-en-v1.5", dimension=1024, normalize=True
+)
+
+pinecone_request_duration = get_histogram(
+    "pinecone_request_duration_seconds",
+    "Latency of the Pinecone requests per operation",
+    label_names=("operation",),
+)
+retrieval_duration = get_histogram(
+    "retrieval_duration_seconds",
+    "Latency of the retrieval of the chat turns (query embedding and search)",
+)
+ingestion_job_duration = get_histogram(
+    "ingestion_job_duration_seconds",
+    "Duration of the ingestion jobs per kind (full reindex or incremental "
+    "indexing of uploaded files) and outcome",
+    label_names=("kind", "outcome"),
+    buckets=(1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0),
+)
+ingestion_files = get_counter(
+    "ingestion_files_total",
+    "Files processed by the full ingestion jobs per action (indexed, refreshed "
+    "when unchanged since the last job, or resumed when already indexed by the "
+    "interrupted job)",
+    label_names=("action",),
+)
+chunks_collapsed = get_counter(
+    "ingestion_chunks_collapsed_total",
+    "Chunks not embedded since they are near-duplicates of another chunk of "
+    "the same indexing batch",
+)
+ingestion_queue_depth = get_gauge(
+    "ingestion_queue_depth",
+    "Number of reindex runs scheduled or in progress",
+)
+rewrite_histogram = get_histogram(
+    "question_rewrite_seconds",
+    "Duration of the rewrite of the questions into standalone questions, per "
+    "tier (rules when the question is already standalone, llm otherwise)",
+    label_names=("tier",),
+)
+
+# Host and dimension of each Pinecone index, resolved once per process
+_pinecone_indexes: Dict[str, Tuple[str, int]] = {}
+_pinecone_indexes_lock = threading.Lock()
+
+
+@counted_cache_resource
+def setup_llm(model_name: str, tier: str):
+    """Create a Google Generative AI model whose calls go through the admission
+    controller of the model, to stay within the rate limits of the API.
 
-@st.cache_resource()
-def setup_llm():
-    """Create a Google Generative AI model.
+    Args:
+        model_name (str): The name of the model
+        tier (str): The step of the RAG chain the model is used for
 
     Returns:
-        ChatGoogleGenerativeAI: The Google Generative AI Large Language Model
+        RateLimitedChatModel: The Google Generative AI Large Language Model
     """
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    from utils.llm import RateLimitedChatModel
+
     llm = ChatGoogleGenerativeAI(
-        model="gemini-1.5-flash",
+        model=model_name,
         temperature=0,
         max_tokens=None,
-        timeout=None,
+        timeout=settings.LLM_TIMEOUT_SECONDS,
         max_retries=2,
     )
 
-    return llm
+    return RateLimitedChatModel(
+        model=llm,
+        admission_controller=setup_llm_admission_controller(model_name),
+        estimated_output_tokens=settings.LLM_ESTIMATED_OUTPUT_TOKENS,
+        tier=tier,
+    )
+
+
+@counted_cache_resource
+def setup_llm_admission_controller(model_name: str) -> AdmissionController:
+    """Create the admission controller shared by all calls to an LLM, since the
+    rate limits of the API apply per model
 
+    Args:
+        model_name (str): The name of the model
+
+    Returns:
+        AdmissionController: The admission controller of the model
+    """
+    return AdmissionController(
+        name=model_name,
+        max_concurrency=settings.LLM_MAX_CONCURRENCY,
+        max_queue=settings.LLM_MAX_QUEUE,
+        timeout_seconds=settings.LLM_TIMEOUT_SECONDS,
+        requests_per_minute=settings.LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute=settings.LLM_TOKENS_PER_MINUTE,
+    )
 
-@st.cache_resource()
+
+@counted_cache_resource
 def setup_embedding():
-    """Create a Hugging Face BGE Embedding model.
+    """Create a Hugging Face BGE Embedding model batching concurrent queries,
+    or a client of the embedding server if `settings.EMBEDDING_SERVER_URL` is
+    set so that the app processes share a single copy of the model.
 
     Returns:
-        HuggingFaceBgeEmbeddings: The Hugging Face BGE Embedding model
+        Embeddings: The Hugging Face BGE Embedding model
     """
-    model_name = "BAAI/bge-large-en-v1.5"
-    model_kwargs = {"device": "cpu"}
-    encode_kwargs = {"normalize_embeddings": True}
-    hf_embedding = HuggingFaceBgeEmbeddings(
-        model_name=model_name, model_kwargs=model_kwargs, encode_kwargs=encode_kwargs
+    from utils.embedding import (
+        MicroBatchingEmbeddings,
+        RemoteEmbeddings,
+        create_embedding_model,
     )
 
-    return hf_embedding
+    # The embedding server batches the queries of all app processes
+    if settings.EMBEDDING_SERVER_URL:
+        return RemoteEmbeddings(
+            settings.EMBEDDING_SERVER_URL,
+            timeout=settings.EMBEDDING_SERVER_TIMEOUT_SECONDS,
+        )
 
+    return MicroBatchingEmbeddings(
+        create_embedding_model(),
+        max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+        max_wait_seconds=settings.EMBEDDING_BATCH_MAX_WAIT_MS / 1000,
+    )
 
-@st.cache_resource()
-def setup_pinecone_index():
-    """Create a Pinecone index if not exists and return the index
+
+def warm_up_embedding():
+    """Load the embedding model and embed a query so that the first chat turn
+    does not wait for the model to be loaded and the first inference to run
+    """
+    logger.info("*" * 100)
+    logger.info("Warming up the embedding model")
+
+    start = time.perf_counter()
+    try:
+        setup_embedding().embed_query("warm up")
+    except Exception as e:
+        logger.error(f"Error warming up the embedding model: {e}")
+    else:
+        logger.info(
+            f"Embedding model warmed up in {time.perf_counter() - start:.1f} seconds"
+        )
+    logger.info("*" * 100)
+
+
+def start_embedding_warm_up():
+    """Warm up the embedding model in a background thread. A caller of
+    `setup_embedding()` during the warm-up waits for the model being loaded
+    instead of loading it again.
+    """
+    threading.Thread(
+        target=warm_up_embedding, name="embedding-warm-up", daemon=True
+    ).start()
+
+
+def describe_pinecone_index(index_name: Optional[str] = None) -> Tuple[str, int]:
+    """Create the Pinecone index if not exists, with the dimension of the
+    embedding model, and resolve the host and dimension of the index. They are
+    resolved once per process so that connecting to the index does not call
+    the Pinecone control plane again.
+
+    Args:
+        index_name (Optional[str]):
+            The name of the Pinecone index. Defaults to
+            `settings.VECTOR_DB_INDEX_NAME`.
+
+    Returns:
+        Tuple[str, int]: The host and the dimension of the Pinecone index
+    """
+    from pinecone import Pinecone, ServerlessSpec
+
+    index_name = index_name or settings.VECTOR_DB_INDEX_NAME
+
+    with _pinecone_indexes_lock:
+        if index_name in _pinecone_indexes:
+            return _pinecone_indexes[index_name]
+
+        # Create a Pinecone connection
+        pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+
+        # Create a Pinecone index
+        with pinecone_request_duration.time(operation="list_indexes"):
+            existing_indexes = [index_info["name"] for index_info in pc.list_indexes()]
+
+        if index_name not in existing_indexes:
+            with pinecone_request_duration.time(operation="create_index"):
+                pc.create_index(
+                    name=index_name,
+                    dimension=get_embedding_spec().dimension,
+                    metric="cosine",
+                    spec=ServerlessSpec(cloud="aws", region="us-east-1"),
+                )
+            while not pc.describe_index(index_name).status["ready"]:
+                time.sleep(1)
+
+        with pinecone_request_duration.time(operation="describe_index"):
+            description = pc.describe_index(index_name)
+        _pinecone_indexes[index_name] = (description.host, description.dimension)
+
+        return _pinecone_indexes[index_name]
+
+
+def resolve_pinecone_index_host(index_name: Optional[str] = None) -> str:
+    """Resolve the host of the Pinecone index, creating it if not exists
+
+    Args:
+        index_name (Optional[str]):
+            The name of the Pinecone index. Defaults to
+            `settings.VECTOR_DB_INDEX_NAME`.
+
+    Returns:
+        str: The host of the Pinecone index
+    """
+    return describe_pinecone_index(index_name)[0]
+
+
+@counted_cache_resource
+def setup_pinecone_index(index_name: Optional[str] = None):
+    """Connect to the Pinecone index, creating it if not exists
+
+    Args:
+        index_name (Optional[str]):
+            The name of the Pinecone index. Defaults to
+            `settings.VECTOR_DB_INDEX_NAME`.
 
     Returns:
         Index: The Pinecone index
     """
-    # Create a Pinecone connection
+    from pinecone import Pinecone
+
     pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+    index = pc.Index(host=resolve_pinecone_index_host(index_name))
 
-    # Create a Pinecone index
-    index_name = settings.VECTOR_DB_INDEX_NAME
-    existing_indexes = [index_info["name"] for index_info in pc.list_indexes()]
-
-    if index_name not in existing_indexes:
-        pc.create_index(
-            name=index_name,
-            dimension=1024,  # The dimension of the embedding model in above cell
-            metric="cosine",
-            spec=ServerlessSpec(cloud="aws", region="us-east-1"),
+    return InstrumentedPineconeIndex(index)
+
+
+class InstrumentedPineconeIndex:
+    """
+    Pinecone index recording the latency of its data plane requests, including
+    the ones made by LangChain (e.g., the queries of the retriever). Every other
+    attribute is the one of the wrapped index.
+    """
+
+    instrumented_operations = frozenset(
+        {"query", "upsert", "fetch", "update", "delete", "list_paginated"}
+    )
+
+    def __init__(self, index: "Index"):
+        """
+        Args:
+            index (Index): The Pinecone index
+        """
+        self._index = index
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._index, name)
+        if name not in self.instrumented_operations:
+            return attribute
+
+        def timed(*args, **kwargs):
+            # Asynchronous requests (`async_req=True`) are only timed until sent
+            with pinecone_request_duration.time(operation=name):
+                return attribute(*args, **kwargs)
+
+        return timed
+
+
+@counted_cache_resource
+def get_embedding_spec() -> EmbeddingSpec:
+    """Get the spec of the configured embedding model. The dimension is
+    measured on an embedding since it depends on the model. If
+    `settings.EMBEDDING_SERVER_URL` is set, the spec is the one of the model
+    served by the embedding server, which may be configured differently.
+
+    Returns:
+        EmbeddingSpec: The spec of the embedding model
+    """
+    if settings.EMBEDDING_SERVER_URL:
+        health = setup_embedding().health()
+        return EmbeddingSpec(
+            model_name=health["model_name"],
+            dimension=health["dimension"],
+            normalize=health["normalize"],
         )
-        while not pc.describe_index(index_name).status["ready"]:
-            time.sleep(1)
 
-    index = pc.Index(index_name)
+    return EmbeddingSpec(
+        model_name=settings.EMBEDDING_MODEL_NAME,
+        dimension=len(setup_embedding().embed_query("dimension")),
+        normalize=settings.EMBEDDING_NORMALIZE,
+    )
 
-    return index
 
+@counted_cache_resource
+def setup_embedding_spec_store() -> EmbeddingSpecStore:
+    """Create the store of the embedding spec of each namespace
 
-@st.cache_resource()
-def setup_retriever(
-    _index: Index,
-    _embedding: HuggingFaceBgeEmbeddings,
-    namespace: str,
-    folder_path: str,
-) -> VectorStoreRetriever | CacheResourceAPI:
-    """Create a retriever from a vector store generated by the Pinecone index
-    and the Hugging Face BGE Embedding model.
-    The vector store loads splitted documents from a directory
+    Returns:
+        EmbeddingSpecStore: The embedding spec store
+    """
+    return EmbeddingSpecStore(get_database_engine())
+
+
+@counted_cache_resource
+def setup_ingestion_checkpoint_store() -> IngestionCheckpointStore:
+    """Create the store of the checkpoints of the full ingestion jobs
+
+    Returns:
+        IngestionCheckpointStore: The ingestion checkpoint store
+    """
+    return IngestionCheckpointStore(get_database_engine())
+
+
+@counted_cache_resource
+def setup_chunk_link_store() -> "ChunkLinkStore":
+    """Create the store of the links between the files sharing collapsed
+    near-duplicate chunks
+
+    Returns:
+        ChunkLinkStore: The chunk link store
+    """
+    from utils.near_duplicates import ChunkLinkStore
+
+    return ChunkLinkStore(get_database_engine())
+
+
+def check_embedding_spec(namespace: str, index_name: Optional[str] = None):
+    """Check that a namespace was built with the configured embedding model,
+    recording the spec of the model for a new namespace
 
     Args:
-        _index (Index): The Pinecone index
-        _embedding (Embeddings): The Embedding model
-        namespace (str): The Pinecone namespace to search for documents
-        folder_path (str): The folder path to load documents from
+        namespace (str):
+            The Pinecone namespace
+        index_name (Optional[str]):
+            The name of the Pinecone index. Defaults to
+            `settings.VECTOR_DB_INDEX_NAME`.
+
+    Raises:
+        EmbeddingSpecMismatchError:
+            If the namespace was built with another embedding model
+        IndexDimensionMismatchError:
+            If the index has another dimension than the embedding model
+    """
+    index_name = index_name or settings.VECTOR_DB_INDEX_NAME
+    spec = get_embedding_spec()
+
+    _, index_dimension = describe_pinecone_index(index_name)
+    if index_dimension != spec.dimension:
+        raise IndexDimensionMismatchError(index_name, index_dimension, spec)
+
+    spec_store = setup_embedding_spec_store()
+    recorded_spec = spec_store.get(index_name, namespace)
+    if recorded_spec is None:
+        # A namespace with vectors but no spec predates the recorded specs
+        has_vectors = bool(get_record_manager(namespace, index_name).list_keys(limit=1))
+        recorded_spec = LEGACY_EMBEDDING_SPEC if has_vectors else spec
+        spec_store.set(index_name, namespace, recorded_spec)
+
+    if recorded_spec != spec:
+        raise EmbeddingSpecMismatchError(index_name, namespace, recorded_spec, spec)
+
+
+@counted_cache_resource
+def setup_encode_pool() -> "EncodePool":
+    """Create the process-wide pool of processes embedding large ingestion jobs.
+    The processes are only started on use and stopped when idle.
 
     Returns:
-        VectorStoreRetriever: The vector store retriever that has the context of
-            the loaded documents
+        EncodePool: The pool of embedding processes
     """
-    # Create a vector store
-    vector_store = PineconeVectorStore(
-        index=_index, embedding=_embedding, namespace=namespace
+    from utils.encode_pool import EncodePool
+
+    return EncodePool(
+        num_workers=settings.EMBEDDING_POOL_WORKERS,
+        threads_per_worker=settings.EMBEDDING_POOL_THREADS_PER_WORKER,
+        shard_size=settings.EMBEDDING_POOL_SHARD_SIZE,
+        idle_seconds=settings.EMBEDDING_POOL_IDLE_SECONDS,
     )
 
-    # Setup a record manager
-    record_manager_namespace = f"pinecone/{settings.VECTOR_DB_INDEX_NAME}/{namespace}"
-    record_manager = SQLRecordManager(
-        namespace=record_manager_namespace, db_url=settings.RECORD_MANAGER_DB_URL
+
+@counted_cache_resource
+def setup_ingestion_scheduler() -> IngestionScheduler:
+    """Create the process-wide scheduler sharing the ingestion capacity fairly
+    between the tenants, with uploads ahead of full syncs
+
+    Returns:
+        IngestionScheduler: The ingestion scheduler
+    """
+    return IngestionScheduler(
+        max_concurrent_jobs=settings.INGESTION_MAX_CONCURRENT_JOBS,
+        max_jobs_per_tenant=settings.INGESTION_MAX_JOBS_PER_TENANT,
+        interactive_weight=settings.INGESTION_INTERACTIVE_WEIGHT,
+        pages_per_hour=settings.INGESTION_PAGES_PER_HOUR,
+        chunks_per_hour=settings.INGESTION_CHUNKS_PER_HOUR,
+        quota_max_wait_seconds={
+            "interactive": settings.INGESTION_INTERACTIVE_QUOTA_WAIT_SECONDS,
+            "bulk": settings.INGESTION_BULK_QUOTA_WAIT_SECONDS,
+        },
+    )
+
+
+@counted_cache_resource
+def setup_refresh_coordinator() -> RefreshCoordinator:
+    """Create the process-wide coordinator of the reindex runs so that the runs
+    of a namespace never overlap. Each run waits for a bulk slot of the
+    ingestion scheduler before taking the lock of its namespace.
+
+    Returns:
+        RefreshCoordinator: The reindex coordinator
+    """
+    scheduler = setup_ingestion_scheduler()
+    coordinator = RefreshCoordinator(
+        debounce_seconds=settings.REINDEX_DEBOUNCE_SECONDS,
+        job_slot=partial(scheduler.slot, priority="bulk"),
     )
-    # Create a schema before using the record manager
+    ingestion_queue_depth.set_function(lambda: coordinator.queue_depth)
+
+    return coordinator
+
+
+def get_record_manager(
+    namespace: str, index_name: Optional[str] = None
+) -> "BatchedSQLRecordManager":
+    """Create a record manager that keeps track of the documents indexed in the
+    given Pinecone namespace. The record managers share the pooled engine of
+    the process.
+
+    Args:
+        namespace (str):
+            The Pinecone namespace of the indexed documents
+        index_name (Optional[str]):
+            The name of the Pinecone index. Defaults to
+            `settings.VECTOR_DB_INDEX_NAME`.
+
+    Returns:
+        BatchedSQLRecordManager: The record manager with its schema created
+    """
+    from utils.record_manager import BatchedSQLRecordManager
+
+    index_name = index_name or settings.VECTOR_DB_INDEX_NAME
+    record_manager_namespace = f"pinecone/{index_name}/{namespace}"
+    record_manager = BatchedSQLRecordManager(
+        namespace=record_manager_namespace, engine=get_database_engine()
+    )
+    # Create the schema (once per process) before using the record manager
     record_manager.create_schema()
 
-    # Load documents
-    logger.info("*" * 100)
-    logger.info("Loading documents from Firebase Storage")
+    return record_manager
+
+
+def load_documents_from_storage(files: Iterable[Blob]) -> List["Document"]:
+    """Download PDF files from Firebase Storage and load them into documents.
+    The `source` metadata of each document is set to the file path in Firebase
+    Storage so that the record manager can keep track of the documents by file.
+    Files that are aliases of a file with the same content are skipped.
+
+    Args:
+        files (Iterable[Blob]): The PDF files in Firebase Storage
+
+    Returns:
+        List[Document]: The documents (one per PDF page) of all files
+    """
+    from langchain_community.document_loaders import PyPDFLoader
 
     documents = []
-    files = list(
-        get_blobs_in_folder_from_storage(
-            folder_path=folder_path,
-            return_files=True,
-            return_folders=False,
-            recursive=True,
-        )
-    )
 
     for file in files:
         # Get metadata from the file
         metadata = file.metadata
 
+        # Aliases share the vectors of the file holding the same content
+        if metadata and metadata.get("alias_of"):
+            continue
+
         # Download the file to a temporary directory and load the file
         with tempfile.TemporaryDirectory() as temp_dir:
             file_path = os.path.abspath(f"{temp_dir}/{file.name}")
@@ -160,26 +553,367 @@ def setup_retriever(
 
             documents.extend(docs)
 
-    logger.info(f"Number of documents loaded: {len(documents)}")
-    logger.info("*" * 100)
+    return documents
+
+
+def _blob_version(file: Blob) -> str:
+    """The version of a file in storage, which changes when its content or
+    metadata (e.g., its alias target) does"""
+    return f"{file.generation}.{file.metageneration}"
+
+
+def split_documents(documents: List["Document"]) -> List["Document"]:
+    """Split documents into chunks to be embedded
+
+    Args:
+        documents (List[Document]): The documents to be split
+
+    Returns:
+        List[Document]: The chunks of the documents
+    """
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
 
     # Create text splitter
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=800,
         chunk_overlap=200,
     )
-    splits = text_splitter.split_documents(documents)
 
-    # Setup indexing function with `full` deletion mode
+    return text_splitter.split_documents(documents)
+
+
+def setup_ingestion_embedding(
+    documents: List["Document"], record_manager: "BatchedSQLRecordManager"
+) -> "Embeddings":
+    """Get the embedding model to index the chunks with. The chunks of a large
+    ingestion job that are not indexed yet are embedded up front in parallel by
+    the encode pool (or by the embedding server, if set), instead of batch by
+    batch in this process by `index()`.
+
+    Args:
+        documents (List[Document]): The chunks to be indexed
+        record_manager (BatchedSQLRecordManager):
+            The record manager of the namespace
+
+    Returns:
+        Embeddings: The embedding model to index the chunks with
+    """
+    from utils.embedding import PrecomputedEmbeddings
+    from utils.record_manager import document_key
+
+    embedding = setup_embedding()
+    if len(documents) < settings.EMBEDDING_POOL_MIN_CHUNKS:
+        return embedding
+
+    # Same IDs as `index()` computes, to skip the chunks already indexed
+    uids = [document_key(doc) for doc in documents]
+    texts = list(
+        dict.fromkeys(
+            doc.page_content
+            for doc, exists in zip(documents, record_manager.exists(uids))
+            if not exists
+        )
+    )
+    if len(texts) < settings.EMBEDDING_POOL_MIN_CHUNKS:
+        return embedding
+
     logger.info("*" * 100)
-    logger.info("Running index function to `full` cleanup")
+    logger.info(f"Embedding {len(texts)} chunks in bulk")
+
+    start = time.perf_counter()
+    bulk_embedding = embedding if settings.EMBEDDING_SERVER_URL else setup_encode_pool()
+    embeddings = bulk_embedding.embed_documents(texts)
+
+    logger.info(f"Chunks embedded in {time.perf_counter() - start:.1f} seconds")
     logger.info("*" * 100)
 
-    index(splits, record_manager, vector_store, cleanup="full", source_id_key="source")
+    return PrecomputedEmbeddings(embedding, dict(zip(texts, embeddings)))
+
+
+def index_chunks(
+    pinecone_index: "Index",
+    namespace: str,
+    record_manager: "BatchedSQLRecordManager",
+    sources: List[str],
+    splits: List["Document"],
+) -> "IndexingResult":
+    """Index the chunks of whole files, replacing the previous chunks of these
+    files. Near-duplicate chunks (`NEAR_DUPLICATE_THRESHOLD`) are collapsed
+    into a single chunk listing their files in its `sources` metadata, and the
+    files sharing a chunk are linked so that they are indexed together next
+    time. Must be called with the lock of the namespace held.
+
+    Args:
+        pinecone_index (Index):
+            The Pinecone index
+        namespace (str):
+            The Pinecone namespace to index the chunks into
+        record_manager (BatchedSQLRecordManager):
+            The record manager of the namespace
+        sources (List[str]):
+            The paths to the files of the chunks, including the files without
+            chunks
+        splits (List[Document]):
+            The chunks of the files
+
+    Returns:
+        IndexingResult:
+            The number of added, updated, skipped, and deleted vectors
+    """
+    from langchain.indexes import index
+    from langchain_pinecone import PineconeVectorStore
+
+    from utils.near_duplicates import collapse_near_duplicates
+    from utils.record_manager import document_key
+
+    links = set()
+    if settings.NEAR_DUPLICATE_THRESHOLD is not None:
+        num_splits = len(splits)
+        splits, links = collapse_near_duplicates(
+            splits, settings.NEAR_DUPLICATE_THRESHOLD
+        )
+        chunks_collapsed.inc(num_splits - len(splits))
+        logger.info(
+            f"Collapsed {num_splits - len(splits)} near-duplicate chunk(s) out "
+            f"of {num_splits}, saving as many embeddings"
+        )
+
+    # Record the new links before the vectors, since missing links could let
+    # a later indexing run drop the chunks of a linked file
+    link_store = setup_chunk_link_store()
+    link_store.add(namespace, links)
+
+    vector_store = PineconeVectorStore(
+        index=pinecone_index,
+        embedding=setup_ingestion_embedding(splits, record_manager),
+        namespace=namespace,
+    )
+    result = index(
+        splits,
+        record_manager,
+        vector_store,
+        cleanup="incremental",
+        source_id_key="source",
+        key_encoder=document_key,
+    )
+
+    # The incremental cleanup skips the files without chunks left, e.g., when
+    # all of them are collapsed into chunks of other files
+    emptied = set(sources) - {split.metadata["source"] for split in splits}
+    if emptied:
+        keys = record_manager.list_keys(group_ids=sorted(emptied))
+        if keys:
+            vector_store.delete(keys)
+            record_manager.delete_keys(keys)
+            result["num_deleted"] += len(keys)
 
-    logger.info("Finished running index function to `full` cleanup")
+    link_store.replace(namespace, sources, links)
+
+    return result
+
+
+def sync_namespace_with_folder(
+    index: "Index", embedding: "Embeddings", namespace: str, folder_path: str
+) -> "PineconeVectorStore":
+    """Sync a Pinecone namespace with the documents of a folder in Firebase
+    Storage.
+
+    The sync is checkpointed: the new and changed files are indexed in batches,
+    each recorded as indexed once committed, and the files unchanged since the
+    last sync are not downloaded again. A sync interrupted by a restart resumes
+    with the files it has not indexed, and the vectors of the deleted files are
+    only cleaned up once every file is indexed.
+
+    The sync is a bulk job of the ingestion scheduler, and its pages and chunks
+    are charged to the hourly quotas of the tenant. A sync that exceeds them
+    fails after checkpointing the files split so far, and resumes next time.
+
+    Args:
+        index (Index): The Pinecone index
+        embedding (Embeddings): The Embedding model
+        namespace (str): The Pinecone namespace to sync
+        folder_path (str): The folder path to load documents from
+
+    Returns:
+        PineconeVectorStore: The vector store of the namespace
+    """
+    from langchain_pinecone import PineconeVectorStore
+
+    # Refuse to mix the vectors of different embedding models
+    check_embedding_spec(namespace)
+
+    # Create a vector store
+    vector_store = PineconeVectorStore(
+        index=index, embedding=embedding, namespace=namespace
+    )
+
+    # Setup a record manager
+    record_manager = get_record_manager(namespace)
+    checkpoints = setup_ingestion_checkpoint_store()
+    namespace_lock = setup_refresh_coordinator().namespace_lock
+    scheduler = setup_ingestion_scheduler()
+
+    def index_batch(files: List[Blob], splits: List["Document"]):
+        """Index the chunks of whole files, replacing the previous chunks of
+        these files, and checkpoint the files"""
+        with namespace_lock(namespace):
+            index_chunks(
+                index,
+                namespace,
+                record_manager,
+                [file.name for file in files],
+                splits,
+            )
+            checkpoints.mark_indexed(
+                record_manager.namespace,
+                {file.name: _blob_version(file) for file in files},
+                job_started_at,
+            )
+        ingestion_files.inc(len(files), action="indexed")
+
+    with scheduler.slot(namespace, priority="bulk"), _time_ingestion_job("full"):
+        logger.info("*" * 100)
+        logger.info("Listing documents in Firebase Storage")
+
+        files = get_blobs_in_folder_from_storage(
+            folder_path=folder_path,
+            return_files=True,
+            return_folders=False,
+            recursive=True,
+        )
+        # Aliases share the vectors of the file holding the same content
+        files = [file for file in files if not (file.metadata or {}).get("alias_of")]
+
+        # Resume the job interrupted before its cleanup, if any
+        job_started_at = checkpoints.start(
+            record_manager.namespace, record_manager.get_time()
+        )
+        indexed_files = checkpoints.get_files(record_manager.namespace)
+
+        unchanged_files, pending_files = [], []
+        for file in files:
+            version, indexed_by = indexed_files.get(file.name, (None, None))
+            if version != _blob_version(file):
+                pending_files.append(file)
+            elif indexed_by != job_started_at:
+                unchanged_files.append(file)
+
+        # The files sharing collapsed chunks with the files to index or with
+        # the deleted files are indexed again, since their chunks may be held
+        # by the vectors about to be replaced. Their checkpoints are forgotten
+        # for a resumed job to index them too.
+        file_names = {file.name for file in files}
+        deleted_files = [path for path in indexed_files if path not in file_names]
+        linked_files = setup_chunk_link_store().get_linked(
+            namespace, [file.name for file in pending_files] + deleted_files
+        )
+        if relinked_files := [
+            file
+            for file in files
+            if file.name in linked_files and file not in pending_files
+        ]:
+            checkpoints.forget_files(
+                record_manager.namespace, [file.name for file in relinked_files]
+            )
+            unchanged_files = [
+                file for file in unchanged_files if file not in relinked_files
+            ]
+            pending_files.extend(relinked_files)
+
+        resumed = len(files) - len(unchanged_files) - len(pending_files)
+        ingestion_files.inc(resumed, action="resumed")
+        logger.info(
+            f"Files: {len(pending_files)} to index, {len(unchanged_files)} "
+            f"unchanged, {resumed} already indexed by the interrupted job"
+        )
+        logger.info("*" * 100)
+
+        # Keep the vectors of the unchanged files without downloading them
+        for i in range(0, len(unchanged_files), SYNC_BATCH_SIZE):
+            batch = unchanged_files[i : i + SYNC_BATCH_SIZE]
+            with namespace_lock(namespace):
+                record_manager.touch_groups([file.name for file in batch])
+                checkpoints.mark_indexed(
+                    record_manager.namespace,
+                    {file.name: _blob_version(file) for file in batch},
+                    job_started_at,
+                )
+            ingestion_files.inc(len(batch), action="refreshed")
+
+        # Index the new and changed files in batches of whole files
+        batch_files, batch_splits = [], []
+        for file in pending_files:
+            documents = load_documents_from_storage([file])
+            file_splits = split_documents(documents)
+            try:
+                scheduler.charge(
+                    namespace, pages=len(documents), chunks=len(file_splits)
+                )
+            except IngestionQuotaExceededError:
+                # Checkpoint the files split so far for the next sync to resume
+                if batch_files:
+                    index_batch(batch_files, batch_splits)
+                raise
+
+            batch_files.append(file)
+            batch_splits.extend(file_splits)
+            if len(batch_splits) >= settings.INGESTION_BATCH_CHUNKS:
+                index_batch(batch_files, batch_splits)
+                batch_files, batch_splits = [], []
+        if batch_files:
+            index_batch(batch_files, batch_splits)
+
+        # Every file is indexed, so the records not updated by this job are the
+        # chunks of deleted files
+        logger.info("*" * 100)
+        logger.info("Cleaning up the vectors of the deleted files")
+        logger.info("*" * 100)
+
+        with namespace_lock(namespace):
+            while keys := record_manager.list_keys(
+                before=job_started_at, limit=SYNC_BATCH_SIZE
+            ):
+                vector_store.delete(keys)
+                record_manager.delete_keys(keys)
+            setup_chunk_link_store().delete(namespace, deleted_files)
+            checkpoints.finish(record_manager.namespace, job_started_at)
+
+    logger.info("Finished syncing the namespace with the folder")
     logger.info("*" * 100)
 
+    return vector_store
+
+
+@tenant_cache_resource(
+    maxsize=settings.TENANT_CACHE_MAXSIZE,
+    idle_ttl_seconds=settings.TENANT_CACHE_IDLE_TTL_SECONDS,
+)
+def setup_retriever(
+    _index: "Index",
+    _embedding: "Embeddings",
+    namespace: str,
+    folder_path: str,
+) -> "VectorStoreRetriever":
+    """Create a retriever from a vector store generated by the Pinecone index
+    and the Hugging Face BGE Embedding model, after syncing the namespace with
+    the folder. The retrievers are cached per namespace, and dropped when unused
+    for a while, in which case the next call syncs the namespace with the folder
+    again.
+
+    Args:
+        _index (Index): The Pinecone index
+        _embedding (Embeddings): The Embedding model
+        namespace (str): The Pinecone namespace to search for documents
+        folder_path (str): The folder path to load documents from
+
+    Returns:
+        VectorStoreRetriever: The vector store retriever that has the context of
+            the loaded documents
+    """
+    vector_store = sync_namespace_with_folder(
+        _index, _embedding, namespace, folder_path
+    )
+
     # Create a retriever
     retriever = vector_store.as_retriever()
 
@@ -188,8 +922,10 @@ def setup_retriever(
 
 def setup_fresh_retriever(namespace: str, folder_path: str):
     """
-    Set up a fresh retriever by clearing the cache and calling the
-    setup_retriever function again
+    Set up a fresh retriever by syncing the namespace with the folder again.
+    The cached retriever of the namespace stays valid since it searches the
+    synced namespace. The sync does not go through the retriever cache, whose
+    creation of the retriever may be waiting for the slot of this run.
 
     Args:
         namespace (str):
@@ -198,25 +934,115 @@ def setup_fresh_retriever(namespace: str, folder_path: str):
             The folder path to load documents from
     """
     logger.info("*" * 100)
-    logger.info("Setting up a fresh retriever by clearing cache")
+    logger.info("Setting up a fresh retriever by syncing its namespace")
 
     # Get the Pinecone index and the embedding model
     index = setup_pinecone_index()
     embedding = setup_embedding()
 
-    # Clear the cache on the setup_retriever() function to let it run again
-    setup_retriever.clear()
-    setup_retriever(index, embedding, namespace, folder_path)
+    sync_namespace_with_folder(index, embedding, namespace, folder_path)
 
     logger.info("*" * 100)
     logger.info("Retriever is refreshed")
     logger.info("*" * 100)
 
 
-@st.cache_resource()
+def request_fresh_retriever(namespace: str, folder_path: str) -> Future:
+    """
+    Request a fresh retriever for the given namespace. Concurrent requests for
+    the same namespace are coalesced so that at most one run is in progress and
+    at most one follow-up run is scheduled.
+
+    Args:
+        namespace (str):
+            The Pinecone namespace to search for documents
+        folder_path (str):
+            The folder path to load documents from
+
+    Returns:
+        Future:
+            The future of the run serving this request. Call `result()` on it to
+            wait for the retriever to be refreshed.
+    """
+    return setup_refresh_coordinator().request(
+        namespace, partial(setup_fresh_retriever, namespace, folder_path)
+    )
+
+
+def index_files_in_vector_database(
+    namespace: str, remote_paths: List[str]
+) -> "IndexingResult":
+    """
+    Incrementally index the given files into the vector database. Only these
+    files are downloaded, split, and embedded, while the vectors of the other
+    files in the namespace are left untouched (except the files sharing
+    collapsed near-duplicate chunks with the given files, which are indexed
+    again with them). A file that is uploaded again replaces its previous
+    vectors thanks to the `incremental` cleanup mode.
+
+    The indexing is an interactive job of the ingestion scheduler, run before
+    the waiting full syncs, and its pages and chunks are charged to the hourly
+    quotas of the tenant.
+
+    Args:
+        namespace (str):
+            The Pinecone namespace to index the documents into
+        remote_paths (List[str]):
+            The paths to the files in Firebase Storage
+
+    Returns:
+        IndexingResult:
+            The number of added, updated, skipped, and deleted vectors
+
+    Raises:
+        IngestionQuotaExceededError:
+            If the tenant exceeded its quota of pages or chunks per hour
+    """
+    logger.info("*" * 100)
+    logger.info(f"Incrementally indexing {len(remote_paths)} file(s)")
+
+    # Refuse to mix the vectors of different embedding models
+    check_embedding_spec(namespace)
+
+    scheduler = setup_ingestion_scheduler()
+    with scheduler.slot(namespace, priority="interactive"), _time_ingestion_job(
+        "incremental"
+    ):
+        record_manager = get_record_manager(namespace)
+
+        # Load and split only the given files, and the files sharing collapsed
+        # chunks with them
+        linked_paths = setup_chunk_link_store().get_linked(namespace, remote_paths)
+        files = [
+            file
+            for remote_path in [*remote_paths, *sorted(linked_paths)]
+            if (file := get_file_from_storage(remote_path)) is not None
+        ]
+        documents = load_documents_from_storage(files)
+        splits = split_documents(documents)
+        scheduler.charge(namespace, pages=len(documents), chunks=len(splits))
+
+        with setup_refresh_coordinator().namespace_lock(namespace):
+            result = index_chunks(
+                setup_pinecone_index(),
+                namespace,
+                record_manager,
+                [file.name for file in files],
+                splits,
+            )
+
+    logger.info(f"Finished incremental indexing: {result}")
+    logger.info("*" * 100)
+
+    return result
+
+
 def setup_rag_tools(namespace: str, folder_path: str):
     """
-    Setup Firebase connection, LLM, Embedding, Pinecone Index, and Retriever
+    Setup Firebase connection, LLM, Embedding, Pinecone Index, and Retriever.
+    This function is not cached itself since the shared tools are cached by
+    their setup functions, and the retriever of each namespace by
+    setup_retriever().
 
     Args:
         namespace (str):
@@ -225,12 +1051,14 @@ def setup_rag_tools(namespace: str, folder_path: str):
             The folder path to load documents from
 
     Returns:
-        (ChatGoogleGenerativeAI, VectorStoreRetriever):
-            The Large Language Model and the Retriever
+        (RateLimitedChatModel, RateLimitedChatModel, VectorStoreRetriever):
+            The Large Language Models answering and rewriting the questions,
+            and the Retriever
     """
 
-    # Create an LLM
-    llm = setup_llm()
+    # Create the LLMs
+    llm = setup_llm(settings.LLM_ANSWER_MODEL_NAME, "answer")
+    rewrite_llm = setup_llm(settings.LLM_REWRITE_MODEL_NAME, "rewrite")
 
     # Create an Embedding
     hf_embedding = setup_embedding()
@@ -241,23 +1069,35 @@ def setup_rag_tools(namespace: str, folder_path: str):
     # Create a retriever
     retriever = setup_retriever(index, hf_embedding, namespace, folder_path)
 
-    return llm, retriever
+    return llm, rewrite_llm, retriever
 
 
-def setup_rag_chain(llm, retriever):
+def setup_rag_chain(llm, retriever, rewrite_llm=None, tracer=None):
     """
     Setup a RAG chain with a history-aware retriever and a question-answering
     system. Do not cache this function since the chat_history constantly changes
     with each human/AI message.
 
     Args:
-        llm (ChatGoogleGenerativeAI): The Large Language Model to answer
-        questions retriever (VectorStoreRetriever): The retriever to retrieve
-        context
+        llm (RateLimitedChatModel):
+            The Large Language Model to answer questions
+        retriever (VectorStoreRetriever):
+            The retriever to retrieve context
+        rewrite_llm (Optional[RateLimitedChatModel]):
+            The Large Language Model to rewrite the follow-up questions into
+            standalone questions. Defaults to `llm`.
+        tracer (Optional[TurnTracer]):
+            The tracer recording the spans of the turn. Defaults to None.
 
     Returns:
         Runnable: The RAG chain Runnable
     """
+    from langchain.chains.combine_documents import create_stuff_documents_chain
+    from langchain.chains.retrieval import create_retrieval_chain
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+    from langchain_core.runnables import RunnableLambda
+
     # Contextualize question
     contextualized_question_system_prompt = (
         "Given a chat history and the latest user question "
@@ -275,9 +1115,23 @@ def setup_rag_chain(llm, retriever):
         ]
     )
 
-    history_aware_retriever = create_history_aware_retriever(
-        llm, retriever, contextualized_question_prompt
+    # Like `create_history_aware_retriever`, but the questions that are already
+    # standalone skip the LLM, which only adds latency before the answer starts
+    keep_question = RunnableLambda(lambda x: x["input"]).with_listeners(
+        on_end=partial(_observe_rewrite, tier="rules")
+    )
+    rewrite_with_llm = (
+        contextualized_question_prompt | (rewrite_llm or llm) | StrOutputParser()
+    ).with_listeners(on_end=partial(_observe_rewrite, tier="llm"))
+    # The selected step runs as a child of this one (unlike the branches of a
+    # `RunnableBranch` when streamed), so that the turn traces nest properly
+    rewrite_question = RunnableLambda(
+        lambda x: rewrite_with_llm if _needs_rewrite(x) else keep_question,
+        name="rewrite_question",
     )
+    history_aware_retriever = (
+        rewrite_question | retriever.with_listeners(on_end=_observe_retrieval)
+    ).with_config(run_name="chat_retriever_chain")
 
     ### Answer question ###
     system_prompt = (
@@ -300,50 +1154,289 @@ def setup_rag_chain(llm, retriever):
 
     rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
 
+    if tracer is not None:
+        rag_chain = rag_chain.with_config(callbacks=[tracer])
+
     return rag_chain
 
 
-def delete_namespace_in_vector_database(namespace: str):
+@contextmanager
+def _time_ingestion_job(kind: str) -> Iterator[None]:
+    """Record the duration and outcome of an ingestion job, and profile it if
+    profiling is enabled"""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        with profile_run(f"ingestion-{kind}"):
+            yield
+        outcome = "success"
+    finally:
+        ingestion_job_duration.observe(
+            time.perf_counter() - start, kind=kind, outcome=outcome
+        )
+
+
+def _observe_retrieval(run):
+    retrieval_duration.observe((run.end_time - run.start_time).total_seconds())
+
+
+def _needs_rewrite(inputs: dict) -> bool:
+    """Whether the question of a turn must be rewritten with the chat history"""
+    chat_history = inputs.get("chat_history")
+    if not settings.LLM_REWRITE_SKIP_STANDALONE:
+        return bool(chat_history)
+
+    return needs_contextualization(inputs["input"], chat_history)
+
+
+def _observe_rewrite(run, tier: str):
+    rewrite_histogram.observe(
+        (run.end_time - run.start_time).total_seconds(), tier=tier
+    )
+
+
+def _restore_integers(value):
+    """Pinecone returns every number in the metadata as a float. Restore the
+    integers (e.g., the page number) so that the metadata hashes the same way as
+    when the documents were indexed."""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+
+    return value
+
+
+def move_sources_in_vector_database(namespace: str, moves: Dict[str, str]) -> int:
     """
-    Delete the namespace in the vector database. This also cleans up
+    Update the `source` metadata of the vectors of moved or renamed files
+    without embedding them again, as well as the `sources` metadata of the
+    collapsed chunks of the files linked to them. The stored vectors are
+    fetched and upserted under the IDs the indexing API would compute for the
+    new metadata, and the record manager keys are updated accordingly, so that
+    the next indexing run finds them up to date.
 
     Args:
-        namespace (str): _description_
+        namespace (str):
+            The Pinecone namespace of the documents
+        moves (Dict[str, str]):
+            The old path to the new path of each moved file
+
+    Returns:
+        int: The number of moved vectors
     """
+    from langchain_core.documents import Document
 
-    # Get the Embedding
-    hf_embedding = setup_embedding()
+    from utils.record_manager import document_key
 
-    # Get the Pinecone index
     pinecone_index = setup_pinecone_index()
+    record_manager = get_record_manager(namespace)
+    link_store = setup_chunk_link_store()
+    num_moved = 0
+
+    # The vectors of the linked files may list moved files in their `sources`
+    linked_sources = link_store.get_linked(namespace, moves)
+
+    for old_source in [*moves, *sorted(linked_sources)]:
+        new_source = moves.get(old_source, old_source)
+        old_keys = record_manager.list_keys(group_ids=[old_source])
+
+        for i in range(0, len(old_keys), PINECONE_FETCH_BATCH_SIZE):
+            batch = old_keys[i : i + PINECONE_FETCH_BATCH_SIZE]
+            fetched = pinecone_index.fetch(ids=batch, namespace=namespace).vectors
+
+            vectors, stale_keys = [], []
+            for key in batch:
+                # Keys without vectors are dropped so that the next indexing
+                # run embeds their documents again
+                if key not in fetched:
+                    stale_keys.append(key)
+                    continue
+
+                metadata = {
+                    k: _restore_integers(v) for k, v in fetched[key].metadata.items()
+                }
+                # The text is stored in the metadata by PineconeVectorStore
+                text = metadata.pop("text")
+                metadata["source"] = new_source
+                if "sources" in metadata:
+                    metadata["sources"] = sorted(
+                        moves.get(source, source) for source in metadata["sources"]
+                    )
+                # Same ID as `index()` computes from the content and metadata
+                new_key = document_key(Document(page_content=text, metadata=metadata))
+                if new_key == key:
+                    continue
+
+                vectors.append(
+                    (new_key, fetched[key].values, {**metadata, "text": text})
+                )
+                stale_keys.append(key)
+
+            if vectors:
+                pinecone_index.upsert(vectors=vectors, namespace=namespace)
+                record_manager.update(
+                    [key for key, _, _ in vectors],
+                    group_ids=[new_source] * len(vectors),
+                )
+
+            if stale_keys:
+                pinecone_index.delete(ids=stale_keys, namespace=namespace)
+                record_manager.delete_keys(stale_keys)
+            num_moved += len(vectors)
+
+    link_store.move(namespace, moves)
+
+    return num_moved
+
+
+def move_documents(namespace: str, source_path: str, destination_path: str):
+    """
+    Move or rename a file or folder in Firebase Storage along with the vectors
+    of its documents. No document is embedded again.
 
-    # Get the vector store
-    vector_store = PineconeVectorStore(
-        index=pinecone_index, embedding=hf_embedding, namespace=namespace
-    )
+    Args:
+        namespace (str):
+            The Pinecone namespace of the documents
+        source_path (str):
+            Path to the file or folder in Firebase Storage. Folders end with "/"
+        destination_path (str):
+            The new path of the file or folder
+    """
+    with setup_refresh_coordinator().namespace_lock(namespace):
+        moves = move_blob_in_storage(source_path, destination_path)
+        num_moved = move_sources_in_vector_database(namespace, moves)
 
-    # Get the record manager
-    record_manager_namespace = f"pinecone/{settings.VECTOR_DB_INDEX_NAME}/{namespace}"
-    record_manager = SQLRecordManager(
-        namespace=record_manager_namespace, db_url=settings.RECORD_MANAGER_DB_URL
-    )
+    logger.info("*" * 100)
+    logger.info(f"Moved {len(moves)} file(s) and {num_moved} vector(s)")
+    logger.info("*" * 100)
 
-    # Delete related cache in the record manager
-    index([], record_manager, vector_store, cleanup="full", source_id_key="source")
 
-    # Delete the namespace in the Pinecone vector database
-    try:
-        pinecone_index.delete(namespace=namespace, delete_all=True)
-    except NotFoundException as e:
-        logger.error("*" * 100)
-        logger.error(
-            "Continue since namespace not found in Pinecone "
-            "and we are deleting the namespace"
+def migrate_namespace_embeddings(
+    namespace: str, target_index_name: str, source_index_name: Optional[str] = None
+) -> int:
+    """
+    Embed the documents of a namespace again with the configured embedding
+    model into another Pinecone index. The texts and metadata are read from the
+    stored vectors, so the files are neither downloaded nor split again, and
+    the vector IDs and record manager keys are kept since they only depend on
+    the content and metadata of the documents.
+
+    Args:
+        namespace (str):
+            The Pinecone namespace to migrate
+        target_index_name (str):
+            The name of the Pinecone index to migrate the namespace to, which
+            is created with the dimension of the embedding model if not exists
+        source_index_name (Optional[str]):
+            The name of the Pinecone index to migrate the namespace from.
+            Defaults to `settings.VECTOR_DB_INDEX_NAME`.
+
+    Returns:
+        int: The number of migrated vectors
+    """
+    source_index_name = source_index_name or settings.VECTOR_DB_INDEX_NAME
+    if target_index_name == source_index_name:
+        raise ValueError("The target index must differ from the source index")
+
+    # Record the spec of the namespace in the target index
+    check_embedding_spec(namespace, target_index_name)
+
+    source_index = setup_pinecone_index(source_index_name)
+    target_index = setup_pinecone_index(target_index_name)
+    source_record_manager = get_record_manager(namespace, source_index_name)
+    target_record_manager = get_record_manager(namespace, target_index_name)
+
+    keys = source_record_manager.list_keys()
+    # Large namespaces are embedded by the encode pool unless there is a server
+    embedding = setup_embedding()
+    if len(keys) >= settings.EMBEDDING_POOL_MIN_CHUNKS:
+        if not settings.EMBEDDING_SERVER_URL:
+            embedding = setup_encode_pool()
+
+    num_migrated = 0
+    for i in range(0, len(keys), MIGRATION_BATCH_SIZE):
+        batch = keys[i : i + MIGRATION_BATCH_SIZE]
+
+        records = []
+        for j in range(0, len(batch), PINECONE_FETCH_BATCH_SIZE):
+            fetch_batch = batch[j : j + PINECONE_FETCH_BATCH_SIZE]
+            fetched = source_index.fetch(ids=fetch_batch, namespace=namespace).vectors
+            records.extend(
+                (
+                    key,
+                    {k: _restore_integers(v) for k, v in fetched[key].metadata.items()},
+                )
+                for key in fetch_batch
+                if key in fetched
+            )
+
+        if not records:
+            continue
+
+        # The text is stored in the metadata by PineconeVectorStore
+        embeddings = embedding.embed_documents(
+            [metadata["text"] for _, metadata in records]
         )
-        logger.error("*" * 100)
-    except Exception as e:
-        logger.error("*" * 100)
-        logger.error(f"Error deleting namespace in Pinecone: {e}")
-        logger.error(f"Error type: {type(e)}")
-        logger.error("*" * 100)
-        raise e
+        vectors = [
+            (key, values, metadata)
+            for (key, metadata), values in zip(records, embeddings)
+        ]
+        for j in range(0, len(vectors), PINECONE_FETCH_BATCH_SIZE):
+            target_index.upsert(
+                vectors=vectors[j : j + PINECONE_FETCH_BATCH_SIZE],
+                namespace=namespace,
+            )
+        target_record_manager.update(
+            [key for key, _ in records],
+            group_ids=[metadata.get("source") for _, metadata in records],
+        )
+
+        num_migrated += len(vectors)
+        logger.info(f"Migrated {num_migrated}/{len(keys)} vectors of {namespace}")
+
+    return num_migrated
+
+
+def delete_namespace_in_vector_database(namespace: str):
+    """
+    Delete the namespace in the vector database. This also cleans up
+
+    Args:
+        namespace (str): _description_
+    """
+    from pinecone.core.openapi.shared.exceptions import NotFoundException
+
+    # Get the Pinecone index
+    pinecone_index = setup_pinecone_index()
+
+    # Get the record manager
+    record_manager = get_record_manager(namespace)
+
+    with setup_refresh_coordinator().namespace_lock(namespace):
+        # Delete related cache in the record manager in one statement, since
+        # the vectors are deleted with the whole namespace below
+        record_manager.delete_namespace()
+
+        # Delete the namespace in the Pinecone vector database
+        try:
+            pinecone_index.delete(namespace=namespace, delete_all=True)
+        except NotFoundException as e:
+            logger.error("*" * 100)
+            logger.error(
+                "Continue since namespace not found in Pinecone "
+                "and we are deleting the namespace"
+            )
+            logger.error("*" * 100)
+        except Exception as e:
+            logger.error("*" * 100)
+            logger.error(f"Error deleting namespace in Pinecone: {e}")
+            logger.error(f"Error type: {type(e)}")
+            logger.error("*" * 100)
+            raise e
+
+        # A namespace created again may use another embedding model
+        setup_embedding_spec_store().delete(settings.VECTOR_DB_INDEX_NAME, namespace)
+        setup_ingestion_checkpoint_store().delete(record_manager.namespace)
+        setup_chunk_link_store().delete_namespace(namespace)
+
+    # Drop the retriever of the namespace (its folder has the same name)
+    setup_retriever.invalidate(namespace=namespace, folder_path=namespace)
@@ -0,0 +1,354 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Deque, Iterator, Optional
+
+from utils.metrics import get_histogram
+
+queue_wait_histogram = get_histogram(
+    "llm_queue_wait_seconds",
+    "Time the LLM calls wait for admission (concurrency slot and rate limits)",
+    label_names=("limiter",),
+)
+admission_histogram = get_histogram(
+    "llm_admission_seconds",
+    "Time to admit or reject the LLM calls per outcome",
+    label_names=("limiter", "outcome"),
+)
+
+
+class LLMOverloadedError(RuntimeError):
+    """Raised when an LLM call is rejected since too many calls are waiting or
+    the rate limits would delay it past its deadline"""
+
+
+class LLMTimeoutError(TimeoutError):
+    """Raised when an LLM call does not complete before its deadline"""
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket refilled continuously at a fixed rate. Tokens
+    are reserved ahead of time, so a caller waits for its turn instead of
+    polling the bucket.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate_per_minute (float):
+                Number of tokens added per minute
+            capacity (Optional[float]):
+                Maximum number of tokens in the bucket, i.e., the burst size.
+                Defaults to the rate per minute.
+        """
+        self.rate_per_second = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float, max_wait_seconds: float) -> Optional[float]:
+        """
+        Reserve tokens
+
+        Args:
+            amount (float):
+                Number of tokens to reserve, capped to the capacity
+            max_wait_seconds (float):
+                Maximum time the caller is willing to wait for the tokens
+
+        Returns:
+            Optional[float]:
+                Seconds to wait before using the tokens, or None if that is
+                longer than `max_wait_seconds`, in which case nothing is
+                reserved
+        """
+        amount = min(amount, self.capacity)
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity,
+                self._tokens + (now - self._updated_at) * self.rate_per_second,
+            )
+            self._updated_at = now
+
+            if self._tokens >= amount:
+                wait_seconds = 0.0
+            elif self.rate_per_second <= 0:
+                # The bucket is never refilled
+                return None
+            else:
+                wait_seconds = (amount - self._tokens) / self.rate_per_second
+            if wait_seconds > max_wait_seconds:
+                return None
+
+            self._tokens -= amount
+            return wait_seconds
+
+    def refund(self, amount: float):
+        """
+        Give back reserved tokens, e.g., unused or overestimated tokens
+
+        Args:
+            amount (float): Number of tokens to give back
+        """
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class _Waiter:
+    """A caller waiting for a concurrency slot, from a thread or a coroutine"""
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.event = threading.Event()
+        self.future: Optional[asyncio.Future] = loop.create_future() if loop else None
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._set_future_result)
+
+    def _set_future_result(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class Admission:
+    """
+    A call admitted by the admission controller
+
+    Attributes:
+        deadline (float): The monotonic time the call must complete by
+        estimated_tokens (int): The number of tokens reserved for the call
+    """
+
+    def __init__(self, deadline: float, estimated_tokens: int):
+        self.deadline = deadline
+        self.estimated_tokens = estimated_tokens
+
+    def remaining_seconds(self) -> float:
+        """
+        Returns:
+            float: Seconds left before the deadline
+        """
+        return self.deadline - time.monotonic()
+
+    def check_deadline(self):
+        """
+        Raises:
+            LLMTimeoutError: If the deadline has passed
+        """
+        if self.remaining_seconds() <= 0:
+            raise LLMTimeoutError("The LLM call did not complete before its deadline")
+
+
+class AdmissionController:
+    """
+    Admission control of the calls to a rate-limited API shared by all sessions
+    of the process: a bounded number of concurrent calls, token buckets for the
+    requests and tokens per minute, a bounded queue of waiting calls beyond
+    which calls are rejected right away (load shedding), and a deadline per
+    call covering both the wait and the call itself.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        max_queue: int,
+        timeout_seconds: float,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+    ):
+        """
+        Args:
+            name (str):
+                The name of the limiter in the metrics
+            max_concurrency (int):
+                Maximum number of calls in progress
+            max_queue (int):
+                Maximum number of calls waiting for a concurrency slot
+            timeout_seconds (float):
+                Time each call has to complete, including the wait
+            requests_per_minute (Optional[float]):
+                Maximum number of calls per minute. Defaults to unlimited.
+            tokens_per_minute (Optional[float]):
+                Maximum number of tokens per minute. Defaults to unlimited.
+        """
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout_seconds = timeout_seconds
+        self.request_bucket = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self.token_bucket = (
+            TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        )
+
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiters: Deque[_Waiter] = deque()
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of calls waiting for a concurrency slot"""
+        with self._lock:
+            return len(self._waiters)
+
+    @contextmanager
+    def admit(self, estimated_tokens: int) -> Iterator[Admission]:
+        """
+        Context manager admitting a call from a thread, waiting for a
+        concurrency slot and the rate limits
+
+        Args:
+            estimated_tokens (int): The number of tokens the call may use
+
+        Raises:
+            LLMOverloadedError: If the call is rejected
+            LLMTimeoutError: If the call cannot be admitted before its deadline
+        """
+        start = time.monotonic()
+        admission = Admission(start + self.timeout_seconds, estimated_tokens)
+
+        waiter = self._enter(start)
+        if waiter is not None:
+            waiter.event.wait(admission.remaining_seconds())
+            self._check_woken(waiter, start)
+
+        try:
+            time.sleep(self._reserve(admission, start))
+            yield admission
+        finally:
+            self._leave()
+
+    @asynccontextmanager
+    async def aadmit(self, estimated_tokens: int) -> AsyncIterator[Admission]:
+        """
+        Context manager admitting a call from a coroutine, waiting for a
+        concurrency slot and the rate limits without blocking the event loop
+
+        Args:
+            estimated_tokens (int): The number of tokens the call may use
+
+        Raises:
+            LLMOverloadedError: If the call is rejected
+            LLMTimeoutError: If the call cannot be admitted before its deadline
+        """
+        start = time.monotonic()
+        admission = Admission(start + self.timeout_seconds, estimated_tokens)
+
+        waiter = self._enter(start, asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(
+                    asyncio.shield(waiter.future), admission.remaining_seconds()
+                )
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                # Give the slot to the next caller if it was handed to us
+                if not self._withdraw(waiter):
+                    self._leave()
+                raise
+            self._check_woken(waiter, start)
+
+        try:
+            await asyncio.sleep(self._reserve(admission, start))
+            yield admission
+        finally:
+            self._leave()
+
+    def refund_tokens(self, amount: float):
+        """
+        Give back the tokens reserved but not used by a call
+
+        Args:
+            amount (float): The number of unused tokens
+        """
+        if self.token_bucket is not None and amount > 0:
+            self.token_bucket.refund(amount)
+
+    def _enter(
+        self, start: float, loop: Optional[asyncio.AbstractEventLoop] = None
+    ) -> Optional[_Waiter]:
+        """Take a concurrency slot, or queue a waiter if there is none left"""
+        with self._lock:
+            if self._active < self.max_concurrency and not self._waiters:
+                self._active += 1
+                return None
+
+            if len(self._waiters) >= self.max_queue:
+                self._observe(start, "shed")
+                raise LLMOverloadedError(
+                    f"Too many LLM calls waiting ({len(self._waiters)})"
+                )
+
+            waiter = _Waiter(loop)
+            self._waiters.append(waiter)
+            return waiter
+
+    def _check_woken(self, waiter: _Waiter, start: float):
+        """Check that the waiter was handed a slot before its deadline"""
+        if self._withdraw(waiter):
+            self._observe(start, "timeout")
+            raise LLMTimeoutError("Timed out waiting for an LLM concurrency slot")
+
+    def _withdraw(self, waiter: _Waiter) -> bool:
+        """Remove a waiter from the queue, unless it was already handed a slot"""
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                return True
+            return False
+
+    def _reserve(self, admission: Admission, start: float) -> float:
+        """Reserve the request and tokens of a call, returning the time to wait.
+        The caller releases its concurrency slot if the call is rejected."""
+        max_wait_seconds = admission.remaining_seconds()
+        wait_seconds = 0.0
+
+        if self.request_bucket is not None:
+            request_wait = self.request_bucket.reserve(1, max_wait_seconds)
+            if request_wait is None:
+                self._observe(start, "shed")
+                raise LLMOverloadedError("LLM requests per minute exceeded")
+            wait_seconds = request_wait
+
+        if self.token_bucket is not None:
+            token_wait = self.token_bucket.reserve(
+                admission.estimated_tokens, max_wait_seconds
+            )
+            if token_wait is None:
+                if self.request_bucket is not None:
+                    self.request_bucket.refund(1)
+                self._observe(start, "shed")
+                raise LLMOverloadedError("LLM tokens per minute exceeded")
+            wait_seconds = max(wait_seconds, token_wait)
+
+        queue_wait_histogram.observe(
+            time.monotonic() - start + wait_seconds, limiter=self.name
+        )
+        self._observe(start, "admitted")
+
+        return wait_seconds
+
+    def _leave(self):
+        """Hand the concurrency slot to the next waiter, or release it"""
+        with self._lock:
+            if self._waiters:
+                self._waiters.popleft().wake()
+            else:
+                self._active -= 1
+
+    def _observe(self, start: float, outcome: str):
+        admission_histogram.observe(
+            time.monotonic() - start, limiter=self.name, outcome=outcome
+        )
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import threading
+import uuid
+from typing import List, Optional, Sequence, Set
+
+from langchain.indexes import SQLRecordManager
+from langchain.indexes._sql_record_manager import UpsertionRecord
+from langchain_core.documents import Document
+from sqlalchemy import Engine, and_, delete, update
+
+# Maximum number of keys per SQL statement to stay under the limit of bound
+# parameters of the database (an upserted record has 5 parameters, and older
+# SQLite versions allow 999)
+BATCH_SIZE = 150
+
+# Engines whose record manager schema is created
+_schema_engines: Set[Engine] = set()
+_schema_lock = threading.Lock()
+
+# Namespace of the UUIDs of the documents, the one the indexing API has always
+# used, so that the keys of the vectors indexed so far stay valid
+KEY_NAMESPACE = uuid.UUID(int=1984)
+
+
+def _hash_to_uuid(text: str) -> str:
+    digest = hashlib.sha1(text.encode("utf-8"), usedforsecurity=False).hexdigest()
+    return str(uuid.uuid5(KEY_NAMESPACE, digest))
+
+
+def document_key(document: Document) -> str:
+    """
+    Compute the key of a document in the record manager and the vector store
+    (its vector ID), from its content and metadata. Passed to `index()` as its
+    `key_encoder`, so that the keys computed outside of it (e.g., to skip the
+    chunks already indexed, or to move vectors) always match.
+
+    Args:
+        document (Document): The document
+
+    Returns:
+        str: The key of the document
+    """
+    content_hash = _hash_to_uuid(document.page_content)
+    metadata_hash = _hash_to_uuid(json.dumps(document.metadata or {}, sort_keys=True))
+
+    return _hash_to_uuid(content_hash + metadata_hash)
+
+
+class BatchedSQLRecordManager(SQLRecordManager):
+    """
+    SQL record manager splitting the operations on many keys into batches of
+    statements, so that the upserts and deletes of large ingestion jobs and
+    cleanups stay under the limit of bound parameters of the database. The
+    schema is only created once per engine, since the engine is shared by the
+    record managers of all namespaces.
+    """
+
+    def create_schema(self) -> None:
+        with _schema_lock:
+            if self.engine not in _schema_engines:
+                super().create_schema()
+                _schema_engines.add(self.engine)
+
+    def update(
+        self,
+        keys: Sequence[str],
+        *,
+        group_ids: Optional[Sequence[Optional[str]]] = None,
+        time_at_least: Optional[float] = None,
+    ) -> None:
+        if group_ids is None:
+            group_ids = [None] * len(keys)
+
+        if len(keys) != len(group_ids):
+            raise ValueError(
+                f"Number of keys ({len(keys)}) does not match number of "
+                f"group_ids ({len(group_ids)})"
+            )
+
+        for i in range(0, len(keys), BATCH_SIZE):
+            super().update(
+                keys[i : i + BATCH_SIZE],
+                group_ids=group_ids[i : i + BATCH_SIZE],
+                time_at_least=time_at_least,
+            )
+
+    def exists(self, keys: Sequence[str]) -> List[bool]:
+        found = []
+        for i in range(0, len(keys), BATCH_SIZE):
+            found.extend(super().exists(keys[i : i + BATCH_SIZE]))
+
+        return found
+
+    def delete_keys(self, keys: Sequence[str]) -> None:
+        # All the batches are deleted in a single transaction
+        with self._make_session() as session:
+            for i in range(0, len(keys), BATCH_SIZE):
+                session.execute(
+                    delete(UpsertionRecord).where(
+                        and_(
+                            UpsertionRecord.key.in_(keys[i : i + BATCH_SIZE]),
+                            UpsertionRecord.namespace == self.namespace,
+                        )
+                    )
+                )
+            session.commit()
+
+    def touch_groups(self, group_ids: Sequence[str]) -> None:
+        """Refresh the update time of the records of the given groups (e.g., the
+        chunks of files unchanged since they were indexed), so that a full
+        cleanup keeps them without indexing them again"""
+        update_time = self.get_time()
+        with self._make_session() as session:
+            for i in range(0, len(group_ids), BATCH_SIZE):
+                session.execute(
+                    update(UpsertionRecord)
+                    .where(
+                        and_(
+                            UpsertionRecord.group_id.in_(group_ids[i : i + BATCH_SIZE]),
+                            UpsertionRecord.namespace == self.namespace,
+                        )
+                    )
+                    .values(updated_at=update_time)
+                )
+            session.commit()
+
+    def delete_namespace(self) -> None:
+        """Delete the records of all keys of the namespace in one statement"""
+        with self._make_session() as session:
+            session.execute(
+                delete(UpsertionRecord).where(
+                    UpsertionRecord.namespace == self.namespace
+                )
+            )
+            session.commit()
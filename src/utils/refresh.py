@@ -0,0 +1,179 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Any, Callable, ContextManager, Dict, Optional
+
+logging.basicConfig(level=logging.ERROR)
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _NamespaceState:
+    """
+    The refresh state of a namespace.
+
+    Attributes:
+        scheduled (Optional[Future]):
+            The future of the next run, which has not started yet. Every request
+            made before the run starts shares this future.
+        func (Optional[Callable[[], Any]]):
+            The function to be executed by the next run. The latest request wins.
+        running (Optional[Future]):
+            The future of the run in progress
+    """
+
+    scheduled: Optional[Future] = None
+    func: Optional[Callable[[], Any]] = None
+    running: Optional[Future] = None
+
+
+class RefreshCoordinator:
+    """
+    Coordinate the reindex runs of the vector database per namespace so that
+    only one run is in flight at a time for a given namespace (single-flight).
+
+    Requests made while a run is in progress collapse into at most one
+    follow-up run. Each run waits for a short debounce window before starting
+    so that a burst of requests (e.g., several uploads in a row) is served by a
+    single run. Callers receive a `Future` that they can wait on to get the
+    result of the run serving their request.
+    """
+
+    def __init__(
+        self,
+        debounce_seconds: float = 0.0,
+        job_slot: Optional[Callable[[str], ContextManager]] = None,
+    ):
+        """
+        Args:
+            debounce_seconds (float):
+                The time to wait before starting a run to let more requests
+                collapse into it. Defaults to `0.0`.
+            job_slot (Optional[Callable[[str], ContextManager]]):
+                A function returning the context manager a run of a namespace
+                is executed in (e.g., a slot of the ingestion scheduler).
+                Defaults to None.
+        """
+        self._debounce_seconds = debounce_seconds
+        self._job_slot = job_slot or (lambda namespace: nullcontext())
+        self._lock = threading.Lock()
+        self._states: Dict[str, _NamespaceState] = {}
+        self._namespace_locks: Dict[str, threading.RLock] = {}
+
+    def namespace_lock(self, namespace: str) -> threading.RLock:
+        """
+        Get the lock of the given namespace. The runs are not executed under
+        it, since they would block the other work on the namespace for their
+        whole duration: the refresh functions hold it around each of their
+        mutations (e.g., the batches of a sync), and so should any other work
+        mutating the namespace (e.g., incremental indexing or deleting the
+        namespace).
+
+        Args:
+            namespace (str): The namespace to get the lock for
+
+        Returns:
+            threading.RLock: The re-entrant lock of the namespace
+        """
+        with self._lock:
+            return self._namespace_locks.setdefault(namespace, threading.RLock())
+
+    def request(self, namespace: str, func: Callable[[], Any]) -> Future:
+        """
+        Request a run of `func` for the given namespace. If a run is already
+        scheduled but not started, the request joins it. If a run is in
+        progress, a single follow-up run is scheduled after it.
+
+        Args:
+            namespace (str):
+                The namespace to refresh
+            func (Callable[[], Any]):
+                The function performing the refresh
+
+        Returns:
+            Future:
+                The future of the run serving this request
+        """
+        with self._lock:
+            state = self._states.setdefault(namespace, _NamespaceState())
+            state.func = func
+
+            if state.scheduled is not None:
+                return state.scheduled
+
+            state.scheduled = Future()
+            if state.running is None:
+                threading.Thread(
+                    target=self._run,
+                    args=(namespace,),
+                    name=f"refresh-{namespace}",
+                    daemon=True,
+                ).start()
+
+            return state.scheduled
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of runs scheduled or in progress, across all namespaces"""
+        with self._lock:
+            return sum(
+                (state.scheduled is not None) + (state.running is not None)
+                for state in self._states.values()
+            )
+
+    def in_flight(self, namespace: str) -> Optional[Future]:
+        """
+        Get the future of the latest run requested for the given namespace
+
+        Args:
+            namespace (str): The namespace to check
+
+        Returns:
+            Optional[Future]:
+                The future of the scheduled or running run. None if nothing is
+                in flight for the namespace.
+        """
+        with self._lock:
+            state = self._states.get(namespace)
+            if state is None:
+                return None
+
+            return state.scheduled or state.running
+
+    def _run(self, namespace: str):
+        """
+        Execute the scheduled runs of a namespace until no more run is
+        requested
+
+        Args:
+            namespace (str): The namespace to execute the runs for
+        """
+        while True:
+            time.sleep(self._debounce_seconds)
+
+            with self._lock:
+                state = self._states[namespace]
+                future, func = state.scheduled, state.func
+                state.scheduled, state.func = None, None
+                state.running = future
+
+            if future.set_running_or_notify_cancel():
+                try:
+                    with self._job_slot(namespace):
+                        result = func()
+                except Exception as e:
+                    logger.error("*" * 100)
+                    logger.error(f"Error refreshing namespace '{namespace}': {e}")
+                    logger.error("*" * 100)
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+
+            with self._lock:
+                state.running = None
+                if state.scheduled is None:
+                    del self._states[namespace]
+                    return
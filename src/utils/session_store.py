@@ -0,0 +1,409 @@
+import base64
+import hashlib
+import logging
+import secrets
+import threading
+import time
+from dataclasses import dataclass
+from functools import cache
+from typing import Dict, Optional, Tuple, Union
+
+import requests
+from cryptography.fernet import Fernet, InvalidToken
+from firebase_admin import auth
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Engine,
+    Float,
+    String,
+    Table,
+    delete,
+    insert,
+    select,
+    update,
+)
+
+from configuration import settings
+from utils.cache import TTLCache
+from utils.database import get_database_engine, metadata
+from utils.firebase import get_user_by_token, refresh_id_token
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Each row is a login session. The session token given to the browser is only
+# stored as a hash, and the Firebase tokens are encrypted at rest.
+login_sessions_table = Table(
+    "login_sessions",
+    metadata,
+    Column("token_hash", String(64), primary_key=True),
+    Column("uid", String, nullable=False, index=True),
+    Column("sso", Boolean, nullable=False, default=False),
+    Column("encrypted_id_token", String, nullable=False),
+    Column("encrypted_refresh_token", String, nullable=False),
+    Column("id_token_expires_at", Float, nullable=False),
+    Column("expires_at", Float, nullable=False),
+)
+
+
+@dataclass
+class LoginSession:
+    """
+    A login session that can be resumed without the user's credentials
+
+    Attributes:
+        uid (str): The UID of the logged-in user
+        sso (bool): Whether the user logged in with a service provider
+        id_token (str): The latest Firebase Auth ID token of the user
+        refresh_token (str): The Firebase Auth refresh token of the user
+        id_token_expires_at (float): The UNIX time the ID token expires at
+    """
+
+    uid: str
+    sso: bool
+    id_token: str
+    refresh_token: str
+    id_token_expires_at: float
+
+
+def _hash_session_token(session_token: str) -> str:
+    return hashlib.sha256(session_token.encode()).hexdigest()
+
+
+class SessionStore:
+    """
+    Durable store of the login sessions, keyed by an opaque session token kept
+    in a browser cookie
+    """
+
+    def __init__(self, engine: Engine, secret_key: str, max_age_seconds: float):
+        """
+        Args:
+            engine (Engine):
+                The engine of the database storing the sessions
+            secret_key (str):
+                The secret the encryption key of the Firebase tokens is derived
+                from
+            max_age_seconds (float):
+                Number of seconds a session can be resumed for after login
+        """
+        self._engine = engine
+        self._fernet = Fernet(
+            base64.urlsafe_b64encode(hashlib.sha256(secret_key.encode()).digest())
+        )
+        self._max_age_seconds = max_age_seconds
+
+    def create(
+        self,
+        uid: str,
+        id_token: str,
+        refresh_token: str,
+        expires_in: float,
+        sso: bool = False,
+    ) -> str:
+        """
+        Create a login session
+
+        Args:
+            uid (str): The UID of the logged-in user
+            id_token (str): The Firebase Auth ID token of the user
+            refresh_token (str): The Firebase Auth refresh token of the user
+            expires_in (float): Number of seconds the ID token expires in
+            sso (bool): Whether the user logged in with a service provider
+
+        Returns:
+            str: The session token to be kept by the browser
+        """
+        session_token = secrets.token_urlsafe(32)
+        now = time.time()
+
+        with self._engine.begin() as conn:
+            conn.execute(
+                insert(login_sessions_table).values(
+                    token_hash=_hash_session_token(session_token),
+                    uid=uid,
+                    sso=sso,
+                    encrypted_id_token=self._encrypt(id_token),
+                    encrypted_refresh_token=self._encrypt(refresh_token),
+                    id_token_expires_at=now + float(expires_in),
+                    expires_at=now + self._max_age_seconds,
+                )
+            )
+
+        return session_token
+
+    def get(self, session_token: str) -> Optional[LoginSession]:
+        """
+        Get a login session that has not expired
+
+        Args:
+            session_token (str): The session token kept by the browser
+
+        Returns:
+            Optional[LoginSession]: The login session, or None if not found
+        """
+        table = login_sessions_table
+        with self._engine.connect() as conn:
+            row = conn.execute(
+                select(table).where(
+                    table.c.token_hash == _hash_session_token(session_token)
+                )
+            ).first()
+
+        if row is None or row.expires_at <= time.time():
+            return None
+
+        try:
+            return LoginSession(
+                uid=row.uid,
+                sso=row.sso,
+                id_token=self._decrypt(row.encrypted_id_token),
+                refresh_token=self._decrypt(row.encrypted_refresh_token),
+                id_token_expires_at=row.id_token_expires_at,
+            )
+        except InvalidToken:
+            # The secret key has changed since the session was created
+            return None
+
+    def exists(self, session_token: str) -> bool:
+        """
+        Check that a login session has not expired or been revoked, without
+        decrypting its tokens
+
+        Args:
+            session_token (str): The session token kept by the browser
+
+        Returns:
+            bool: Whether the login session can be resumed
+        """
+        table = login_sessions_table
+        with self._engine.connect() as conn:
+            expires_at = conn.execute(
+                select(table.c.expires_at).where(
+                    table.c.token_hash == _hash_session_token(session_token)
+                )
+            ).scalar()
+
+        return expires_at is not None and expires_at > time.time()
+
+    def update_tokens(
+        self, session_token: str, id_token: str, refresh_token: str, expires_in: float
+    ):
+        """
+        Replace the Firebase tokens of a login session after they are refreshed
+
+        Args:
+            session_token (str): The session token kept by the browser
+            id_token (str): The new Firebase Auth ID token of the user
+            refresh_token (str): The new Firebase Auth refresh token of the user
+            expires_in (float): Number of seconds the ID token expires in
+        """
+        table = login_sessions_table
+        with self._engine.begin() as conn:
+            conn.execute(
+                update(table)
+                .where(table.c.token_hash == _hash_session_token(session_token))
+                .values(
+                    encrypted_id_token=self._encrypt(id_token),
+                    encrypted_refresh_token=self._encrypt(refresh_token),
+                    id_token_expires_at=time.time() + float(expires_in),
+                )
+            )
+
+    def delete(self, session_token: str):
+        """
+        Delete a login session, e.g., when the user logs out
+
+        Args:
+            session_token (str): The session token kept by the browser
+        """
+        table = login_sessions_table
+        with self._engine.begin() as conn:
+            conn.execute(
+                delete(table).where(
+                    table.c.token_hash == _hash_session_token(session_token)
+                )
+            )
+
+    def delete_user_sessions(self, uid: str):
+        """
+        Delete all login sessions of a user, e.g., when the account is deleted
+
+        Args:
+            uid (str): The UID of the user
+        """
+        table = login_sessions_table
+        with self._engine.begin() as conn:
+            conn.execute(delete(table).where(table.c.uid == uid))
+
+    def _encrypt(self, value: str) -> str:
+        return self._fernet.encrypt(value.encode()).decode()
+
+    def _decrypt(self, value: str) -> str:
+        return self._fernet.decrypt(value.encode()).decode()
+
+
+@cache
+def get_session_store() -> Optional[SessionStore]:
+    """
+    Get the process-wide session store
+
+    Returns:
+        Optional[SessionStore]:
+            The session store, or None if `settings.SESSION_SECRET_KEY` is not
+            set, in which case login sessions are not resumed
+    """
+    if not settings.SESSION_SECRET_KEY:
+        logger.info("*" * 100)
+        logger.info("SESSION_SECRET_KEY is not set: login sessions are disabled")
+        logger.info("*" * 100)
+        return None
+
+    return SessionStore(
+        get_database_engine(),
+        settings.SESSION_SECRET_KEY,
+        settings.SESSION_MAX_AGE_SECONDS,
+    )
+
+
+# Serialize the refresh of the tokens of a session across concurrent reruns
+_refresh_lock = threading.Lock()
+# Sessions resumed recently, to skip decrypting their tokens on reruns and
+# page reloads. They are still checked in the database, since they may have
+# been revoked by another replica.
+_resumed_sessions: TTLCache[LoginSession] = TTLCache(
+    maxsize=settings.USER_CACHE_MAXSIZE,
+    ttl_seconds=settings.USER_CACHE_TTL_SECONDS,
+    name="resumed_sessions",
+)
+
+
+def create_login_session(
+    auth_response: Dict[str, Union[str, bool]], sso: bool = False
+) -> Optional[str]:
+    """
+    Create a login session from the response of a Firebase Authentication REST
+    API sign-in
+
+    Args:
+        auth_response (Dict[str, Union[str, bool]]):
+            The sign-in response, containing `localId`, `idToken`,
+            `refreshToken`, and `expiresIn`
+        sso (bool):
+            Whether the user logged in with a service provider
+
+    Returns:
+        Optional[str]:
+            The session token to be kept by the browser, or None if login
+            sessions are disabled
+    """
+    session_store = get_session_store()
+    if session_store is None:
+        return None
+
+    return session_store.create(
+        uid=auth_response["localId"],
+        id_token=auth_response["idToken"],
+        refresh_token=auth_response["refreshToken"],
+        expires_in=float(auth_response["expiresIn"]),
+        sso=sso,
+    )
+
+
+def resume_login_session(
+    session_token: str,
+) -> Optional[Tuple[auth.UserRecord, bool]]:
+    """
+    Resume a login session. The ID token is only re-minted from the refresh
+    token when it is about to expire, and the token verification and user
+    lookup are cached, so resuming a session usually needs no network call,
+    only a lookup of the session in the database.
+
+    Args:
+        session_token (str): The session token kept by the browser
+
+    Returns:
+        Optional[Tuple[auth.UserRecord, bool]]:
+            The logged-in user and whether they logged in with a service
+            provider, or None if the session cannot be resumed
+    """
+    session_store = get_session_store()
+    if session_store is None:
+        return None
+
+    login_session = _resumed_sessions.get(session_token)
+    if login_session is not None and not session_store.exists(session_token):
+        _resumed_sessions.pop(session_token)
+        return None
+
+    login_session = login_session or session_store.get(session_token)
+    if login_session is None:
+        return None
+
+    margin = settings.ID_TOKEN_REFRESH_MARGIN_SECONDS
+    if login_session.id_token_expires_at - time.time() < margin:
+        with _refresh_lock:
+            # Another rerun may have refreshed the tokens in the meantime
+            login_session = session_store.get(session_token)
+            if login_session is None:
+                return None
+
+            if login_session.id_token_expires_at - time.time() < margin:
+                try:
+                    refreshed = refresh_id_token(login_session.refresh_token)
+                except requests.RequestException:
+                    # The token service is unavailable: keep the session, and
+                    # the user logged in while the ID token is still valid
+                    if login_session.id_token_expires_at <= time.time():
+                        return None
+                else:
+                    if refreshed is None:
+                        revoke_login_session(session_token)
+                        return None
+
+                    session_store.update_tokens(
+                        session_token,
+                        id_token=refreshed["id_token"],
+                        refresh_token=refreshed["refresh_token"],
+                        expires_in=float(refreshed["expires_in"]),
+                    )
+                    # The session may have been revoked in the meantime
+                    login_session = session_store.get(session_token)
+                    if login_session is None:
+                        return None
+
+    user = get_user_by_token(login_session.id_token)
+    if user is None:
+        return None
+
+    _resumed_sessions.set(session_token, login_session)
+
+    return user, login_session.sso
+
+
+def revoke_login_session(session_token: str):
+    """
+    Revoke a login session so that it can no longer be resumed
+
+    Args:
+        session_token (str): The session token kept by the browser
+    """
+    _resumed_sessions.pop(session_token)
+
+    if session_store := get_session_store():
+        session_store.delete(session_token)
+
+
+def revoke_user_login_sessions(uid: str):
+    """
+    Revoke all login sessions of a user
+
+    Args:
+        uid (str): The UID of the user
+    """
+    # Sessions are cached by token, so drop all cached sessions of the process
+    _resumed_sessions.clear()
+
+    if session_store := get_session_store():
+        session_store.delete_user_sessions(uid)
@@ -0,0 +1,418 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional, Sequence
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from configuration import settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Approximate number of characters per token to estimate the prompt size
+CHARS_PER_TOKEN = 4
+
+# The tracer of the chat turn running in the current context, for the spans
+# recorded outside of the callbacks of the chain (e.g., the query embedding)
+_current_tracer: ContextVar[Optional["TurnTracer"]] = ContextVar(
+    "current_tracer", default=None
+)
+
+_trace_exporter: Optional["TraceExporter"] = None
+_trace_exporter_lock = threading.Lock()
+
+
+class TraceExporter:
+    """
+    Exporter of the traces of the chat turns to an in-process ring buffer and,
+    optionally, to a local file. Each span is a JSON object with the fields of
+    an OpenTelemetry span (trace and span IDs in hexadecimal, start and end
+    times in nanoseconds since the epoch, status, and attributes), and the file
+    has one span per line.
+    """
+
+    def __init__(self, buffer_size: int = 100, file_path: Optional[str] = None):
+        """
+        Args:
+            buffer_size (int):
+                Number of traces kept in memory. Defaults to `100`.
+            file_path (Optional[str]):
+                Path of the JSON lines file the spans are appended to. Defaults
+                to None, in which case the traces are only kept in memory.
+        """
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._traces: Deque[List[Dict[str, Any]]] = deque(maxlen=buffer_size)
+
+        if file_path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+
+    def export(self, spans: List[Dict[str, Any]]):
+        """
+        Export the spans of a trace
+
+        Args:
+            spans (List[Dict[str, Any]]): The spans of the trace
+        """
+        with self._lock:
+            self._traces.append(spans)
+
+            if self.file_path is not None:
+                try:
+                    with open(self.file_path, "a", encoding="utf-8") as file:
+                        for span in spans:
+                            file.write(json.dumps(span) + "\n")
+                except OSError as e:
+                    logger.error(f"Failed to write the trace: {e}")
+
+    def recent_traces(self) -> List[List[Dict[str, Any]]]:
+        """
+        Returns:
+            List[List[Dict[str, Any]]]: The spans of the recent traces, oldest first
+        """
+        with self._lock:
+            return list(self._traces)
+
+
+def get_trace_exporter() -> TraceExporter:
+    """
+    Get the exporter of the traces of the process, creating it on first use
+
+    Returns:
+        TraceExporter: The trace exporter
+    """
+    global _trace_exporter
+
+    with _trace_exporter_lock:
+        if _trace_exporter is None:
+            _trace_exporter = TraceExporter(
+                buffer_size=settings.TRACE_BUFFER_SIZE,
+                file_path=settings.TRACE_FILE,
+            )
+
+        return _trace_exporter
+
+
+@contextmanager
+def trace_span(name: str, **attributes: Any) -> Iterator[Optional[Dict[str, Any]]]:
+    """
+    Context manager recording a span in the trace of the chat turn running in
+    the current context, if any
+
+    Args:
+        name (str): The name of the span
+        **attributes (Any): The attributes of the span
+
+    Yields:
+        Optional[Dict[str, Any]]: The span, or None if no turn is traced
+    """
+    tracer = _current_tracer.get()
+    if tracer is None:
+        yield None
+        return
+
+    span_id = uuid.uuid4()
+    span = tracer.start_span(span_id, name, attributes=attributes)
+    try:
+        yield span
+    except BaseException:
+        tracer.end_span(span_id, status="error")
+        raise
+    else:
+        tracer.end_span(span_id)
+
+
+class TurnTracer(BaseCallbackHandler):
+    """
+    Callback handler recording the spans of a chat turn: the rewrite of the
+    question, the retrieval (with the query embedding and the vector search),
+    the size of the stuffed documents, the LLM calls with their time to first
+    token, and the whole turn. The trace is exported when the turn completes,
+    fails, or is finished early (e.g., when the stream is cancelled).
+    """
+
+    # Run in the thread or task of the chain, so that the tracer is set in the
+    # context of the runs it traces
+    run_inline = True
+
+    # Chains recorded as spans besides the root chain of the turn
+    traced_chains = ("rewrite_question",)
+
+    def __init__(self, exporter: Optional[TraceExporter] = None):
+        """
+        Args:
+            exporter (Optional[TraceExporter]):
+                The exporter of the trace. Defaults to the exporter of the
+                process.
+        """
+        self.exporter = exporter or get_trace_exporter()
+        self.trace_id = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._root_run_id: Optional[UUID] = None
+        self._spans: Dict[UUID, Dict[str, Any]] = {}
+        # Parent of each run, to attach the spans to their nearest traced
+        # ancestor
+        self._parent_run_ids: Dict[UUID, Optional[UUID]] = {}
+        self._open_retrievals: List[UUID] = []
+        self._exported = False
+
+    @property
+    def spans(self) -> List[Dict[str, Any]]:
+        """The spans recorded so far, in start order"""
+        with self._lock:
+            return [dict(span) for span in self._spans.values()]
+
+    def start_span(
+        self,
+        run_id: UUID,
+        name: str,
+        parent_run_id: Optional[UUID] = None,
+        attributes: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Start a span
+
+        Args:
+            run_id (UUID):
+                The ID of the run of the span
+            name (str):
+                The name of the span
+            parent_run_id (Optional[UUID]):
+                The ID of the parent run. The span is attached to the nearest
+                traced ancestor of the run, or without a parent run, to the
+                open retrieval, if any, or the root span. Defaults to None.
+            attributes (Optional[Dict[str, Any]]):
+                The attributes of the span. Defaults to None.
+
+        Returns:
+            Dict[str, Any]: The span
+        """
+        with self._lock:
+            self._parent_run_ids[run_id] = parent_run_id
+            while parent_run_id is not None and parent_run_id not in self._spans:
+                parent_run_id = self._parent_run_ids.get(parent_run_id)
+
+            if parent_run_id is None and run_id != self._root_run_id:
+                parent_run_id = (
+                    self._open_retrievals[-1]
+                    if self._open_retrievals
+                    else self._root_run_id
+                )
+
+            span = {
+                "trace_id": self.trace_id,
+                "span_id": run_id.hex,
+                "parent_span_id": parent_run_id.hex if parent_run_id else None,
+                "name": name,
+                "start_time_unix_nano": time.time_ns(),
+                "end_time_unix_nano": None,
+                "status": "unset",
+                "attributes": dict(attributes or {}),
+            }
+            self._spans[run_id] = span
+
+            return span
+
+    def end_span(
+        self,
+        run_id: UUID,
+        status: str = "ok",
+        attributes: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        End a span, and export the trace if it is the root span
+
+        Args:
+            run_id (UUID): The ID of the run of the span
+            status (str): The status of the span. Defaults to `"ok"`.
+            attributes (Optional[Dict[str, Any]]):
+                Attributes added to the span. Defaults to None.
+        """
+        with self._lock:
+            span = self._spans.get(run_id)
+            if span is None or span["end_time_unix_nano"] is not None:
+                return
+
+            span["end_time_unix_nano"] = time.time_ns()
+            span["status"] = status
+            span["attributes"].update(attributes or {})
+            span["attributes"]["duration_ms"] = _duration_ms(span)
+
+        if run_id == self._root_run_id:
+            self.finish()
+
+    def finish(self, status: str = "cancelled"):
+        """
+        End the open spans and export the trace, unless already exported
+
+        Args:
+            status (str):
+                The status of the spans still open. Defaults to `"cancelled"`.
+        """
+        with self._lock:
+            if self._exported or self._root_run_id is None:
+                return
+            self._exported = True
+
+            now = time.time_ns()
+            for span in self._spans.values():
+                if span["end_time_unix_nano"] is None:
+                    span["end_time_unix_nano"] = now
+                    span["status"] = status
+                    span["attributes"]["duration_ms"] = _duration_ms(span)
+
+            spans = [dict(span) for span in self._spans.values()]
+
+        _current_tracer.set(None)
+        self.exporter.export(spans)
+
+    def on_chain_start(
+        self,
+        serialized: Optional[Dict[str, Any]],
+        inputs: Any,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ):
+        if self._root_run_id is None:
+            self._root_run_id = run_id
+            _current_tracer.set(self)
+            self.start_span(run_id, "chat_turn")
+        elif kwargs.get("name") in self.traced_chains:
+            self.start_span(run_id, kwargs["name"], parent_run_id)
+        else:
+            with self._lock:
+                self._parent_run_ids[run_id] = parent_run_id
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any):
+        self.end_span(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self.end_span(run_id, status="error", attributes={"error": repr(error)})
+
+    def on_chat_model_start(
+        self,
+        serialized: Optional[Dict[str, Any]],
+        messages: List[List[Any]],
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ):
+        tier = (metadata or {}).get("tier", "llm")
+        prompt_chars = sum(
+            len(str(message.content)) for batch in messages for message in batch
+        )
+        self.start_span(
+            run_id,
+            f"llm.{tier}",
+            parent_run_id,
+            attributes={
+                "tier": tier,
+                "model": (metadata or {}).get("ls_model_name"),
+                "prompt_chars": prompt_chars,
+                "prompt_tokens_estimate": prompt_chars // CHARS_PER_TOKEN,
+            },
+        )
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any):
+        with self._lock:
+            span = self._spans.get(run_id)
+            if span is None or "time_to_first_token_ms" in span["attributes"]:
+                return
+
+            now = time.time_ns()
+            span["attributes"]["time_to_first_token_ms"] = (
+                now - span["start_time_unix_nano"]
+            ) / 1e6
+
+            # The time to first token of the turn is the one of the answer
+            root = self._spans.get(self._root_run_id)
+            if (
+                span["attributes"].get("tier") == "answer"
+                and root is not None
+                and "time_to_first_token_ms" not in root["attributes"]
+            ):
+                root["attributes"]["time_to_first_token_ms"] = (
+                    now - root["start_time_unix_nano"]
+                ) / 1e6
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any):
+        attributes = {}
+        try:
+            usage = response.generations[0][0].message.usage_metadata
+        except (AttributeError, IndexError):
+            usage = None
+        if usage:
+            attributes["input_tokens"] = usage.get("input_tokens")
+            attributes["output_tokens"] = usage.get("output_tokens")
+
+        self.end_span(run_id, attributes=attributes)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self.end_span(run_id, status="error", attributes={"error": repr(error)})
+
+    def on_retriever_start(
+        self,
+        serialized: Optional[Dict[str, Any]],
+        query: str,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ):
+        self.start_span(
+            run_id, "retrieval", parent_run_id, attributes={"query_chars": len(query)}
+        )
+        with self._lock:
+            self._open_retrievals.append(run_id)
+
+    def on_retriever_end(
+        self, documents: Sequence[Any], *, run_id: UUID, **kwargs: Any
+    ):
+        document_chars = sum(len(document.page_content) for document in documents)
+        self._close_retrieval(run_id)
+        self.end_span(
+            run_id,
+            attributes={
+                "document_count": len(documents),
+                "document_chars": document_chars,
+                "document_tokens_estimate": document_chars // CHARS_PER_TOKEN,
+            },
+        )
+
+        # The vector search is the part of the retrieval not spent embedding
+        with self._lock:
+            span = self._spans[run_id]
+            embedding_ms = sum(
+                child["attributes"].get("duration_ms", 0)
+                for child in self._spans.values()
+                if child["parent_span_id"] == span["span_id"]
+                and child["name"] == "query_embedding"
+            )
+            span["attributes"]["vector_search_ms"] = (
+                span["attributes"]["duration_ms"] - embedding_ms
+            )
+
+    def on_retriever_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._close_retrieval(run_id)
+        self.end_span(run_id, status="error", attributes={"error": repr(error)})
+
+    def _close_retrieval(self, run_id: UUID):
+        with self._lock:
+            if run_id in self._open_retrievals:
+                self._open_retrievals.remove(run_id)
+
+
+def _duration_ms(span: Dict[str, Any]) -> float:
+    return (span["end_time_unix_nano"] - span["start_time_unix_nano"]) / 1e6
@@ -3,8 +3,15 @@ from enum import Enum
 
 import streamlit as st
 
-from utils.firebase import delete_blob_from_storage, delete_user_by_uid
-from utils.rag import delete_namespace_in_vector_database
+from utils.account_deletion import get_account_deletion_manager
+from utils.session_store import revoke_user_login_sessions
+
+# Label of each step of an account deletion
+ACCOUNT_DELETION_STEPS = {
+    "vectors": "Indexed documents",
+    "storage": "Uploaded files",
+    "auth": "Login credentials",
+}
 
 
 class MessageType(Enum):
@@ -39,8 +46,9 @@ def display_message(type: MessageType, message: str = ""):
 @st.dialog("⚠ DELETE ACCOUNT ⚠")
 def delete_account(uid: str):
     """
-    Popup dialog to confirm if the user wants to delete their account and delete
-    the account if the user confirms.
+    Popup dialog to confirm if the user wants to delete their account. If the
+    user confirms, the user is logged out right away and the account is deleted
+    in the background, with its progress shown on the authentication page.
 
     Args:
         uid (str): The user's Firebase UID
@@ -54,13 +62,48 @@ def delete_account(uid: str):
     if no_clicked:
         st.rerun()
     elif yes_clicked:
-        # Delete user's namespace in Pinecone (and the record manager cache)
-        delete_namespace_in_vector_database(uid)
-        # Delete user's folder in Firebase Storage
-        delete_blob_from_storage(uid)
-        # Delete user in Firebase Authentication
-        delete_user_by_uid(uid)
+        # Delete user's namespace in Pinecone, folder in Firebase Storage, and
+        # user in Firebase Authentication in the background
+        get_account_deletion_manager().request(uid)
+        # Revoke the login sessions of the user on all browsers
+        revoke_user_login_sessions(uid)
         # Remove the session state since the user has deleted the account
         for key in st.session_state.keys():
             st.session_state.pop(key, None)
+        # Track the progress of the deletion on the authentication page
+        st.session_state["deleted_account_uid"] = uid
+        # Clear the session cookie on the next run
+        st.session_state["pending_session_cookie"] = ""
+        st.session_state["session_resume_attempted"] = True
         st.rerun()
+
+
+@st.fragment(run_every=2)
+def account_deletion_status(uid: str):
+    """
+    Display the progress of the deletion of an account, refreshed every few
+    seconds.
+
+    Args:
+        uid (str): The UID of the deleted user
+    """
+    status = get_account_deletion_manager().status(uid)
+    if status is None:
+        return
+
+    if status.status == "completed":
+        st.success("Your account has been deleted.")
+        st.session_state.pop("deleted_account_uid", None)
+        return
+
+    if status.status == "failed":
+        st.error(
+            "Your account could not be fully deleted yet. The deletion will be "
+            "retried later."
+        )
+    else:
+        st.info("Your account is being deleted...")
+
+    for step, label in ACCOUNT_DELETION_STEPS.items():
+        icon = ":white_check_mark:" if step in status.completed_steps else ":hourglass:"
+        st.write(f"{icon} {label}")
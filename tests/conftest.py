@@ -0,0 +1,24 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# The modules import each other from src/, as when running the app
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+# Required settings, which the tests do not use
+os.environ.setdefault("GOOGLE_OIDC_REDIRECT_URI", "http://localhost:8080")
+os.environ.setdefault("FIREBASE_API_KEY", "test")
+os.environ.setdefault("FIREBASE_STORAGE_BUCKET_NAME", "test")
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """An engine of a fresh SQLite database with the tables of the app"""
+    from utils.database import create_database_engine, create_database_schema
+
+    engine = create_database_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    create_database_schema(engine)
+    yield engine
+    engine.dispose()
@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+from utils.account_deletion import AccountDeletionManager, AccountDeletionStore
+
+
+@pytest.fixture
+def store(engine):
+    return AccountDeletionStore(engine)
+
+
+class Steps:
+    """Steps recording their calls, each failing a given number of times"""
+
+    def __init__(self, names, failures=None):
+        self.calls = Counter()
+        self.failures = Counter(failures or {})
+        self.functions = {name: self._step(name) for name in names}
+
+    def _step(self, name):
+        def run(uid):
+            self.calls[name] += 1
+            if self.failures[name] > 0:
+                self.failures[name] -= 1
+                raise RuntimeError(f"{name} unavailable")
+
+        return run
+
+
+def wait_for_status(store, uid, status, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while store.get(uid).status != status:
+        assert time.monotonic() < deadline, f"Deletion of {uid} is not {status}"
+        time.sleep(0.01)
+
+
+def make_manager(store, steps, max_attempts=3):
+    return AccountDeletionManager(
+        store, steps.functions, max_attempts=max_attempts, retry_backoff_seconds=0
+    )
+
+
+def test_deletion_runs_every_step(store):
+    steps = Steps(["vectors", "storage", "auth"])
+
+    make_manager(store, steps).request("uid").result(timeout=5)
+
+    assert steps.calls == {"vectors": 1, "storage": 1, "auth": 1}
+    status = store.get("uid")
+    assert status.status == "completed"
+    assert status.completed_steps == ()
+    assert store.get_unfinished() == []
+
+
+def test_failed_steps_are_retried_alone(store):
+    steps = Steps(["vectors", "storage", "auth"], failures={"storage": 2})
+
+    make_manager(store, steps).request("uid").result(timeout=5)
+
+    assert steps.calls == {"vectors": 1, "storage": 3, "auth": 1}
+    status = store.get("uid")
+    assert status.status == "completed"
+    assert status.attempts == 2
+    assert status.error is None
+
+
+def test_deletion_out_of_attempts_is_resumed(store):
+    steps = Steps(["vectors", "auth"], failures={"auth": 3})
+
+    make_manager(store, steps).request("uid").result(timeout=5)
+
+    status = store.get("uid")
+    assert status.status == "failed"
+    assert status.attempts == 3
+    assert status.error == "auth: auth unavailable"
+    assert status.completed_steps == ("vectors",)
+
+    # The next process start resumes it with the remaining steps
+    assert make_manager(store, steps).resume() == 1
+    wait_for_status(store, "uid", "completed")
+    assert steps.calls == {"vectors": 1, "auth": 4}
+
+
+def test_interrupted_deletion_resumes_with_the_remaining_steps(store):
+    store.request("uid", now=100.0)
+    store.set_status("uid", "running", now=101.0)
+    store.complete_step("uid", "vectors", now=102.0)
+    steps = Steps(["vectors", "storage"])
+
+    assert make_manager(store, steps).resume() == 1
+    wait_for_status(store, "uid", "completed")
+
+    assert steps.calls == {"storage": 1}
+
+
+def test_requests_join_the_deletion_in_progress(store):
+    release = threading.Event()
+    manager = AccountDeletionManager(
+        store, {"auth": lambda uid: release.wait(timeout=5)}
+    )
+
+    first = manager.request("uid")
+    second = manager.request("uid")
+    release.set()
+
+    assert first is second
+    first.result(timeout=5)
+    assert store.get("uid").status == "completed"
+
+
+def test_completed_deletion_is_requested_again(store):
+    steps = Steps(["auth"])
+    manager = make_manager(store, steps)
+    manager.request("uid").result(timeout=5)
+
+    manager.request("uid").result(timeout=5)
+
+    assert steps.calls == {"auth": 2}
+    assert store.get("uid").status == "completed"
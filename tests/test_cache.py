@@ -0,0 +1,166 @@
+import threading
+import time
+
+import pytest
+
+from utils import cache
+from utils.cache import ResourceCache, TTLCache, tenant_cache_resource
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache, "time", clock)
+    return clock
+
+
+def test_ttl_cache_entries_expire(clock):
+    ttl_cache = TTLCache(maxsize=10, ttl_seconds=60)
+    ttl_cache.set("a", 1)
+    ttl_cache.set("b", 2, ttl_seconds=120)
+
+    clock.now += 59
+    assert ttl_cache.get("a") == 1
+
+    clock.now += 1
+    assert ttl_cache.get("a", "missing") == "missing"
+    assert ttl_cache.get("b") == 2
+    assert len(ttl_cache) == 1
+
+
+def test_ttl_cache_keeps_none_values(clock):
+    ttl_cache = TTLCache(maxsize=10, ttl_seconds=60)
+    ttl_cache.set("a", None)
+
+    assert ttl_cache.get("a", "missing") is None
+
+
+def test_ttl_cache_does_not_keep_entries_without_ttl(clock):
+    ttl_cache = TTLCache(maxsize=10, ttl_seconds=60)
+    ttl_cache.set("a", 1, ttl_seconds=0)
+
+    assert ttl_cache.get("a") is None
+
+
+def test_ttl_cache_evicts_the_least_recently_used_entry(clock):
+    ttl_cache = TTLCache(maxsize=2, ttl_seconds=60)
+    ttl_cache.set("a", 1)
+    ttl_cache.set("b", 2)
+    ttl_cache.get("a")
+    ttl_cache.set("c", 3)
+
+    assert ttl_cache.get("a") == 1
+    assert ttl_cache.get("b") is None
+    assert ttl_cache.get("c") == 3
+
+
+def test_ttl_cache_pop_and_clear(clock):
+    ttl_cache = TTLCache(maxsize=10, ttl_seconds=60)
+    ttl_cache.set("a", 1)
+    ttl_cache.set("b", 2)
+
+    assert ttl_cache.pop("a") == 1
+    assert ttl_cache.pop("a", "missing") == "missing"
+    ttl_cache.clear()
+    assert len(ttl_cache) == 0
+
+
+def test_resource_cache_creates_a_missing_resource_once():
+    resource_cache = ResourceCache("test", maxsize=10, idle_ttl_seconds=60)
+    started = threading.Event()
+    calls = []
+
+    def create():
+        calls.append(1)
+        started.set()
+        # Let the other lookups arrive while the resource is created
+        time.sleep(0.1)
+        return object()
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(resource_cache.get_or_create("a", create))
+        )
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len(results) == 5
+    assert all(result is results[0] for result in results)
+
+
+def test_resource_cache_does_not_keep_failed_creations():
+    resource_cache = ResourceCache("test", maxsize=10, idle_ttl_seconds=60)
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        resource_cache.get_or_create("a", fail)
+
+    assert resource_cache.get_or_create("a", lambda: "ok") == "ok"
+    assert len(resource_cache) == 1
+
+
+def test_resource_cache_evicts_idle_resources(clock):
+    resource_cache = ResourceCache("test", maxsize=10, idle_ttl_seconds=60)
+    resource_cache.get_or_create("a", lambda: "a")
+    clock.now += 30
+    resource_cache.get_or_create("b", lambda: "b")
+
+    clock.now += 40
+    assert resource_cache.get_or_create("b", lambda: "new b") == "b"
+    assert [entry["key"] for entry in resource_cache.entries()] == ["b"]
+    assert resource_cache.get_or_create("a", lambda: "new a") == "new a"
+
+
+def test_resource_cache_evicts_the_least_recently_used_resource(clock):
+    resource_cache = ResourceCache("test", maxsize=2, idle_ttl_seconds=60)
+    resource_cache.get_or_create("a", lambda: "a")
+    resource_cache.get_or_create("b", lambda: "b")
+    resource_cache.get_or_create("a", lambda: "new a")
+    resource_cache.get_or_create("c", lambda: "c")
+
+    assert [entry["key"] for entry in resource_cache.entries()] == ["a", "c"]
+
+
+def test_resource_cache_sizes_without_the_shared_objects():
+    shared = list(range(10_000))
+    resource_cache = ResourceCache("test", maxsize=10, idle_ttl_seconds=60)
+    resource_cache.get_or_create("a", lambda: {"model": shared}, shared=[shared])
+    resource_cache.get_or_create("b", lambda: {"model": shared})
+
+    sizes = {entry["key"]: entry["size_bytes"] for entry in resource_cache.entries()}
+    assert sizes["a"] < sizes["b"]
+
+
+def test_tenant_cache_resource_keys_on_the_public_arguments():
+    calls = []
+
+    @tenant_cache_resource(maxsize=10, idle_ttl_seconds=60)
+    def setup_retriever(namespace: str, _embedding=None):
+        calls.append(namespace)
+        return [namespace]
+
+    first = setup_retriever("a", _embedding=object())
+    assert setup_retriever("a", _embedding=object()) is first
+    assert setup_retriever("b") is not first
+    assert calls == ["a", "b"]
+
+    assert setup_retriever.invalidate(namespace="a")
+    assert not setup_retriever.invalidate(namespace="a")
+    assert setup_retriever("a") is not first
+    assert calls == ["a", "b", "a"]
@@ -0,0 +1,90 @@
+import pytest
+
+from utils import content_index
+from utils.content_index import ContentIndex
+
+
+@pytest.fixture
+def index(engine):
+    return ContentIndex(engine)
+
+
+def test_register_detects_duplicates_per_namespace(index):
+    assert index.register("ns", "ns/a.pdf", "hash-1") is None
+    assert index.register("ns", "ns/b.pdf", "hash-1") == "ns/a.pdf"
+    assert index.register("other", "other/a.pdf", "hash-1") is None
+
+    assert index.get("ns", "ns/a.pdf") == ("hash-1", None)
+    assert index.get("ns", "ns/b.pdf") == ("hash-1", "ns/a.pdf")
+    assert index.get("ns", "ns/missing.pdf") is None
+
+
+def test_register_again_is_not_an_alias_of_itself(index):
+    index.register("ns", "ns/a.pdf", "hash-1")
+
+    assert index.register("ns", "ns/a.pdf", "hash-1") is None
+    assert index.get("ns", "ns/a.pdf") == ("hash-1", None)
+
+
+def test_register_without_alias_or_new_content(index):
+    index.register("ns", "ns/a.pdf", "hash-1")
+
+    # A duplicate is reported but not registered
+    assert index.register("ns", "ns/b.pdf", "hash-1", alias=False) == "ns/a.pdf"
+    assert index.get("ns", "ns/b.pdf") is None
+
+    # New content is not registered before it is stored
+    assert index.register("ns", "ns/c.pdf", "hash-2", new_content=False) is None
+    assert index.get("ns", "ns/c.pdf") is None
+
+
+def test_remove_promotes_the_first_alias(index, monkeypatch):
+    # Several statements per call
+    monkeypatch.setattr(content_index, "BATCH_SIZE", 2)
+    index.register("ns", "ns/a.pdf", "hash-1")
+    for path in ("ns/c.pdf", "ns/b.pdf", "ns/d.pdf"):
+        index.register("ns", path, "hash-1")
+    index.register("ns", "ns/e.pdf", "hash-2")
+
+    promotions = index.remove("ns", ["ns/a.pdf", "ns/b.pdf", "ns/e.pdf"])
+
+    assert promotions == {"ns/a.pdf": ("ns/c.pdf", ["ns/d.pdf"])}
+    assert index.get("ns", "ns/a.pdf") is None
+    assert index.get("ns", "ns/b.pdf") is None
+    assert index.get("ns", "ns/c.pdf") == ("hash-1", None)
+    assert index.get("ns", "ns/d.pdf") == ("hash-1", "ns/c.pdf")
+    assert index.get("ns", "ns/e.pdf") is None
+
+
+def test_remove_content_and_all_aliases(index):
+    index.register("ns", "ns/a.pdf", "hash-1")
+    index.register("ns", "ns/b.pdf", "hash-1")
+
+    assert index.remove("ns", ["ns/a.pdf", "ns/b.pdf"]) == {}
+    assert index.register("ns", "ns/c.pdf", "hash-1") is None
+
+
+def test_move_keeps_the_aliases_pointing_to_the_content(index):
+    index.register("ns", "ns/a.pdf", "hash-1")
+    index.register("ns", "ns/b.pdf", "hash-1")
+    index.register("ns", "ns/c.pdf", "hash-2")
+
+    retargeted = index.move(
+        "ns", {"ns/a.pdf": "ns/docs/a.pdf", "ns/b.pdf": "ns/docs/b.pdf"}
+    )
+
+    assert retargeted == {"ns/docs/b.pdf": "ns/docs/a.pdf"}
+    assert index.get("ns", "ns/a.pdf") is None
+    assert index.get("ns", "ns/docs/a.pdf") == ("hash-1", None)
+    assert index.get("ns", "ns/docs/b.pdf") == ("hash-1", "ns/docs/a.pdf")
+    assert index.get("ns", "ns/c.pdf") == ("hash-2", None)
+
+
+def test_move_over_a_stale_entry(index):
+    index.register("ns", "ns/a.pdf", "hash-1")
+    index.register("ns", "ns/b.pdf", "hash-2")
+
+    index.move("ns", {"ns/a.pdf": "ns/b.pdf"})
+
+    assert index.get("ns", "ns/b.pdf") == ("hash-1", None)
+    assert index.register("ns", "ns/c.pdf", "hash-2") is None
@@ -0,0 +1,100 @@
+import pytest
+import requests
+
+from utils.http import HttpClient
+
+
+def make_response(status_code: int) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    return response
+
+
+@pytest.fixture
+def client():
+    client = HttpClient(max_retries=2, backoff_seconds=0.0)
+    yield client
+    client.close()
+
+
+def stub_session(monkeypatch, client, outcomes):
+    """Make the session of the client return or raise the given outcomes in
+    turn, and record the methods of the requests"""
+    outcomes, methods = list(outcomes), []
+
+    def request(method, url, **kwargs):
+        methods.append(method)
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return make_response(outcome)
+
+    monkeypatch.setattr(client._session, "request", request)
+    return methods
+
+
+@pytest.mark.parametrize("status_code", [429, 500, 502, 503, 504])
+def test_retries_retryable_status_codes(monkeypatch, client, status_code):
+    methods = stub_session(monkeypatch, client, [status_code, 200])
+
+    assert client.post("http://test/token").status_code == 200
+    assert methods == ["POST", "POST"]
+
+
+def test_returns_the_last_response_when_retries_are_exhausted(monkeypatch, client):
+    methods = stub_session(monkeypatch, client, [503, 503, 503, 200])
+
+    assert client.get("http://test/keys").status_code == 503
+    assert len(methods) == 3
+
+
+@pytest.mark.parametrize("status_code", [200, 400, 401, 404])
+def test_does_not_retry_other_status_codes(monkeypatch, client, status_code):
+    methods = stub_session(monkeypatch, client, [status_code, 200])
+
+    assert client.post("http://test/token").status_code == status_code
+    assert len(methods) == 1
+
+
+@pytest.mark.parametrize("method", ["GET", "POST"])
+def test_retries_connection_errors(monkeypatch, client, method):
+    methods = stub_session(monkeypatch, client, [requests.ConnectionError(), 200])
+
+    assert client.request(method, "http://test/token").status_code == 200
+    assert len(methods) == 2
+
+
+def test_retries_read_timeouts_of_idempotent_methods_only(monkeypatch, client):
+    methods = stub_session(monkeypatch, client, [requests.ReadTimeout(), 200])
+    assert client.get("http://test/keys").status_code == 200
+    assert len(methods) == 2
+
+    # The server may have processed the request
+    methods = stub_session(monkeypatch, client, [requests.ReadTimeout(), 200])
+    with pytest.raises(requests.ReadTimeout):
+        client.post("http://test/token")
+    assert len(methods) == 1
+
+
+def test_raises_the_last_error_when_retries_are_exhausted(monkeypatch, client):
+    methods = stub_session(
+        monkeypatch, client, [requests.ConnectionError("down")] * 3 + [200]
+    )
+
+    with pytest.raises(requests.ConnectionError, match="down"):
+        client.get("http://test/keys")
+    assert len(methods) == 3
+
+
+def test_backoff_is_bounded(monkeypatch):
+    client = HttpClient(max_retries=4, backoff_seconds=1.0, max_backoff_seconds=3.0)
+    stub_session(monkeypatch, client, [503] * 5)
+    bounds = []
+    monkeypatch.setattr(
+        "utils.http.random.uniform", lambda low, high: bounds.append(high) or 0.0
+    )
+    monkeypatch.setattr("utils.http.time.sleep", lambda seconds: None)
+
+    client.get("http://test/keys")
+
+    assert bounds == [1.0, 2.0, 3.0, 3.0]
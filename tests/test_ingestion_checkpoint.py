@@ -0,0 +1,75 @@
+import pytest
+
+from utils import ingestion_checkpoint
+from utils.ingestion_checkpoint import IngestionCheckpointStore
+
+
+@pytest.fixture
+def store(engine):
+    return IngestionCheckpointStore(engine)
+
+
+def test_interrupted_job_resumes_after_a_restart(engine, store):
+    job_started_at = store.start("ns", now=100.0)
+    store.mark_indexed("ns", {"ns/a.pdf": "v1", "ns/b.pdf": "v1"}, job_started_at)
+
+    # A new process resumes the job with the files already indexed
+    restarted_store = IngestionCheckpointStore(engine)
+    assert restarted_store.start("ns", now=200.0) == 100.0
+    assert restarted_store.get_files("ns") == {
+        "ns/a.pdf": ("v1", 100.0),
+        "ns/b.pdf": ("v1", 100.0),
+    }
+
+
+def test_finish_forgets_the_files_the_job_did_not_find(store):
+    first_job = store.start("ns", now=100.0)
+    store.mark_indexed("ns", {"ns/a.pdf": "v1", "ns/b.pdf": "v1"}, first_job)
+    store.finish("ns", first_job)
+
+    second_job = store.start("ns", now=200.0)
+    assert second_job == 200.0
+    # "ns/b.pdf" was deleted in the meantime
+    store.mark_indexed("ns", {"ns/a.pdf": "v2"}, second_job)
+    store.finish("ns", second_job)
+
+    assert store.get_files("ns") == {"ns/a.pdf": ("v2", 200.0)}
+    assert store.start("ns", now=300.0) == 300.0
+
+
+def test_mark_indexed_replaces_the_versions(store, monkeypatch):
+    # Several statements per call
+    monkeypatch.setattr(ingestion_checkpoint, "BATCH_SIZE", 2)
+    paths = [f"ns/{i}.pdf" for i in range(5)]
+    store.mark_indexed("ns", {path: "v1" for path in paths}, 100.0)
+
+    store.mark_indexed("ns", {path: "v2" for path in paths[:3]}, 200.0)
+
+    files = store.get_files("ns")
+    assert [files[path] for path in paths] == [("v2", 200.0)] * 3 + [("v1", 100.0)] * 2
+
+
+def test_forgotten_files_are_indexed_again(store, monkeypatch):
+    monkeypatch.setattr(ingestion_checkpoint, "BATCH_SIZE", 2)
+    job_started_at = store.start("ns", now=100.0)
+    store.mark_indexed(
+        "ns", {"ns/a.pdf": "v1", "ns/b.pdf": "v1", "ns/c.pdf": "v1"}, job_started_at
+    )
+
+    store.forget_files("ns", ["ns/a.pdf", "ns/c.pdf"])
+
+    assert store.get_files("ns") == {"ns/b.pdf": ("v1", 100.0)}
+
+
+def test_namespaces_are_independent(store):
+    store.start("a", now=100.0)
+    store.mark_indexed("a", {"a/x.pdf": "v1"}, 100.0)
+    store.start("b", now=200.0)
+    store.mark_indexed("b", {"b/x.pdf": "v1"}, 200.0)
+
+    store.delete("a")
+
+    assert store.get_files("a") == {}
+    assert store.start("a", now=300.0) == 300.0
+    assert store.get_files("b") == {"b/x.pdf": ("v1", 200.0)}
+    assert store.start("b", now=300.0) == 200.0
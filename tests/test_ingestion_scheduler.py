@@ -0,0 +1,144 @@
+import threading
+import time
+
+import pytest
+
+from utils import ingestion_scheduler
+from utils.ingestion_scheduler import IngestionQuotaExceededError, IngestionScheduler
+
+
+def wait_until(predicate, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "Timed out waiting for the condition"
+        time.sleep(0.01)
+
+
+def run_queued_jobs(scheduler, jobs):
+    """Queue the jobs, in order, behind a job holding the only slot, then
+    release the slot and return the order the jobs ran in"""
+    order = []
+    threads = []
+
+    def run(namespace, priority, name):
+        with scheduler.slot(namespace, priority):
+            order.append(name)
+
+    with scheduler.slot("blocker"):
+        for namespace, priority, name in jobs:
+            thread = threading.Thread(target=run, args=(namespace, priority, name))
+            thread.start()
+            threads.append(thread)
+            wait_until(lambda: scheduler.queue_depth == len(threads))
+
+    for thread in threads:
+        thread.join(timeout=5)
+
+    return order
+
+
+def test_tenants_take_turns():
+    scheduler = IngestionScheduler(max_concurrent_jobs=1)
+
+    order = run_queued_jobs(
+        scheduler,
+        [
+            ("a", "bulk", "a1"),
+            ("a", "bulk", "a2"),
+            ("a", "bulk", "a3"),
+            ("b", "bulk", "b1"),
+            ("c", "bulk", "c1"),
+        ],
+    )
+
+    assert order == ["a1", "b1", "c1", "a2", "a3"]
+
+
+def test_interactive_jobs_go_first_without_starving_bulk_jobs():
+    scheduler = IngestionScheduler(max_concurrent_jobs=1, interactive_weight=2)
+
+    order = run_queued_jobs(
+        scheduler,
+        [
+            ("a", "bulk", "b1"),
+            ("b", "bulk", "b2"),
+            ("c", "interactive", "i1"),
+            ("d", "interactive", "i2"),
+            ("e", "interactive", "i3"),
+            ("f", "interactive", "i4"),
+        ],
+    )
+
+    assert order == ["i1", "i2", "b1", "i3", "i4", "b2"]
+
+
+def test_tenant_cannot_take_more_slots_than_its_limit():
+    scheduler = IngestionScheduler(max_concurrent_jobs=2, max_jobs_per_tenant=1)
+    dispatched = {"a": threading.Event(), "b": threading.Event()}
+
+    def run(namespace):
+        with scheduler.slot(namespace):
+            dispatched[namespace].set()
+
+    with scheduler.slot("a"):
+        threads = [threading.Thread(target=run, args=(ns,)) for ns in ("a", "b")]
+        for thread in threads:
+            thread.start()
+
+        assert dispatched["b"].wait(timeout=5)
+        assert not dispatched["a"].is_set()
+        assert scheduler.queue_depth == 1
+
+    assert dispatched["a"].wait(timeout=5)
+    for thread in threads:
+        thread.join(timeout=5)
+
+
+def test_nested_jobs_share_the_slot_of_the_outer_job():
+    scheduler = IngestionScheduler(max_concurrent_jobs=1)
+
+    with scheduler.slot("a", "interactive"):
+        with scheduler.slot("a"):
+            pass
+
+    with scheduler.slot("a"):
+        pass
+
+
+def test_charge_rejects_work_over_the_quota():
+    scheduler = IngestionScheduler(
+        max_concurrent_jobs=1, pages_per_hour=10, chunks_per_hour=5
+    )
+
+    with scheduler.slot("a", "interactive"):
+        scheduler.charge("a", chunks=5)
+        # The pages reserved before the chunks are exhausted are given back
+        with pytest.raises(IngestionQuotaExceededError, match="chunks"):
+            scheduler.charge("a", pages=5, chunks=1)
+        scheduler.charge("a", pages=10)
+        with pytest.raises(IngestionQuotaExceededError, match="pages"):
+            scheduler.charge("a", pages=1)
+
+    # The quotas are per tenant
+    with scheduler.slot("b"):
+        scheduler.charge("b", pages=10, chunks=5)
+
+
+def test_charge_waits_for_the_quota_up_to_the_wait_of_the_priority(monkeypatch):
+    scheduler = IngestionScheduler(
+        max_concurrent_jobs=1,
+        pages_per_hour=3600,
+        quota_max_wait_seconds={"interactive": 0.0, "bulk": 5.0},
+    )
+    sleeps = []
+    monkeypatch.setattr(ingestion_scheduler.time, "sleep", sleeps.append)
+
+    with scheduler.slot("a", "bulk"):
+        scheduler.charge("a", pages=3600)
+        # The quota is refilled at one page per second
+        scheduler.charge("a", pages=2)
+    assert sleeps[-1] == pytest.approx(2.0, abs=0.1)
+
+    with scheduler.slot("a", "interactive"):
+        with pytest.raises(IngestionQuotaExceededError):
+            scheduler.charge("a", pages=2)
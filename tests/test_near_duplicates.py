@@ -0,0 +1,95 @@
+import pytest
+from langchain_core.documents import Document
+
+from utils.near_duplicates import ChunkLinkStore, collapse_near_duplicates
+
+BOILERPLATE = (
+    "This agreement is governed by the laws of the State of New York. Any "
+    "dispute arising out of or relating to this agreement shall be resolved "
+    "by binding arbitration in New York City under the rules of the American "
+    "Arbitration Association, and judgment on the award may be entered in any "
+    "court having jurisdiction thereof."
+)
+
+
+def chunk(text: str, source: str) -> Document:
+    return Document(page_content=text, metadata={"source": source})
+
+
+def test_collapses_duplicates_across_files():
+    documents = [
+        chunk(BOILERPLATE, "ns/a.pdf"),
+        chunk("Payment is due within thirty days of the invoice date.", "ns/a.pdf"),
+        chunk(BOILERPLATE, "ns/b.pdf"),
+        chunk(BOILERPLATE.replace("New York City", "Albany"), "ns/c.pdf"),
+    ]
+
+    collapsed, links = collapse_near_duplicates(documents, threshold=0.7)
+
+    assert [doc.page_content for doc in collapsed] == [
+        BOILERPLATE,
+        documents[1].page_content,
+    ]
+    assert collapsed[0].metadata["sources"] == ["ns/a.pdf", "ns/b.pdf", "ns/c.pdf"]
+    assert "sources" not in collapsed[1].metadata
+    assert links == {
+        (source, linked_source)
+        for source in ("ns/a.pdf", "ns/b.pdf", "ns/c.pdf")
+        for linked_source in ("ns/a.pdf", "ns/b.pdf", "ns/c.pdf")
+        if source != linked_source
+    }
+    # The input chunks are not modified
+    assert "sources" not in documents[0].metadata
+
+
+def test_duplicates_within_a_file_are_not_linked():
+    documents = [chunk(BOILERPLATE, "ns/a.pdf"), chunk(BOILERPLATE, "ns/a.pdf")]
+
+    collapsed, links = collapse_near_duplicates(documents, threshold=0.9)
+
+    assert len(collapsed) == 1
+    assert "sources" not in collapsed[0].metadata
+    assert links == set()
+
+
+def test_threshold_keeps_chunks_that_differ_enough():
+    edited = BOILERPLATE.replace("New York City", "Albany")
+    documents = [chunk(BOILERPLATE, "ns/a.pdf"), chunk(edited, "ns/b.pdf")]
+
+    collapsed, links = collapse_near_duplicates(documents, threshold=1.0)
+
+    assert [doc.page_content for doc in collapsed] == [BOILERPLATE, edited]
+    assert links == set()
+
+
+def test_collapse_nothing():
+    assert collapse_near_duplicates([], threshold=0.9) == ([], set())
+
+
+@pytest.fixture
+def link_store(engine):
+    return ChunkLinkStore(engine)
+
+
+def test_linked_files_are_found_through_other_files(link_store):
+    link_store.add("ns", {("a", "b"), ("b", "a"), ("b", "c"), ("c", "b")})
+    link_store.add("other", {("a", "z"), ("z", "a")})
+
+    assert link_store.get_linked("ns", ["a"]) == {"b", "c"}
+    assert link_store.get_linked("ns", ["a", "b"]) == {"c"}
+    assert link_store.get_linked("ns", ["d"]) == set()
+
+
+def test_links_follow_the_files(link_store):
+    link_store.add("ns", {("a", "b"), ("b", "a")})
+    # Adding existing links keeps them once
+    link_store.add("ns", {("a", "b"), ("b", "a"), ("a", "c"), ("c", "a")})
+
+    link_store.move("ns", {"a": "docs/a"})
+    assert link_store.get_linked("ns", ["docs/a"]) == {"b", "c"}
+
+    link_store.replace("ns", ["c"], set())
+    assert link_store.get_linked("ns", ["docs/a"]) == {"b"}
+
+    link_store.delete("ns", ["b"])
+    assert link_store.get_linked("ns", ["docs/a"]) == set()
@@ -0,0 +1,52 @@
+import pytest
+
+from utils.question_rewrite import needs_contextualization
+
+CHAT_HISTORY = [
+    ("human", "What does the annual report say about revenue?"),
+    ("ai", "Revenue grew by 12% in 2024."),
+]
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "What does the annual report say about revenue?",
+        "Summarize the security policy",
+        "Who approved the travel budget for 2024?",
+    ],
+)
+def test_standalone_questions_are_not_rewritten(question):
+    assert not needs_contextualization(question, CHAT_HISTORY)
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        # Pronouns and references to the earlier turns
+        "How did it change compared to 2023?",
+        "What did they say about the margins?",
+        "Can you explain the previous answer in detail?",
+        # Follow-up openings
+        "And what about the costs in Europe?",
+        "What about the costs in Europe?",
+        # Questions of a few words
+        "Why?",
+        "Any examples?",
+        "Costs in Europe",
+    ],
+)
+def test_follow_up_questions_are_rewritten(question):
+    assert needs_contextualization(question, CHAT_HISTORY)
+
+
+@pytest.mark.parametrize("chat_history", [None, []])
+def test_first_question_is_never_rewritten(chat_history):
+    assert not needs_contextualization("How did it change?", chat_history)
+
+
+def test_matches_whole_words_only():
+    # "it" in "profit" and "its" in "limits" are not references
+    assert not needs_contextualization(
+        "What are the profit limits of the subsidiary?", CHAT_HISTORY
+    )
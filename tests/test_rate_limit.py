@@ -0,0 +1,195 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils import rate_limit
+from utils.rate_limit import (
+    AdmissionController,
+    LLMOverloadedError,
+    LLMTimeoutError,
+    TokenBucket,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit, "time", clock)
+    return clock
+
+
+def test_token_bucket_reserves_ahead_of_time(clock):
+    bucket = TokenBucket(rate_per_minute=60, capacity=2)
+
+    assert bucket.reserve(1, max_wait_seconds=0) == 0.0
+    assert bucket.reserve(1, max_wait_seconds=0) == 0.0
+    # The next tokens are added one per second
+    assert bucket.reserve(1, max_wait_seconds=5) == pytest.approx(1.0)
+    assert bucket.reserve(1, max_wait_seconds=5) == pytest.approx(2.0)
+
+
+def test_token_bucket_rejects_waits_past_the_limit(clock):
+    bucket = TokenBucket(rate_per_minute=60, capacity=1)
+    bucket.reserve(1, max_wait_seconds=0)
+
+    assert bucket.reserve(1, max_wait_seconds=0.5) is None
+    # Nothing was reserved by the rejected call
+    clock.now += 1
+    assert bucket.reserve(1, max_wait_seconds=0) == 0.0
+
+
+def test_token_bucket_refills_up_to_its_capacity(clock):
+    bucket = TokenBucket(rate_per_minute=60, capacity=2)
+    bucket.reserve(2, max_wait_seconds=0)
+
+    clock.now += 60
+    bucket.refund(5)
+    assert bucket.reserve(2, max_wait_seconds=0) == 0.0
+    assert bucket.reserve(1, max_wait_seconds=0) is None
+
+
+def test_token_bucket_caps_the_amount_to_its_capacity(clock):
+    bucket = TokenBucket(rate_per_minute=100)
+
+    assert bucket.reserve(1000, max_wait_seconds=0) == 0.0
+
+
+def test_token_bucket_without_rate_is_never_refilled(clock):
+    bucket = TokenBucket(rate_per_minute=0, capacity=1)
+    bucket.reserve(1, max_wait_seconds=0)
+
+    assert bucket.reserve(1, max_wait_seconds=3600) is None
+
+
+def test_admission_sheds_calls_beyond_the_queue():
+    controller = AdmissionController(
+        "test", max_concurrency=1, max_queue=0, timeout_seconds=1
+    )
+
+    with controller.admit(estimated_tokens=10):
+        with pytest.raises(LLMOverloadedError):
+            with controller.admit(estimated_tokens=10):
+                pass
+
+    # The slot is released
+    with controller.admit(estimated_tokens=10):
+        pass
+
+
+def test_admission_hands_the_slot_to_the_next_waiter():
+    controller = AdmissionController(
+        "test", max_concurrency=1, max_queue=1, timeout_seconds=5
+    )
+    admitted = threading.Event()
+
+    def wait_for_slot():
+        with controller.admit(estimated_tokens=10):
+            admitted.set()
+
+    with controller.admit(estimated_tokens=10):
+        thread = threading.Thread(target=wait_for_slot)
+        thread.start()
+        while controller.queue_depth == 0:
+            assert thread.is_alive()
+            time.sleep(0.01)
+        assert not admitted.is_set()
+
+    thread.join(timeout=5)
+    assert admitted.is_set()
+    assert controller._active == 0
+
+
+def test_admission_times_out_waiting_for_a_slot():
+    controller = AdmissionController(
+        "test", max_concurrency=1, max_queue=1, timeout_seconds=0.1
+    )
+
+    with controller.admit(estimated_tokens=10):
+        with pytest.raises(LLMTimeoutError):
+            with controller.admit(estimated_tokens=10):
+                pass
+        assert controller.queue_depth == 0
+
+    assert controller._active == 0
+
+
+def test_admission_sheds_calls_over_the_rate_limits():
+    controller = AdmissionController(
+        "test",
+        max_concurrency=2,
+        max_queue=0,
+        timeout_seconds=1,
+        requests_per_minute=2,
+        tokens_per_minute=100,
+    )
+
+    with controller.admit(estimated_tokens=100):
+        pass
+    # The tokens are exhausted, and the request is given back
+    with pytest.raises(LLMOverloadedError, match="tokens per minute"):
+        with controller.admit(estimated_tokens=50):
+            pass
+    assert controller._active == 0
+
+    controller.refund_tokens(100)
+    with controller.admit(estimated_tokens=50):
+        pass
+    with pytest.raises(LLMOverloadedError, match="requests per minute"):
+        with controller.admit(estimated_tokens=1):
+            pass
+
+
+def test_async_admission_queues_and_releases_slots():
+    controller = AdmissionController(
+        "test", max_concurrency=1, max_queue=1, timeout_seconds=5
+    )
+    order = []
+
+    async def call(name: str):
+        async with controller.aadmit(estimated_tokens=10):
+            order.append(f"{name} start")
+            await asyncio.sleep(0.01)
+            order.append(f"{name} end")
+
+    async def main():
+        await asyncio.gather(call("first"), call("second"))
+
+    asyncio.run(main())
+
+    assert order == ["first start", "first end", "second start", "second end"]
+    assert controller._active == 0
+
+
+def test_async_admission_cancelled_while_waiting():
+    controller = AdmissionController(
+        "test", max_concurrency=1, max_queue=1, timeout_seconds=5
+    )
+
+    async def main():
+        async with controller.aadmit(estimated_tokens=10):
+            waiting = asyncio.ensure_future(_admit(controller))
+            while controller.queue_depth == 0:
+                await asyncio.sleep(0)
+            waiting.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiting
+
+    asyncio.run(main())
+
+    assert controller.queue_depth == 0
+    assert controller._active == 0
+
+
+async def _admit(controller: AdmissionController):
+    async with controller.aadmit(estimated_tokens=10):
+        pass
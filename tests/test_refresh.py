@@ -0,0 +1,135 @@
+import threading
+import time
+
+import pytest
+
+from utils.refresh import RefreshCoordinator
+
+
+def wait_until(predicate, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "Timed out waiting for the condition"
+        time.sleep(0.01)
+
+
+def test_requests_within_debounce_window_share_a_run():
+    coordinator = RefreshCoordinator(debounce_seconds=0.2)
+    calls = []
+
+    first = coordinator.request("ns", lambda: calls.append("first") or "first")
+    second = coordinator.request("ns", lambda: calls.append("second") or "second")
+
+    assert first is second
+    # The latest request wins
+    assert first.result(timeout=5) == "second"
+    assert calls == ["second"]
+
+
+def test_requests_during_a_run_collapse_into_one_follow_up():
+    coordinator = RefreshCoordinator()
+    started, release = threading.Event(), threading.Event()
+    active, max_active, runs = [0], [0], []
+    lock = threading.Lock()
+
+    def refresh(name):
+        def run():
+            with lock:
+                active[0] += 1
+                max_active[0] = max(max_active[0], active[0])
+            started.set()
+            release.wait(timeout=5)
+            with lock:
+                active[0] -= 1
+            runs.append(name)
+            return name
+
+        return run
+
+    running = coordinator.request("ns", refresh("first"))
+    assert started.wait(timeout=5)
+
+    follow_ups = [
+        coordinator.request("ns", refresh(f"follow-up-{i}")) for i in range(3)
+    ]
+    assert follow_ups[0] is not running
+    assert all(future is follow_ups[0] for future in follow_ups)
+    assert coordinator.queue_depth == 2
+
+    release.set()
+    assert running.result(timeout=5) == "first"
+    assert follow_ups[0].result(timeout=5) == "follow-up-2"
+    assert runs == ["first", "follow-up-2"]
+    assert max_active[0] == 1
+
+    wait_until(lambda: coordinator.in_flight("ns") is None)
+    assert coordinator.queue_depth == 0
+
+
+def test_namespaces_run_concurrently():
+    coordinator = RefreshCoordinator()
+    barrier = threading.Barrier(2, timeout=5)
+
+    futures = [coordinator.request(namespace, barrier.wait) for namespace in ("a", "b")]
+
+    # Each run waits for the other, so they must run at the same time
+    for future in futures:
+        future.result(timeout=5)
+
+
+def test_failed_run_sets_the_exception_and_clears_the_namespace():
+    coordinator = RefreshCoordinator()
+
+    def fail():
+        raise RuntimeError("boom")
+
+    future = coordinator.request("ns", fail)
+
+    with pytest.raises(RuntimeError, match="boom"):
+        future.result(timeout=5)
+    wait_until(lambda: coordinator.in_flight("ns") is None)
+
+    assert coordinator.request("ns", lambda: "ok").result(timeout=5) == "ok"
+
+
+def test_run_holds_the_job_slot_but_not_the_namespace_lock():
+    events = []
+
+    class JobSlot:
+        def __init__(self, namespace):
+            self.namespace = namespace
+
+        def __enter__(self):
+            events.append(("enter", self.namespace))
+
+        def __exit__(self, *exc_info):
+            events.append(("exit", self.namespace))
+
+    coordinator = RefreshCoordinator(job_slot=JobSlot)
+    started, release = threading.Event(), threading.Event()
+
+    def refresh():
+        events.append("run")
+        started.set()
+        release.wait(timeout=5)
+
+    future = coordinator.request("ns", refresh)
+    assert started.wait(timeout=5)
+
+    # Other work on the namespace is not blocked for the whole run
+    namespace_lock = coordinator.namespace_lock("ns")
+    acquired = []
+
+    def acquire():
+        acquired.append(namespace_lock.acquire(timeout=1))
+        if acquired[-1]:
+            namespace_lock.release()
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    thread.join()
+    assert acquired == [True]
+
+    release.set()
+    future.result(timeout=5)
+    assert events == [("enter", "ns"), "run", ("exit", "ns")]